@@ -0,0 +1,135 @@
+"""Generation of Starling Capture and proofmode input ZIPs for benchmarks.
+
+Inputs are built like the ones the preprocessor drops in collection input
+folders: a ZIP named after its SHA-256, holding the content named after its
+SHA-256 and the content and recorder metadata. Content is random, so it
+doesn't compress, like JPEGs.
+"""
+
+from hashlib import sha256
+import json
+import os
+import zipfile
+
+BUFFER_SIZE = 1024 * 1024
+
+# Sample Starling Capture metadata
+META_CONTENT_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "tests", "assets", "meta-content.json"
+)
+META_RECORDER = {
+    "recorderMetadata": [
+        {"service": "benchmark", "info": [{"type": "app", "values": {}}]}
+    ]
+}
+
+
+def _write_random(path: str, size: int) -> str:
+    """Writes a file of random bytes.
+
+    Returns:
+        the SHA-256 of the file
+    """
+    hasher = sha256()
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            block = os.urandom(min(BUFFER_SIZE, remaining))
+            hasher.update(block)
+            f.write(block)
+            remaining -= len(block)
+    return hasher.hexdigest()
+
+
+def _sha256(path: str) -> str:
+    hasher = sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(BUFFER_SIZE), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def _named_after_sha256(tmp_path: str) -> str:
+    """Renames a ZIP after its SHA-256.
+
+    Returns:
+        the new path
+    """
+    zip_path = os.path.join(os.path.dirname(tmp_path), f"{_sha256(tmp_path)}.zip")
+    os.rename(tmp_path, zip_path)
+    return zip_path
+
+
+def _write_bundle(directory: str, content_path: str, ext: str, meta_content: dict):
+    content_sha = os.path.splitext(os.path.basename(content_path))[0]
+    tmp_path = os.path.join(directory, f"{content_sha}.part")
+    with zipfile.ZipFile(tmp_path, "w") as zipf:
+        zipf.write(content_path, f"{content_sha}.{ext}")
+        zipf.writestr(f"{content_sha}-meta-content.json", json.dumps(meta_content))
+        zipf.writestr(f"{content_sha}-meta-recorder.json", json.dumps(META_RECORDER))
+    os.remove(content_path)
+    return _named_after_sha256(tmp_path)
+
+
+def make_starling_capture_zip(directory: str, size: int) -> str:
+    """Writes a Starling Capture input: a JPEG and its metadata.
+
+    Args:
+        directory: directory the ZIP is written to
+        size: size of the JPEG in bytes
+
+    Returns:
+        path to the ZIP
+    """
+    content_path = os.path.join(directory, "content.part")
+    content_sha = _write_random(content_path, size)
+    named_path = os.path.join(directory, content_sha)
+    os.rename(content_path, named_path)
+    with open(META_CONTENT_PATH) as f:
+        meta_content = json.load(f)
+    return _write_bundle(directory, named_path, "jpg", meta_content)
+
+
+def make_proofmode_zip(directory: str, size: int, images: int) -> str:
+    """Writes a proofmode input: a ZIP of JPEGs from the Proofmode app, and its metadata.
+
+    Args:
+        directory: directory the ZIP is written to
+        size: total size of the JPEGs in bytes
+        images: number of JPEGs
+
+    Returns:
+        path to the ZIP
+    """
+    with open(META_CONTENT_PATH) as f:
+        meta_content = json.load(f)
+    content_meta = meta_content["contentMetadata"]
+    content_meta["private"] = {"proofmode": {}}
+
+    content_path = os.path.join(directory, "content.part")
+    with zipfile.ZipFile(content_path, "w") as zipf:
+        for i in range(images):
+            image_path = os.path.join(directory, f"image-{i}.part")
+            image_sha = _write_random(image_path, size // images)
+            filename = f"{image_sha}.jpg"
+            zipf.write(image_path, filename)
+            os.remove(image_path)
+            content_meta["private"]["proofmode"][filename] = _proofmode_data(image_sha)
+
+    named_path = os.path.join(directory, _sha256(content_path))
+    os.rename(content_path, named_path)
+    return _write_bundle(directory, named_path, "zip", meta_content)
+
+
+def _proofmode_data(image_sha: str) -> dict:
+    return {
+        "proofmodeJSON": {
+            "Location.Latitude": "43.6532",
+            "Location.Longitude": "-79.3832",
+            "Location.Altitude": "76.0",
+            "Location.Time": "1648562060000",
+        },
+        "pgpSignature": "-----BEGIN PGP SIGNATURE-----",
+        "pgpPublicKey": "-----BEGIN PGP PUBLIC KEY BLOCK-----",
+        "sha256hash": image_sha,
+    }
@@ -0,0 +1,398 @@
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# pylint: disable=import-error,wrong-import-position
+from benchmarks.inputs import make_proofmode_zip, make_starling_capture_zip
+from benchmarks.stand_ins import NUMBERS_CHAINS, ServicesStandIn, write_fake_binaries
+
+HELP = """
+pipeline_benchmark.py
+
+This script benchmarks the actions end to end on generated inputs, against
+local stand-ins for authsign, ISCN, Numbers, ots, ipfs and c2patool.
+
+Starling Capture inputs are made for each size, and run through the archive
+and c2pa-starling-capture actions. Proofmode inputs of the same sizes, with
+the content split across several JPEGs, are run through c2pa-proofmode and
+copy-proofmode. Each action runs in a process of its own, so its peak RSS can
+be measured, and the blockchain registrations queued by the archive action are
+sent once all inputs are archived.
+
+The results file has, for each action, the throughput and latency percentiles
+of whole inputs and of each stage, as recorded by the backend's metrics, and
+the peak RSS of the action's process and of the stand-in binaries it ran.
+Stage throughput is the input MiB processed per second spent in the stage.
+
+Example usage:
+
+$ pipenv run python3 benchmarks/pipeline_benchmark.py --sizes 1M,64M --count 10 --output results.json"""
+
+ORG_ID = "benchmark"
+STARLING_CAPTURE = "starling-capture"
+PROOFMODE = "proofmode"
+# Collection of the inputs each action runs on
+ACTIONS = {
+    "archive": STARLING_CAPTURE,
+    "c2pa-starling-capture": STARLING_CAPTURE,
+    "c2pa-proofmode": PROOFMODE,
+    "copy-proofmode": PROOFMODE,
+}
+PERCENTILES = (50, 90, 99)
+MIB = 1024 * 1024
+SIZE_SUFFIXES = {"K": 1024, "M": MIB, "G": 1024 * MIB}
+
+# Samples of the backend's stage histograms, by "action/stage", in the
+# process running an action
+_samples = {}
+
+
+def parse_size(text: str) -> int:
+    """Parses a size in bytes, with an optional K, M or G suffix."""
+    text = text.strip().upper()
+    if text[-1:] in SIZE_SUFFIXES:
+        return int(float(text[:-1]) * SIZE_SUFFIXES[text[-1]])
+    return int(text)
+
+
+def org_config_json(authsign_url: str) -> dict:
+    """Returns the organization configuration, with every service of the actions active."""
+    c2pa_params = {
+        "c2pa_cert": "benchmark.cert",
+        "c2pa_key": "benchmark.key",
+        "c2pa_algo": "es256",
+    }
+    archive_params = {
+        "encryption": {"algo": "aes-256-cbc", "key": "benchmark.key"},
+        "signers": {
+            "authsign": {
+                "active": True,
+                "server_url": authsign_url,
+                "auth_token": "benchmark",
+            }
+        },
+        "registration_policies": {
+            "opentimestamps": {"active": True},
+            "iscn": {"active": True},
+            "numbersprotocol": {
+                "active": True,
+                "chains": list(NUMBERS_CHAINS),
+                "custody_token_contract_address": None,
+            },
+        },
+    }
+    return {
+        "organizations": [
+            {
+                "id": ORG_ID,
+                "collections": [
+                    {
+                        "id": STARLING_CAPTURE,
+                        "asset_extensions": ["jpg"],
+                        "actions": [
+                            {"name": "archive", "params": archive_params},
+                            {"name": "c2pa-starling-capture", "params": c2pa_params},
+                        ],
+                    },
+                    {
+                        "id": PROOFMODE,
+                        "asset_extensions": ["zip"],
+                        "actions": [
+                            {"name": "c2pa-proofmode", "params": c2pa_params},
+                            {"name": "copy-proofmode", "params": {}},
+                        ],
+                    },
+                ],
+            }
+        ]
+    }
+
+
+def configure(work_dir: str, services: ServicesStandIn, latency: float):
+    """Points the backend's environment at the work directory and the stand-ins."""
+    bin_dir = os.path.join(work_dir, "bin")
+    cert_dir = os.path.join(work_dir, "c2pa")
+    home_dir = os.path.join(work_dir, "home")
+    for path in (bin_dir, cert_dir, os.path.join(home_dir, ".ipfs")):
+        os.makedirs(path, exist_ok=True)
+    for name in ("benchmark.cert", "benchmark.key"):
+        with open(os.path.join(cert_dir, name), "w") as f:
+            f.write("benchmark\n")
+    config_path = os.path.join(work_dir, "config.json")
+    with open(config_path, "w") as f:
+        json.dump(org_config_json(services.url), f)
+
+    os.environ.update(
+        {
+            "C2PA_CERT_STORE": cert_dir,
+            # The IPFS repo is looked for in the home directory
+            "HOME": home_dir,
+            "INTERNAL_ASSET_STORE": os.path.join(work_dir, "internal"),
+            "KEY_STORE": os.path.join(work_dir, "keys"),
+            "ORG_CONFIG_JSON": config_path,
+            "SHARED_FILE_SYSTEM": os.path.join(work_dir, "shared"),
+            **services.env(),
+            **write_fake_binaries(bin_dir, latency),
+        }
+    )
+    os.environ.pop("RUN_ENV", None)
+    for name in ("INTERNAL_ASSET_STORE", "SHARED_FILE_SYSTEM"):
+        os.makedirs(os.environ[name], exist_ok=True)
+
+
+def make_inputs(work_dir: str, sizes: list[int], count: int, images: int) -> dict:
+    """Writes the inputs of each collection.
+
+    Returns:
+        dictionary of collection ID to list of input paths
+    """
+    inputs = {STARLING_CAPTURE: [], PROOFMODE: []}
+    for collection in inputs:
+        directory = os.path.join(work_dir, "inputs", collection)
+        os.makedirs(directory, exist_ok=True)
+        for size in sizes:
+            for _ in range(count):
+                if collection == STARLING_CAPTURE:
+                    path = make_starling_capture_zip(directory, size)
+                else:
+                    path = make_proofmode_zip(directory, size, images)
+                inputs[collection].append(path)
+    return inputs
+
+
+def summary(values: list[float]) -> dict:
+    """Returns the count, mean, percentiles and maximum of some durations."""
+    values = sorted(values)
+    stats = {"count": len(values), "total_seconds": sum(values)}
+    if not values:
+        return stats
+    stats["mean"] = stats["total_seconds"] / len(values)
+    for p in PERCENTILES:
+        # Nearest-rank percentile
+        stats[f"p{p}"] = values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+    stats["max"] = values[-1]
+    return stats
+
+
+def _sampling(observe):
+    def sampling_observe(name, value, **labels):
+        if "stage" in labels:
+            _samples.setdefault(f"{labels['action']}/{labels['stage']}", []).append(
+                value
+            )
+        observe(name, value, **labels)
+
+    return sampling_observe
+
+
+def run_action(action: str, zip_paths: list[str], workers: int) -> dict:
+    """Runs an action on inputs and measures it; meant to run in a process of its own.
+
+    Returns:
+        the action's results
+    """
+    # Imported here, once the environment points at the stand-ins, since the
+    # configuration is read on import
+    from integritybackend import config, metrics, rate_limit
+    from integritybackend.actions import Actions
+    from integritybackend.asset_helper import AssetHelper
+    from integritybackend.registration_outbox import (
+        RegistrationDispatcher,
+        RegistrationOutbox,
+    )
+
+    metrics.observe = _sampling(metrics.observe)
+    # Measure the pipeline, not the upstreams' rate limits
+    unthrottled = {"rate": 1e6, "burst": 1e6}
+    rate_limit.configure({name: unthrottled for name in rate_limit.DEFAULT_LIMITS})
+
+    actions = Actions()
+    collection_id = ACTIONS[action]
+    org_config = config.ORGANIZATION_CONFIG.get(ORG_ID)
+    run = {
+        "archive": lambda path: actions.archive(path, ORG_ID, collection_id),
+        "c2pa-starling-capture": lambda path: actions.c2pa_starling_capture(
+            path, org_config, collection_id
+        ),
+        "c2pa-proofmode": lambda path: actions.c2pa_proofmode(
+            path, org_config, collection_id
+        ),
+        "copy-proofmode": lambda path: actions.copy_proofmode(
+            path, org_config, collection_id
+        ),
+    }[action]
+
+    def run_one(path):
+        start = time.perf_counter()
+        try:
+            # The proofmode actions log errors and return None
+            ok = run(path) is not None
+        except Exception as e:
+            logging.getLogger(__name__).error(f"{action} failed on {path}: {e}")
+            ok = False
+        return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers) as executor:
+        runs = list(executor.map(run_one, zip_paths))
+    wall_seconds = time.perf_counter() - start
+
+    results = {}
+    if action == "archive":
+        outbox = RegistrationOutbox(AssetHelper(ORG_ID).path_for_registration_outbox())
+        dispatcher = RegistrationDispatcher(outbox, org_id=ORG_ID)
+        start = time.perf_counter()
+        while dispatcher.run_once():
+            pass
+        results["registration_seconds"] = time.perf_counter() - start
+        results["registrations"] = outbox.counts()
+
+    input_mib = sum(os.path.getsize(path) for path in zip_paths) / MIB
+    stages = {}
+    for name, values in sorted(_samples.items()):
+        stages[name] = summary(values)
+        if stages[name]["total_seconds"] > 0:
+            stages[name]["per_second"] = len(values) / stages[name]["total_seconds"]
+            stages[name]["mib_per_second"] = input_mib / stages[name]["total_seconds"]
+    return {
+        "collection": collection_id,
+        "inputs": len(zip_paths),
+        "errors": sum(1 for _, ok in runs if not ok),
+        "input_mib": input_mib,
+        "wall_seconds": wall_seconds,
+        "inputs_per_second": len(zip_paths) / wall_seconds,
+        "mib_per_second": input_mib / wall_seconds,
+        "latency": summary([seconds for seconds, _ in runs]),
+        "stages": stages,
+        **results,
+        # Kilobytes on Linux
+        "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "peak_rss_children_kib": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=HELP, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--sizes",
+        default="1M",
+        help="comma-separated content sizes of the inputs, like 512K,16M (default 1M)",
+    )
+    parser.add_argument(
+        "--count", type=int, default=5, help="inputs of each size (default 5)"
+    )
+    parser.add_argument(
+        "--images",
+        type=int,
+        default=4,
+        help="JPEGs in each proofmode input (default 4)",
+    )
+    parser.add_argument(
+        "--actions",
+        default=",".join(ACTIONS),
+        help=f"comma-separated actions to run (default {','.join(ACTIONS)})",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="inputs processed at once by each action (default 1)",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0,
+        help="seconds each stand-in service and binary takes per call (default 0)",
+    )
+    parser.add_argument(
+        "--output", default="benchmark-results.json", help="path of the results file"
+    )
+    parser.add_argument(
+        "--work-dir",
+        help="directory for inputs and outputs; a new temporary one if unset",
+    )
+    parser.add_argument(
+        "--keep", action="store_true", help="keep the work directory afterwards"
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="show the backend's INFO logs"
+    )
+    args = parser.parse_args()
+
+    sizes = [parse_size(size) for size in args.sizes.split(",")]
+    actions = args.actions.split(",")
+    unknown = [action for action in actions if action not in ACTIONS]
+    if unknown:
+        parser.error(f"Unknown actions {unknown}")
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="integrity-benchmark-")
+    services = ServicesStandIn(args.latency)
+    try:
+        configure(work_dir, services, args.latency)
+        # pylint: disable=import-outside-toplevel
+        from integritybackend.asset_helper import AssetHelper
+
+        if not args.verbose:
+            logging.getLogger("integritybackend.log_helper").setLevel(logging.WARNING)
+        AssetHelper(ORG_ID).init_dirs()
+
+        print(f"Generating inputs in {work_dir}")
+        inputs = make_inputs(work_dir, sizes, args.count, args.images)
+
+        results = {
+            "started": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "parameters": {
+                "sizes": sizes,
+                "count": args.count,
+                "images": args.images,
+                "workers": args.workers,
+                "latency": args.latency,
+            },
+            "actions": {},
+        }
+        for action in actions:
+            # A fresh process per action, so peak RSS is the action's own
+            with ProcessPoolExecutor(
+                1, mp_context=multiprocessing.get_context("fork")
+            ) as executor:
+                result = executor.submit(
+                    run_action, action, inputs[ACTIONS[action]], args.workers
+                ).result()
+            results["actions"][action] = result
+            print(
+                f"{action}: {result['inputs']} inputs, {result['errors']} errors, "
+                f"{result['inputs_per_second']:.2f} inputs/s, {result['mib_per_second']:.1f} MiB/s, "
+                f"p50 {result['latency'].get('p50', 0):.3f}s, p99 {result['latency'].get('p99', 0):.3f}s, "
+                f"peak RSS {result['peak_rss_kib'] / 1024:.0f} MiB"
+            )
+
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"Results written to {args.output}")
+    finally:
+        services.close()
+        if not args.keep and not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Local stand-ins for the external services and binaries the actions use.
+
+The HTTP services answer like authsign, the ISCN server and the Numbers
+chains, and the fake `ots`, `ipfs` and `c2patool` executables read and write
+what the real ones would. All of them can wait a fixed latency per request, to
+stand in for the time the real services take.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hashlib
+import json
+import os
+import stat
+import sys
+import threading
+import time
+
+# Paths of the Numbers chains on the stand-in server
+NUMBERS_CHAINS = ("numbers", "avalanche", "near")
+
+
+class ServicesStandIn:
+    """A local HTTP server standing in for authsign, ISCN and the Numbers chains."""
+
+    def __init__(self, latency: float = 0):
+        """
+        Args:
+            latency: seconds each request waits before it is answered
+        """
+        self.latency = latency
+        self.requests = 0
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stand_in.requests += 1
+                time.sleep(stand_in.latency)
+                if self.path == "/sign":
+                    response = _authsign_proof(body)
+                elif self.path == "/sign/batch":
+                    response = [_authsign_proof(item) for item in body]
+                elif self.path == "/iscn/new/":
+                    digest = _digest(body)
+                    response = {"txHash": digest, "iscnId": f"iscn://likecoin/{digest}"}
+                elif self.path.lstrip("/") in NUMBERS_CHAINS:
+                    response = {"txHash": _digest(body), "assetCid": body["assetCid"]}
+                else:
+                    self.send_error(404)
+                    return
+                data = json.dumps(response).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def env(self) -> dict:
+        """Returns the environment variables that point the backend at the stand-ins."""
+        return {
+            "ISCN_SERVER": self.url,
+            "NUMBERS_API_KEY": "benchmark",
+            "NUMBERS_NUMBERS_SERVER": f"{self.url}/numbers",
+            "NUMBERS_AVALANCHE_SERVER": f"{self.url}/avalanche",
+            "NUMBERS_NEAR_SERVER": f"{self.url}/near",
+        }
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _digest(body) -> str:
+    return hashlib.sha256(json.dumps(body, sort_keys=True).encode()).hexdigest()
+
+
+def _authsign_proof(item: dict) -> dict:
+    return {
+        "hash": item["hash"],
+        "created": item["created"],
+        "public_key": "benchmark",
+        "signature": hashlib.sha256(item["hash"].encode()).hexdigest(),
+    }
+
+
+FAKE_OTS = """
+import hashlib, sys, time
+
+# ots stamp: the file to stamp on stdin, the proof on stdout
+time.sleep(LATENCY)
+digest = hashlib.sha256()
+for block in iter(lambda: sys.stdin.buffer.read(1024 * 1024), b""):
+    digest.update(block)
+sys.stdout.buffer.write(b"\\x00OpenTimestamps\\x00\\x00Proof\\x00" + digest.digest())
+"""
+
+FAKE_IPFS = """
+import hashlib, sys, time
+
+# ipfs add --only-hash --cid-version=1 -Q path
+time.sleep(LATENCY)
+digest = hashlib.sha256()
+with open(sys.argv[-1], "rb") as f:
+    for block in iter(lambda: f.read(1024 * 1024), b""):
+        digest.update(block)
+print("bafk" + digest.hexdigest()[:52])
+"""
+
+FAKE_C2PATOOL = """
+import json, shutil, sys, time
+
+time.sleep(LATENCY)
+args = sys.argv[1:]
+if "--output" in args:
+    # Inject: the claim is appended to a copy of the asset
+    claims = args[args.index("--config") + 1]
+    output = args[args.index("--output") + 1]
+    if output != args[0]:
+        shutil.copyfile(args[0], output)
+    with open(output, "ab") as f:
+        f.write(claims.encode())
+else:
+    # Dump: the manifest of the asset on stdout
+    print(json.dumps({"active_manifest": "benchmark", "manifests": {}}))
+"""
+
+
+def write_fake_binaries(directory: str, latency: float = 0) -> dict:
+    """Writes fake `ots`, `ipfs` and `c2patool` executables.
+
+    Args:
+        directory: directory the executables are written to
+        latency: seconds each run waits before doing its work
+
+    Returns:
+        the environment variables that point the backend at them
+    """
+    paths = {}
+    for name, source in (
+        ("ots", FAKE_OTS),
+        ("ipfs", FAKE_IPFS),
+        ("c2patool", FAKE_C2PATOOL),
+    ):
+        path = os.path.join(directory, name)
+        with open(path, "w") as f:
+            f.write(f"#!{sys.executable}\n")
+            f.write(source.replace("LATENCY", repr(latency)))
+        os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+        paths[name] = path
+    return {
+        "OTS_CLIENT_PATH": paths["ots"],
+        "IPFS_CLIENT_PATH": paths["ipfs"],
+        "C2PATOOL_PATH": paths["c2patool"],
+    }
@@ -0,0 +1,39 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# pylint: disable=import-error,wrong-import-position
+from integritybackend import filecoin
+
+HELP = """
+deal_status.py
+
+This script reports the Filecoin deal status of the encrypted archives listed
+in a directory of receipts (hash list JSONs).
+
+Results are cached in the receipt directory, so only CIDs without a deal are
+checked again on the next run.
+
+Example usage:
+
+$ pipenv run python3 contrib/deal_status.py /path/to/receipts"""
+
+
+def main():
+    if len(sys.argv) != 2:
+        print("Must provide receipt directory.")
+        print(HELP)
+        sys.exit(1)
+
+    tracker = filecoin.DealStatusTracker.for_hash_list_dir(sys.argv[1])
+    statuses = tracker.check_hash_lists(sys.argv[1])
+    for cid, piece_cid in sorted(statuses.items()):
+        print(f"{cid}\t{piece_cid or 'pending'}")
+
+    found = sum(1 for piece_cid in statuses.values() if piece_cid)
+    print(f"\n{found} of {len(statuses)} archives have a Filecoin deal.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import sys
+import os
+
+# Disable org config loading
+os.environ["RUN_ENV"] = "test"
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# pylint: disable=import-error,wrong-import-position
+from integritybackend import filecoin_pack
+
+HELP = """
+filecoin_pack.py
+
+This script packs the encrypted archives of a collection into CARs and uploads
+them to web3.storage, recording each archive's CID and pack in its receipt.
+
+Archives that are already packed are skipped, and an interrupted run is resumed
+on the next run. The pack size is in MiB and defaults to 4096.
+
+Example usage:
+
+$ pipenv run python3 contrib/filecoin_pack.py org_id collection_id [pack_size]"""
+
+
+def main():
+    if len(sys.argv) not in (3, 4):
+        print("Must provide organization and collection.")
+        print(HELP)
+        sys.exit(1)
+
+    target_size = filecoin_pack.DEFAULT_PACK_SIZE
+    if len(sys.argv) == 4:
+        target_size = int(sys.argv[3]) * 1024 * 1024
+
+    manifests = filecoin_pack.ArchivePacker(sys.argv[1], sys.argv[2], target_size).run()
+    for manifest in manifests:
+        print(
+            f"Pack {manifest['id']}: {len(manifest['archives'])} archives, {manifest['packCid']}"
+        )
+    print(f"\n{len(manifests)} packs uploaded.")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,6 @@ import os
 import shutil
 from zipfile import ZipFile
 import json
-import time
 from typing import Optional
 
 # Disable org config loading
@@ -14,6 +13,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")
 # pylint: disable=import-error,wrong-import-position
 from integritybackend import iscn
 from integritybackend import numbers
+from integritybackend import rate_limit
 
 HELP = """
 reregister.py
@@ -32,11 +32,23 @@ Commands:
 
 Example usage:
 
-$ pipenv run python3 contrib/reregister.py fixIscn org_id collection_id /path/to/zips /path/to/receipts"""
+$ pipenv run python3 contrib/reregister.py fixIscn org_id collection_id /path/to/zips /path/to/receipts
 
-# Seconds
-ISCN_DELAY = 2
-NUMBERS_DELAY = 5  # Have to wait for previous block to be made
+Registrations are throttled with the same rate limits as the server. If the
+ORG_CONFIG_JSON env var is set, the organization's "rate_limits" are used.
+"""
+
+
+def configure_rate_limits(org_id: str):
+    # Org config loading is disabled above, so read the limits from the file directly
+    config_path = os.environ.get("ORG_CONFIG_JSON")
+    limits = None
+    if config_path:
+        with open(config_path, "r") as f:
+            for org in json.load(f).get("organizations", []):
+                if org.get("id") == org_id:
+                    limits = org.get("rate_limits")
+    rate_limit.configure(limits)
 
 
 def assets(path: str):
@@ -255,7 +267,6 @@ def fix_process(
     reg_name: str,
     json_name: str,
     json_subname: Optional[str],
-    delay: int,
     asset_dir: str,
     receipt_dir: str,
     org_id: str,
@@ -316,9 +327,6 @@ def fix_process(
 
         i += 1
 
-        # Throttling
-        time.sleep(delay)
-
 
 def main():
     if len(sys.argv) != 6:
@@ -347,6 +355,8 @@ def main():
         print("Not implemented.")
         sys.exit(0)
 
+    configure_rate_limits(org_id)
+
     if cmd == "fixIscn":
         if "ISCN_SERVER" not in os.environ:
             print("ISCN_SERVER env var not defined, aborting.")
@@ -358,7 +368,6 @@ def main():
             "ISCN",
             "iscn",
             None,
-            ISCN_DELAY,
             asset_dir,
             receipt_dir,
             org_id,
@@ -374,7 +383,6 @@ def main():
             "Avalanche",
             "numbersProtocol",
             "avalanche",
-            NUMBERS_DELAY,
             asset_dir,
             receipt_dir,
             org_id,
@@ -389,7 +397,6 @@ def main():
             "Numbers",
             "numbersProtocol",
             "numbers",
-            NUMBERS_DELAY,
             asset_dir,
             receipt_dir,
             org_id,
@@ -404,7 +411,6 @@ def main():
             "Near",
             "numbersProtocol",
             "near",
-            NUMBERS_DELAY,
             asset_dir,
             receipt_dir,
             org_id,
@@ -1,14 +1,17 @@
-from .asset_helper import AssetHelper
 from .claim import Claim
+from .asset_helper import AssetHelper
 from .c2patool import C2patool
 from .file_util import FileUtil
 from .filecoin import Filecoin
-from .iscn import Iscn
+from .ingest import Ingest
+from .job_context import JobContext
 from .log_helper import LogHelper
-from .numbers import Numbers
-from . import config, zip_util, crypto_util
+from .pipeline import Journal, Pipeline, Stage
+from .registration_outbox import RegistrationOutbox
+from . import config, metrics, registration_outbox, zip_util, crypto_util
 
 from datetime import datetime, timezone
+import asyncio
 import json
 import os
 import shutil
@@ -16,15 +19,32 @@ import time
 from zipfile import ZipFile
 from typing import Tuple, Optional
 
-import requests
-
-
 _claim = Claim()
 _c2patool = C2patool()
 _filecoin = Filecoin()
 _logger = LogHelper.getLogger()
 _file_util = FileUtil()
 
+# Hashes in a hash list, in the order _write_hash_list takes them
+FINGERPRINTS = (
+    "content_sha",
+    "content_md5",
+    "content_cid",
+    "zip_sha",
+    "zip_md5",
+    "zip_cid",
+    "enc_zip_sha",
+    "enc_zip_md5",
+    "enc_zip_cid",
+)
+# Files timestamped by the archive action: (key, pipeline value of the file
+# path, name for logging), in the order their proofs are appended
+TIMESTAMPED = (
+    ("content", "extracted_content", "content"),
+    ("meta_content", "extracted_meta_content", "content metadata"),
+    ("meta_recorder", "extracted_meta_recorder", "recorder metadata"),
+)
+
 
 # pylint: disable=logging-fstring-interpolation
 class Actions:
@@ -35,27 +55,22 @@ class Actions:
     1. sha256(asset).ext: the asset file with `ext` matching one of the collection's `asset_extensions`
     2. sha256(asset)-meta-content.json: the metadata associated with the asset file
     3. sha256(asset)-meta-recorder.json: the metadata associated with the recorder of the asset
-    """
 
-    def __init__(self) -> None:
-        self.zip_dir = None
-        self.tmp_dir = None
+    Actions are stateless: everything about a job lives in its JobContext, so a
+    single instance can run any number of jobs from many threads at once.
+    """
 
     @staticmethod
-    def _verify_zip(zip_path: str, asset_exts: list[str]) -> Tuple[str, str]:
+    def _verify_bundle(ingest: Ingest, asset_exts: list[str]) -> Tuple[str, str]:
         """
-        Verify the provided ZIP is in the expected preprocessor format.
+        Verify the ingested ZIP is in the expected preprocessor format.
         The content filename and content SHA-256 hash are returned for further usage.
         An Exception is raised with information if the ZIP is not valid.
         """
-
-        # Verify ZIP name
-        input_zip_sha = os.path.splitext(os.path.basename(zip_path))[0]
-        if input_zip_sha != _file_util.digest_sha256(zip_path):
-            raise Exception(f"SHA-256 of ZIP does not match file name: {zip_path}")
+        zip_path = ingest.zip_path
 
         # Verify ZIP contents are valid and expected
-        zip_listing = zip_util.listing(zip_path)
+        zip_listing = ingest.listing
         if len(zip_listing) != 3:
             # ZIP must contain three files: content, meta-content , meta-recorder
             raise Exception(
@@ -84,11 +99,11 @@ class Actions:
             )
 
         # Verify content SHA from name
-        content_sha = zip_util.hash_file(zip_path, content_filename)
+        content_sha = ingest.hashes[content_filename]
         if content_sha != content_sha_unverified:
             raise Exception(f"SHA-256 of content does not match file name: {zip_path}")
 
-        _logger.info(f"Content verified for archival: {zip_path}")
+        _logger.info(f"Content verified: {zip_path}")
         return content_filename, content_sha
 
     @staticmethod
@@ -139,7 +154,9 @@ class Actions:
             f.write(json.dumps(hash_list))
             f.write("\n")
 
-    def archive(self, zip_path: str, org_id: str, collection_id: str):
+    def archive(
+        self, zip_path: str, org_id: str, collection_id: str, ingest: Ingest = None
+    ):
         """Archive asset.
 
         Args:
@@ -147,24 +164,66 @@ class Actions:
             org_id: ID for this organization
             collection_id: string with the unique collection identifier this
                 asset is in
+            ingest: the ZIP as already ingested for the collection, if any
 
-        Exceptions are not raised, only logged.
+        Returns:
+            the job's results: paths of the archive, encrypted archive and hash list
+
+        Raises:
+            Exception if errors are encountered during processing
         """
 
-        try:
-            self._archive(zip_path, org_id, collection_id)
-        finally:
-            if self.zip_dir and self.tmp_dir:
-                self._purge_from_tmp(self.zip_dir, self.tmp_dir)
+        with JobContext("archive", zip_path, org_id, collection_id, ingest) as ctx:
+            journal, pipeline, values = self._archive_pipeline(ctx)
+            values = pipeline.run(values, journal)
+            self._archive_done(ctx, journal, pipeline, values)
+            return ctx.results
+
+    async def archive_async(
+        self,
+        zip_path: str,
+        org_id: str,
+        collection_id: str,
+        ingest: Ingest,
+        executor=None,
+    ):
+        """Archive asset, on the running event loop.
+
+        Same as `archive`, but the OpenTimestamps and IPFS clients run as
+        asyncio subprocesses, so waiting on them doesn't hold a thread. The
+        other stages, which hash, sign and encrypt, run in the executor.
+
+        Args:
+            zip_path: path to asset zip (will be copied, not altered)
+            org_id: ID for this organization
+            collection_id: string with the unique collection identifier this
+                asset is in
+            ingest: the ZIP as already ingested for the collection
+            executor: executor for the stages that aren't coroutines; the
+                loop's default executor if None
 
-    def _archive(self, zip_path: str, org_id: str, collection_id: str):
-        action_name = "archive"
+        Returns:
+            the job's results: paths of the archive, encrypted archive and hash list
+        """
 
-        asset_helper = AssetHelper(org_id)
+        with JobContext("archive", zip_path, org_id, collection_id, ingest) as ctx:
+            journal, pipeline, values = self._archive_pipeline(ctx, async_io=True)
+            values = await pipeline.run_async(values, journal, executor)
+            self._archive_done(ctx, journal, pipeline, values)
+            return ctx.results
+
+    def _archive_pipeline(self, ctx: JobContext, async_io: bool = False):
+        """Makes the pipeline of the archive action.
+
+        Returns:
+            the job's journal, the pipeline, and the initial values to run it with
+        """
+        org_id = ctx.org_id
+        collection_id = ctx.collection_id
 
         collection = config.ORGANIZATION_CONFIG.get_collection(org_id, collection_id)
         action = config.ORGANIZATION_CONFIG.get_action(
-            org_id, collection_id, action_name
+            org_id, collection_id, ctx.action_name
         )
         action_params = action.get("params")
         if action_params["encryption"]["algo"] != "aes-256-cbc":
@@ -172,223 +231,469 @@ class Actions:
                 f"Encryption algo {action_params['encryption']['algo']} not implemented"
             )
 
-        input_zip_sha = os.path.splitext(os.path.basename(zip_path))[0]
-
-        content_filename, content_sha = self._verify_zip(
-            zip_path, collection["asset_extensions"]
+        # Completed stages are journaled, so a job that crashed part way
+        # resumes instead of timestamping and registering again
+        journal = Journal(
+            ctx.asset_helper.path_for_journal(
+                collection_id, ctx.action_name, ctx.input_sha
+            )
         )
+        proof_dir = journal.work_path("proofs")
+        _file_util.create_dir(proof_dir)
+        pipeline = Pipeline(
+            f"archive-{ctx.input_sha[:8]}",
+            self._archive_stages(ctx, journal, collection, action_params, async_io),
+        )
+        return journal, pipeline, {"proof_dir": proof_dir}
 
-        # Copy ZIP
-        archive_dir = asset_helper.path_for_action(collection_id, action_name)
-        tmp_zip = shutil.copy2(zip_path, archive_dir)
-
-        tmp_dir = asset_helper.path_for_action_tmp(collection_id, action_name)
-        zip_dir = os.path.join(tmp_dir, content_sha)
-        self.tmp_dir = tmp_dir
-        self.zip_dir = zip_dir
+    @staticmethod
+    def _archive_done(
+        ctx: JobContext, journal: Journal, pipeline: Pipeline, values: dict
+    ):
+        journal.discard()
+
+        ctx.results["archive"] = values["archive_zip"]
+        ctx.results["archiveEncrypted"] = values["encrypted_zip"]
+        ctx.results["hashList"] = values["hash_list_path"]
+        ctx.results["timings"] = pipeline.timings
+        for stage, seconds in pipeline.timings.items():
+            metrics.observe(
+                metrics.STAGE_SECONDS, seconds, action=ctx.action_name, stage=stage
+            )
 
-        # Extract content file
-        extracted_content = os.path.join(zip_dir, content_filename)
-        _file_util.create_dir(zip_dir)
-        zip_util.extract_file(tmp_zip, content_filename, extracted_content)
+    def _archive_stages(
+        self,
+        ctx: JobContext,
+        journal: Journal,
+        collection: dict,
+        action_params: dict,
+        async_io: bool = False,
+    ) -> list[Stage]:
+        """Returns the stages of the archive action.
+
+        The archive ZIP is the input ZIP with proofs appended, so signing and
+        timestamping come before hashing and encrypting it. Proofs are appended
+        in a fixed order, so the archive doesn't depend on which proof is ready
+        first.
+
+        Files made by the stages are kept in the journal's work directory, and
+        every stage can safely run again after a crash part way through it.
+
+        With `async_io`, the stages that wait on subprocesses are coroutines,
+        for `Pipeline.run_async`.
+        """
+        ingest = ctx.ingest
+        stages = []
 
+        def verify():
+            content_filename, content_sha = self._verify_bundle(
+                ingest, collection["asset_extensions"]
+            )
+            # Content and metadata files, already extracted at ingest
+            return {
+                "content_sha": content_sha,
+                "extracted_content": ingest.path(content_filename),
+                "extracted_meta_content": ingest.path(
+                    f"{content_sha}-meta-content.json"
+                ),
+                "extracted_meta_recorder": ingest.path(
+                    f"{content_sha}-meta-recorder.json"
+                ),
+            }
+
+        stages.append(
+            Stage(
+                "verify",
+                verify,
+                outputs=[
+                    "content_sha",
+                    "extracted_content",
+                    "extracted_meta_content",
+                    "extracted_meta_recorder",
+                ],
+                # Paths into the ingest dir, which is made again on restart
+                checkpoint=False,
+            )
+        )
         # Generate content hashes
-        content_cid = _file_util.digest_cidv1(extracted_content)
-        content_md5 = _file_util.digest_md5(extracted_content)
+        stages += self._digest_stages("content", "extracted_content", async_io)
 
-        # Extract metadata files
-        meta_content_filename = f"{content_sha}-meta-content.json"
-        extracted_meta_content = os.path.join(zip_dir, meta_content_filename)
-        zip_util.extract_file(tmp_zip, meta_content_filename, extracted_meta_content)
-        meta_recorder_filename = f"{content_sha}-meta-recorder.json"
-        extracted_meta_recorder = os.path.join(zip_dir, meta_recorder_filename)
-        zip_util.extract_file(tmp_zip, meta_recorder_filename, extracted_meta_recorder)
-
-        # Sign with authsign
-        if action_params["signers"]["authsign"]["active"]:
-            authsign_server_url = action_params["signers"]["authsign"]["server_url"]
-            authsign_auth_token = action_params["signers"]["authsign"]["auth_token"]
-            _logger.info(f"Content signing by authsign server: {authsign_server_url}")
-
-            def authsign(data, sha, name):
-                path = self._authsign_data(
-                    tmp_zip, data, sha, authsign_server_url, authsign_auth_token
-                )
-                if path is None:
-                    _logger.error(f"{name} signage failed")
-                else:
-                    _logger.info(f"{name} signed by authsign server {path}")
-
-            # Sign content hash, content metadata hash, etc
-            authsign(extracted_content, content_sha, "content")
-            authsign(
-                extracted_meta_content,
-                _file_util.digest_sha256(extracted_meta_content),
-                "content metadata",
+        # Sign content hash, content metadata hash, etc. with authsign
+        proof_inputs = []
+        authsign = action_params["signers"]["authsign"]
+        if authsign["active"]:
+            _logger.info(
+                f"Content signing by authsign server: {authsign['server_url']}"
             )
-            authsign(
+
+            def sign(
+                proof_dir,
+                content_sha,
+                extracted_content,
+                extracted_meta_content,
                 extracted_meta_recorder,
-                _file_util.digest_sha256(extracted_meta_recorder),
-                "recorder metadata",
+            ):
+                items = [
+                    (extracted_content, content_sha, "content"),
+                    (
+                        extracted_meta_content,
+                        ingest.hashes[os.path.basename(extracted_meta_content)],
+                        "content metadata",
+                    ),
+                    (
+                        extracted_meta_recorder,
+                        ingest.hashes[os.path.basename(extracted_meta_recorder)],
+                        "recorder metadata",
+                    ),
+                ]
+                proofs = self._authsign_sign(
+                    items, authsign["server_url"], authsign["auth_token"], proof_dir
+                )
+                return {"authsign_proofs": proofs}
+
+            stages.append(
+                Stage(
+                    "authsign",
+                    sign,
+                    inputs=[
+                        "proof_dir",
+                        "content_sha",
+                        "extracted_content",
+                        "extracted_meta_content",
+                        "extracted_meta_recorder",
+                    ],
+                    outputs=["authsign_proofs"],
+                )
             )
+            proof_inputs.append("authsign_proofs")
         else:
             _logger.info("Content signage with authsign skipped")
 
-        # Register on OpenTimestamps and add that file to zip
+        # Register content, content metadata, etc. on OpenTimestamps
         if action_params["registration_policies"]["opentimestamps"]["active"]:
             _logger.info(
                 "Secure timestamping of content and metadata with OpenTimestamps"
             )
-
-            def ots(data, name):
-                path = self._opentimestamps_data(tmp_zip, data)
-                if path is None:
-                    _logger.error(f"{name} timestamp registration failed")
-                else:
-                    _logger.info(
-                        f"{name} securely timestamped with OpenTimestamps: {path}"
-                    )
-
-            # Content timestamp registration, content metadata timestamp reg., etc.
-            ots(extracted_content, "content")
-            ots(extracted_meta_content, "content metadata")
-            ots(extracted_meta_recorder, "recorder metadata")
+            for key, path_value, _ in TIMESTAMPED:
+                stages.append(self._timestamp_stage(key, path_value, async_io))
+                proof_inputs.append(f"ots_{key}")
         else:
             _logger.info("Timestamp registration with OpenTimestamps skipped")
 
-        # Get archive ZIP hashes
-        zip_sha = _file_util.digest_sha256(tmp_zip)
-        zip_md5 = _file_util.digest_md5(tmp_zip)
-        zip_cid = _file_util.digest_cidv1(tmp_zip)
-
-        # Rename archive zip to SHA-256 of itself
-        archive_zip = os.path.join(archive_dir, zip_sha + ".zip")
-        os.rename(tmp_zip, archive_zip)
-        _logger.info(f"Archive zip generated: {archive_zip}")
+        # Copy ZIP and add proofs to it, on a partial file so that a crash
+        # can't leave proofs appended twice
+        def assemble(**proofs):
+            assembled_zip = journal.work_path(f"{ctx.input_sha}.zip")
+            partial_zip = shutil.copy2(ctx.zip_path, f"{assembled_zip}.part")
+            self._append_proofs(partial_zip, proofs)
+            os.replace(partial_zip, assembled_zip)
+            return {"assembled_zip": assembled_zip}
+
+        stages.append(
+            Stage(
+                "assemble_archive",
+                assemble,
+                inputs=proof_inputs,
+                outputs=["assembled_zip"],
+            )
+        )
 
-        # Encrypt archive ZIP
+        # Get archive ZIP hashes, and encrypt it at the same time
+        stages += self._digest_stages("zip", "assembled_zip", async_io)
         aes_key = crypto_util.get_key(action_params["encryption"]["key"])
-        tmp_encrypted_zip = os.path.join(archive_dir, zip_sha + ".encrypted")
-        _file_util.encrypt(aes_key, archive_zip, tmp_encrypted_zip)
 
-        # Get encrypted ZIP hashes
-        enc_zip_sha = _file_util.digest_sha256(tmp_encrypted_zip)
-        enc_zip_md5 = _file_util.digest_md5(tmp_encrypted_zip)
-        enc_zip_cid = _file_util.digest_cidv1(tmp_encrypted_zip)
+        def encrypt(assembled_zip):
+            tmp_encrypted_zip = journal.work_path("archive.encrypted")
+            _file_util.encrypt(aes_key, assembled_zip, tmp_encrypted_zip)
+            return {"tmp_encrypted_zip": tmp_encrypted_zip}
+
+        stages.append(
+            Stage(
+                "encrypt",
+                encrypt,
+                inputs=["assembled_zip"],
+                outputs=["tmp_encrypted_zip"],
+            )
+        )
 
-        # Rename encrypted ZIP to SHA-256 of itself
-        encrypted_zip = os.path.join(archive_dir, enc_zip_sha + ".encrypted")
-        os.rename(tmp_encrypted_zip, encrypted_zip)
-        _logger.info(f"Encrypted zip generated: {encrypted_zip}")
+        # Rename archive ZIP to SHA-256 of itself, once nothing reads it anymore
+        def store_archive(assembled_zip, zip_sha, **_):
+            archive_zip = os.path.join(ctx.action_dir, zip_sha + ".zip")
+            # Already renamed if resuming after a crash
+            if os.path.exists(assembled_zip) or not os.path.exists(archive_zip):
+                os.rename(assembled_zip, archive_zip)
+            _logger.info(f"Archive zip generated: {archive_zip}")
+            return {"archive_zip": archive_zip}
+
+        stages.append(
+            Stage(
+                "store_archive",
+                store_archive,
+                inputs=[
+                    "assembled_zip",
+                    "zip_sha",
+                    "zip_md5",
+                    "zip_cid",
+                    "tmp_encrypted_zip",
+                ],
+                outputs=["archive_zip"],
+            )
+        )
 
-        with open(extracted_meta_content) as meta_content_f:
-            meta_content = json.load(meta_content_f)["contentMetadata"]
+        # Get encrypted ZIP hashes, then rename it to SHA-256 of itself
+        stages += self._digest_stages("enc_zip", "tmp_encrypted_zip", async_io)
+
+        def store_encrypted(tmp_encrypted_zip, enc_zip_sha, **_):
+            encrypted_zip = os.path.join(ctx.action_dir, enc_zip_sha + ".encrypted")
+            # Already renamed if resuming after a crash
+            if os.path.exists(tmp_encrypted_zip) or not os.path.exists(encrypted_zip):
+                os.rename(tmp_encrypted_zip, encrypted_zip)
+            _logger.info(f"Encrypted zip generated: {encrypted_zip}")
+            return {"encrypted_zip": encrypted_zip}
+
+        stages.append(
+            Stage(
+                "store_encrypted",
+                store_encrypted,
+                inputs=[
+                    "tmp_encrypted_zip",
+                    "enc_zip_sha",
+                    "enc_zip_md5",
+                    "enc_zip_cid",
+                ],
+                outputs=["encrypted_zip"],
+            )
+        )
 
-        # Register encrypted ZIP on ISCN
-        iscn_receipt = None
-        if action_params["registration_policies"]["iscn"]["active"]:
-            try:
-                iscn_receipt = Iscn.register_archive(
-                    enc_zip_sha,
-                    enc_zip_md5,
-                    enc_zip_cid,
-                    content_sha,
-                    content_md5,
-                    content_cid,
-                    zip_sha,
-                    zip_md5,
-                    zip_cid,
-                    meta_content["name"],
-                    meta_content["description"],
-                    meta_content["author"],
-                    [org_id, collection_id],
-                    meta_content["dateCreated"],
-                    json.dumps((meta_content["extras"]), separators=(",", ":")),
+        def load_meta_content(extracted_meta_content):
+            with open(extracted_meta_content) as meta_content_f:
+                return {"meta_content": json.load(meta_content_f)["contentMetadata"]}
+
+        stages.append(
+            Stage(
+                "load_meta_content",
+                load_meta_content,
+                inputs=["extracted_meta_content"],
+                outputs=["meta_content"],
+            )
+        )
+
+        # Generate file that contains all the hashes
+        def write_hash_list(meta_content, **hashes):
+            hash_list_path = os.path.join(ctx.output_dir, f"{ctx.input_sha}.json")
+            self._write_hash_list(
+                hash_list_path,
+                ctx.input_sha,
+                *(hashes[name] for name in FINGERPRINTS),
+                # "sourceId" is a reference field to the original content
+                # Filename, item number/timestamp, public key, whatever works
+                # https://github.com/starlinglab/integrity-backend/issues/116
+                meta_content.get("sourceId"),
+            )
+            return {"hash_list_path": hash_list_path}
+
+        stages.append(
+            Stage(
+                "write_hash_list",
+                write_hash_list,
+                inputs=["meta_content", "archive_zip", "encrypted_zip"]
+                + list(FINGERPRINTS),
+                outputs=["hash_list_path"],
+            )
+        )
+
+        def register(hash_list_path, meta_content, **fingerprints):
+            self._queue_registrations(
+                ctx, action_params, hash_list_path, meta_content, fingerprints
+            )
+            return {}
+
+        stages.append(
+            Stage(
+                "queue_registrations",
+                register,
+                inputs=["hash_list_path", "meta_content"] + list(FINGERPRINTS),
+            )
+        )
+        return stages
+
+    def _timestamp_stage(
+        self, key: str, path_value: str, async_io: bool = False
+    ) -> Stage:
+        def stamp(proof_dir, **paths):
+            return {f"ots_{key}": self._opentimestamp(paths[path_value], proof_dir)}
+
+        async def stamp_async(proof_dir, **paths):
+            return {
+                f"ots_{key}": await self._opentimestamp_async(
+                    paths[path_value], proof_dir
                 )
-            except requests.exceptions.RequestException as e:
-                _logger.error(f"Content registration on ISCN failed: {e}")
-            else:
-                if iscn_receipt is not None:
-                    _logger.info(f"Content registered on ISCN: {iscn_receipt}")
-                else:
-                    _logger.error("Content registration on ISCN failed")
+            }
+
+        return Stage(
+            f"timestamp_{key}",
+            stamp_async if async_io else stamp,
+            inputs=["proof_dir", path_value],
+            outputs=[f"ots_{key}"],
+        )
+
+    @staticmethod
+    def _digest_stages(
+        prefix: str, path_value: str, async_io: bool = False
+    ) -> list[Stage]:
+        """Returns stages that compute the SHA-256, MD5 and CID of a file in parallel.
+
+        The content SHA-256 is verified at ingest, so no stage is made for it.
+        """
+
+        # Looked up when called, so they can be patched in tests
+        async def cid_async(path):
+            return await _file_util.digest_cidv1_async(path)
+
+        digests = {
+            "md5": _file_util.digest_md5,
+            "cid": (
+                cid_async if async_io else lambda path: _file_util.digest_cidv1(path)
+            ),
+        }
+        if prefix != "content":
+            digests = {"sha": _file_util.digest_sha256, **digests}
+
+        def digest_stage(kind, digest):
+            name = f"{prefix}_{kind}"
+
+            async def run_async(**paths):
+                return {name: await digest(paths[path_value])}
+
+            return Stage(
+                name,
+                (
+                    run_async
+                    if asyncio.iscoroutinefunction(digest)
+                    else lambda **paths: {name: digest(paths[path_value])}
+                ),
+                inputs=[path_value],
+                outputs=[name],
+            )
+
+        return [digest_stage(kind, digest) for kind, digest in digests.items()]
+
+    def _queue_registrations(
+        self,
+        ctx: JobContext,
+        action_params: dict,
+        hash_list_path: str,
+        meta_content: dict,
+        fingerprints: dict,
+    ):
+        """Queues blockchain registrations of the encrypted ZIP.
+
+        Receipts are added to the hash list by the registration dispatcher.
+        Registrations are keyed by the encrypted ZIP, so a resumed job never
+        queues them twice.
+        """
+        org_id = ctx.org_id
+        collection_id = ctx.collection_id
+        enc_zip_sha = fingerprints["enc_zip_sha"]
+        enc_zip_cid = fingerprints["enc_zip_cid"]
+        outbox = RegistrationOutbox(ctx.asset_helper.path_for_registration_outbox())
+        if action_params["registration_policies"]["iscn"]["active"]:
+            outbox.enqueue(
+                registration_outbox.ISCN,
+                hash_list_path,
+                {
+                    **fingerprints,
+                    "name": meta_content["name"],
+                    "description": meta_content["description"],
+                    "author": meta_content["author"],
+                    "keywords": [org_id, collection_id],
+                    "date_created": meta_content["dateCreated"],
+                    "record_notes": json.dumps(
+                        (meta_content["extras"]), separators=(",", ":")
+                    ),
+                },
+                dedup_key=f"{registration_outbox.ISCN}:{enc_zip_sha}",
+            )
+            _logger.info("Content registration on ISCN queued")
         else:
             _logger.info("Content registration on ISCN skipped")
 
-        # Register encrypted ZIP on Numbers Protocol
-        numbers_receipt = None
         if action_params["registration_policies"]["numbersprotocol"]["active"]:
-            try:
-                chains = action_params["registration_policies"]["numbersprotocol"][
-                    "chains"
-                ]
-                numbers_receipt = Numbers.register_archive(
-                    meta_content["name"],
-                    meta_content["description"],
-                    enc_zip_cid,
-                    enc_zip_sha,
-                    "application/octet-stream",
-                    meta_content["dateCreated"],
-                    action_params["registration_policies"]["numbersprotocol"][
+            numbers_policy = action_params["registration_policies"]["numbersprotocol"]
+            outbox.enqueue(
+                registration_outbox.NUMBERS,
+                hash_list_path,
+                {
+                    **fingerprints,
+                    "asset_name": meta_content["name"],
+                    "asset_description": meta_content["description"],
+                    "asset_cid": enc_zip_cid,
+                    "asset_sha256": enc_zip_sha,
+                    "asset_mime_type": "application/octet-stream",
+                    "asset_timestamp_created": meta_content["dateCreated"],
+                    "nft_contract_address": numbers_policy[
                         "custody_token_contract_address"
                     ],
-                    meta_content["author"],
-                    org_id,
-                    collection_id,
-                    meta_content["extras"],
-                    enc_zip_sha,
-                    enc_zip_md5,
-                    enc_zip_cid,
-                    content_sha,
-                    content_md5,
-                    content_cid,
-                    zip_sha,
-                    zip_md5,
-                    zip_cid,
-                    chains,
-                    action_params["registration_policies"]["numbersprotocol"].get(
-                        "testnet", False
-                    ),
-                )
-            except requests.exceptions.RequestException as e:
-                _logger.error(f"Content registration on Numbers Protocol failed: {e}")
-            else:
-                for chain in chains:
-                    if chain in numbers_receipt:
-                        _logger.info(f"Registered on Numbers Protocol chain {chain}")
-                    else:
-                        # Don't fail for missing registrations, just log
-                        _logger.error(
-                            f"Registration on Numbers protocol chain {chain} failed"
-                        )
+                    "author": meta_content["author"],
+                    "org_id": org_id,
+                    "collection_id": collection_id,
+                    "extras": meta_content["extras"],
+                    "chains": numbers_policy["chains"],
+                    "testnet": numbers_policy.get("testnet", False),
+                },
+                dedup_key=f"{registration_outbox.NUMBERS}:{enc_zip_sha}",
+            )
+            _logger.info("Content registration on Numbers Protocol queued")
         else:
             _logger.info("Content registration on Numbers Protocol skipped")
 
-        # Generate file that contains all the hashes
-        action_output_dir = asset_helper.path_for_action_output(
-            collection_id, action_name
+    @staticmethod
+    def link_duplicate_archive(
+        zip_path: str, org_id: str, collection_id: str, original_input_sha: str
+    ) -> str:
+        """Links the hash list of an input whose content was already archived.
+
+        Instead of archiving and registering the same content again, the hash
+        list of the input the content was first archived from is linked under
+        this input's SHA-256. Where symbolic links aren't supported, the hash
+        list is copied.
+
+        Args:
+            zip_path: path to the duplicate input ZIP
+            org_id: ID for this organization
+            collection_id: string with the unique collection identifier this
+                asset is in
+            original_input_sha: SHA-256 of the input the content was archived from
+
+        Returns:
+            the path to the linked hash list
+
+        Raises:
+            Exception if the hash list could not be linked or copied
+        """
+        output_dir = AssetHelper(org_id).path_for_action_output(
+            collection_id, "archive"
         )
-        hash_list_path = os.path.join(action_output_dir, f"{input_zip_sha}.json")
-        self._write_hash_list(
-            hash_list_path,
-            input_zip_sha,
-            content_sha,
-            content_md5,
-            content_cid,
-            zip_sha,
-            zip_md5,
-            zip_cid,
-            enc_zip_sha,
-            enc_zip_md5,
-            enc_zip_cid,
-            # "sourceId" is a reference field to the original content
-            # Filename, item number/timestamp, public key, whatever works
-            # https://github.com/starlinglab/integrity-backend/issues/116
-            meta_content.get("sourceId"),
-            {"iscn": iscn_receipt, "numbersProtocol": numbers_receipt},
+        input_sha = os.path.splitext(os.path.basename(zip_path))[0]
+        hash_list_path = os.path.join(output_dir, f"{input_sha}.json")
+        original_name = f"{original_input_sha}.json"
+        if not os.path.lexists(hash_list_path):
+            try:
+                os.symlink(original_name, hash_list_path)
+            except OSError:
+                shutil.copy2(os.path.join(output_dir, original_name), hash_list_path)
+        _logger.info(
+            f"Content of {zip_path} already archived, linked hash list {hash_list_path} to {original_name}"
         )
-
-    def c2pa_proofmode(self, zip_path: str, org_config: dict, collection_id: str):
+        return hash_list_path
+
+    def c2pa_proofmode(
+        self,
+        zip_path: str,
+        org_config: dict,
+        collection_id: str,
+        ingest: Ingest = None,
+    ):
         """Process a proofmode zip that bundles multiple JPEG assets with metadata,
         and injects C2PA claims to outputted JPEG assets.
 
@@ -397,84 +702,54 @@ class Actions:
             org_config: configuration dictionary for this organization
             collection_id: string with the unique collection identifier this
                 asset is in
+            ingest: the ZIP as already ingested for the collection, if any
 
-        Raises:
-            Exception if errors are encountered during processing
+        Returns:
+            the job's results: the output directory, or None if processing failed
+
+        Exceptions are not raised, only logged.
         """
+        # TODO: change function to take just org_id as param
+        action_name = "c2pa-proofmode"
         try:
-            #Acceptable extensions for proofmode
-            # TODO: use starling capture method instead
-            C2PA_EXT=[".jpg",".jpeg","m4a"]
-
-            # TODO: change function to take just org_id as param
-            action_name = "c2pa-proofmode"
-            org_id = org_config["id"]
-            asset_helper = AssetHelper(org_id)
-
-            action = config.ORGANIZATION_CONFIG.get_action(
-                org_id, collection_id, action_name
-            )
-            action_params = action.get("params")
-
-            # Get paths
-            action_dir = asset_helper.path_for_action(collection_id, action_name)
-            action_output_dir = asset_helper.path_for_action_output(
-                collection_id, action_name
-            )
-            action_tmp_dir = asset_helper.path_for_action_tmp(
-                collection_id, action_name
-            )
-
-            # Verify and copy zip
-            input_zip_sha = os.path.splitext(os.path.basename(zip_path))[0]
-            if input_zip_sha != _file_util.digest_sha256(zip_path):
-                raise Exception(f"SHA-256 of ZIP does not match file name: {zip_path}")
-            tmp_zip = shutil.copy2(zip_path, action_tmp_dir)
-            bundle_name = f"{input_zip_sha}-images"
-
-            # Define paths for images extracted from proofmode zip
-            tmp_img_dir = os.path.join(action_tmp_dir, bundle_name)
-            action_img_dir = os.path.join(action_dir, bundle_name)
-
-            meta_content = None
-            photographer_id = None
-            with ZipFile(tmp_zip) as zipf:
-                meta_content_path = next(
-                    (s for s in zipf.namelist() if s.endswith("-meta-content.json")),
-                    None,
-                )
-                if meta_content_path is None:
-                    raise Exception(f"ZIP at {zip_path} has no content metadata file")
-                with zipf.open(meta_content_path) as meta_content_f:
-                    meta_content = json.load(meta_content_f)["contentMetadata"]
-                    source_name = meta_content.get("author", {}).get("name")
-                    if source_name is None:
-                        photographer_id = "default"
-                    else:
-                        photographer_id = asset_helper.filename_safe(source_name)
-
-                # Open content ZIP and extract all JPEGs
-                content_zip = next(
-                    (s for s in zipf.namelist() if s.endswith(".zip")), None
-                )
-                if content_zip is None:
-                    raise Exception(f"ZIP at {zip_path} has no content file")
-                _file_util.create_dir(tmp_img_dir)
-                with ZipFile(zipf.open(content_zip)) as content_zip_f:
-                    for file_path in content_zip_f.namelist():
-                        if os.path.splitext(file_path)[1].lower() in C2PA_EXT:
-                            content_zip_f.extract(file_path, tmp_img_dir)
-
-            # Get list of JPEGs
-            image_filenames = []
-            for filename in os.listdir(tmp_img_dir):
-                if os.path.splitext(filename)[1].lower() in C2PA_EXT:
-                    image_filenames.append(filename)
-
-            # C2PA-inject all JPEGs
-            for filename in image_filenames:
-                claim = _claim.generate_c2pa_proofmode(meta_content, filename)
-                path = os.path.join(tmp_img_dir, filename)
+            with JobContext(
+                action_name, zip_path, org_config["id"], collection_id, ingest
+            ) as ctx:
+                self._c2pa_proofmode(ctx)
+                return ctx.results
+        except Exception as e:
+            _logger.error(
+                f"{action_name} failed during processing of input file: {zip_path}"
+            )
+            _logger.error(str(e))
+
+    def _c2pa_proofmode(self, ctx: JobContext):
+        # Acceptable extensions for proofmode
+        # TODO: use starling capture method instead
+        C2PA_EXT = [".jpg", ".jpeg", "m4a"]
+
+        action = config.ORGANIZATION_CONFIG.get_action(
+            ctx.org_id, ctx.collection_id, ctx.action_name
+        )
+        action_params = action.get("params")
+
+        tmp_img_dir, meta_content, photographer_id = self._extract_proofmode(
+            ctx, C2PA_EXT
+        )
+
+        # Get list of JPEGs
+        image_filenames = []
+        for filename in os.listdir(tmp_img_dir):
+            if os.path.splitext(filename)[1].lower() in C2PA_EXT:
+                image_filenames.append(filename)
+
+        # C2PA-inject all JPEGs
+        for filename in image_filenames:
+            claim = _claim.generate_c2pa_proofmode(meta_content, filename)
+            path = os.path.join(tmp_img_dir, filename)
+            with metrics.timed(
+                metrics.STAGE_SECONDS, action=ctx.action_name, stage="c2patool"
+            ):
                 _c2patool.run_claim_inject(
                     claim,
                     path,
@@ -484,41 +759,30 @@ class Actions:
                     action_params["c2pa_algo"],
                 )
 
-            # Process C2PA-injected JPEGs
-            for filename in image_filenames:
-                # TODO: Why is this needed. fix for m4a as well
-                # Rename each image file to .jpg
-                path = os.path.join(tmp_img_dir, filename)
-                image_path = FileUtil.change_filename_extension(path, ".jpg")
-                os.rename(path, image_path)
-
-                # Read claims (requires .jpg extension as input)
-                claim_path = FileUtil.change_filename_extension(image_path, ".json")
+        # Process C2PA-injected JPEGs
+        for filename in image_filenames:
+            # TODO: Why is this needed. fix for m4a as well
+            # Rename each image file to .jpg
+            path = os.path.join(tmp_img_dir, filename)
+            image_path = FileUtil.change_filename_extension(path, ".jpg")
+            os.rename(path, image_path)
+
+            # Read claims (requires .jpg extension as input)
+            claim_path = FileUtil.change_filename_extension(image_path, ".json")
+            with metrics.timed(
+                metrics.STAGE_SECONDS, action=ctx.action_name, stage="c2patool"
+            ):
                 _c2patool.run_claim_dump(image_path, claim_path)
 
-            # Copy all C2PA-injected JPEGs to action_dir
-            shutil.copytree(tmp_img_dir, action_img_dir, dirs_exist_ok=True)
-
-            # Atomically move all C2PA-injected JPEGs to output folder under photographer ID and date
-            shared_dir = os.path.join(
-                action_output_dir,
-                photographer_id,
-                datetime.now(timezone.utc).strftime("%Y-%m-%d"),
-                bundle_name,
-            )
-            if os.path.exists(shared_dir):
-                shared_dir = f"{shared_dir}-{int(time.time())}"
-            os.renames(tmp_img_dir, shared_dir)
-        except Exception as e:
-            _logger.error(
-                f"{action_name} failed during processing of input file: {zip_path}"
-            )
-            _logger.error(str(e))
-        finally:
-            self._purge_from_tmp(tmp_img_dir, action_tmp_dir)
-            self._purge_from_tmp(tmp_zip, action_tmp_dir)
+        self._publish_proofmode(ctx, tmp_img_dir, photographer_id)
 
-    def copy_proofmode(self, zip_path: str, org_config: dict, collection_id: str):
+    def copy_proofmode(
+        self,
+        zip_path: str,
+        org_config: dict,
+        collection_id: str,
+        ingest: Ingest = None,
+    ):
         """Process a proofmode zip that bundles multiple assets with metadata,
         and extracts them to the output folder.
 
@@ -527,89 +791,105 @@ class Actions:
             org_config: configuration dictionary for this organization
             collection_id: string with the unique collection identifier this
                 asset is in
+            ingest: the ZIP as already ingested for the collection, if any
 
-        Raises:
-            Exception if errors are encountered during processing
+        Returns:
+            the job's results: the output directory, or None if processing failed
+
+        Exceptions are not raised, only logged.
         """
+        # TODO: change function to take just org_id as param
+        action_name = "copy-proofmode"
         try:
-            # TODO: change function to take just org_id as param
-            action_name = "copy-proofmode"
-            org_id = org_config["id"]
-            asset_helper = AssetHelper(org_id)
-
-            # Get paths
-            action_dir = asset_helper.path_for_action(collection_id, action_name)
-            action_output_dir = asset_helper.path_for_action_output(
-                collection_id, action_name
-            )
-            action_tmp_dir = asset_helper.path_for_action_tmp(
-                collection_id, action_name
-            )
-
-            # Verify and copy zip
-            input_zip_sha = os.path.splitext(os.path.basename(zip_path))[0]
-            if input_zip_sha != _file_util.digest_sha256(zip_path):
-                raise Exception(f"SHA-256 of ZIP does not match file name: {zip_path}")
-            tmp_zip = shutil.copy2(zip_path, action_tmp_dir)
-            bundle_name = f"{input_zip_sha}-images"
-
-            # Define paths for files extracted from proofmode zip
-            tmp_img_dir = os.path.join(action_tmp_dir, bundle_name)
-            # TODO rename variables, these are not images
-            action_img_dir = os.path.join(action_dir, bundle_name)
-
-            meta_content = None
-            photographer_id = None
-            with ZipFile(tmp_zip) as zipf:
-                meta_content_path = next(
-                    (s for s in zipf.namelist() if s.endswith("-meta-content.json")),
-                    None,
-                )
-                if meta_content_path is None:
-                    raise Exception(f"ZIP at {zip_path} has no content metadata file")
-                with zipf.open(meta_content_path) as meta_content_f:
-                    meta_content = json.load(meta_content_f)["contentMetadata"]
-                    source_name = meta_content.get("author", {}).get("name")
-                    if source_name is None:
-                        photographer_id = "default"
-                    else:
-                        photographer_id = asset_helper.filename_safe(source_name)
-
-                # Open content ZIP and extract all files
-                content_zip = next(
-                    (s for s in zipf.namelist() if s.endswith(".zip")), None
-                )
-                if content_zip is None:
-                    raise Exception(f"ZIP at {zip_path} has no content file")
-                _file_util.create_dir(tmp_img_dir)
-                with ZipFile(zipf.open(content_zip)) as content_zip_f:
-                    for file_path in content_zip_f.namelist():
-                        content_zip_f.extract(file_path, tmp_img_dir)
-
-            # Copy all files to action_dir
-            shutil.copytree(tmp_img_dir, action_img_dir, dirs_exist_ok=True)
-
-            # Atomically move all files to output folder under photographer ID and date
-            shared_dir = os.path.join(
-                action_output_dir,
-                photographer_id,
-                datetime.now(timezone.utc).strftime("%Y-%m-%d"),
-                bundle_name,
-            )
-            if os.path.exists(shared_dir):
-                shared_dir = f"{shared_dir}-{int(time.time())}"
-            os.renames(tmp_img_dir, shared_dir)
+            with JobContext(
+                action_name, zip_path, org_config["id"], collection_id, ingest
+            ) as ctx:
+                tmp_img_dir, _, photographer_id = self._extract_proofmode(ctx)
+                self._publish_proofmode(ctx, tmp_img_dir, photographer_id)
+                return ctx.results
         except Exception as e:
             _logger.error(
                 f"{action_name} failed during processing of input file: {zip_path}"
             )
             _logger.error(str(e))
-        finally:
-            self._purge_from_tmp(tmp_img_dir, action_tmp_dir)
-            self._purge_from_tmp(tmp_zip, action_tmp_dir)
+
+    def _extract_proofmode(
+        self, ctx: JobContext, exts: Optional[list[str]] = None
+    ) -> Tuple[str, dict, str]:
+        """Extracts the files of the content ZIP in an ingested proofmode ZIP.
+
+        Args:
+            ctx: the job context
+            exts: lowercase file extensions to extract; all files if None
+
+        Returns:
+            the directory of extracted files, the content metadata, and the
+            photographer ID the output is filed under
+        """
+        zip_path = ctx.zip_path
+        ingest = ctx.ingest
+
+        # Define paths for files extracted from proofmode zip
+        # TODO rename variables, these are not images
+        tmp_img_dir = ctx.tmp_path(f"{ctx.input_sha}-images")
+
+        meta_content_path = next(
+            (s for s in ingest.listing if s.endswith("-meta-content.json")), None
+        )
+        if meta_content_path is None:
+            raise Exception(f"ZIP at {zip_path} has no content metadata file")
+        with open(ingest.path(meta_content_path)) as meta_content_f:
+            meta_content = json.load(meta_content_f)["contentMetadata"]
+        source_name = meta_content.get("author", {}).get("name")
+        if source_name is None:
+            photographer_id = "default"
+        else:
+            photographer_id = ctx.asset_helper.filename_safe(source_name)
+
+        # Extract files from the content ZIP; the ingested files are shared
+        # with other actions, so anything that is modified must be a copy
+        content_zip = next((s for s in ingest.listing if s.endswith(".zip")), None)
+        if content_zip is None:
+            raise Exception(f"ZIP at {zip_path} has no content file")
+        _file_util.create_dir(tmp_img_dir)
+        with metrics.timed(
+            metrics.STAGE_SECONDS, action=ctx.action_name, stage="extract"
+        ), ZipFile(ingest.path(content_zip)) as content_zip_f:
+            for file_path in content_zip_f.namelist():
+                if exts is None or os.path.splitext(file_path)[1].lower() in exts:
+                    content_zip_f.extract(file_path, tmp_img_dir)
+
+        return tmp_img_dir, meta_content, photographer_id
+
+    def _publish_proofmode(self, ctx: JobContext, tmp_img_dir: str, photographer_id):
+        bundle_name = os.path.basename(tmp_img_dir)
+
+        # Copy all files to action_dir
+        with metrics.timed(metrics.STAGE_SECONDS, action=ctx.action_name, stage="copy"):
+            shutil.copytree(
+                tmp_img_dir,
+                os.path.join(ctx.action_dir, bundle_name),
+                dirs_exist_ok=True,
+            )
+
+        # Atomically move all files to output folder under photographer ID and date
+        shared_dir = os.path.join(
+            ctx.output_dir,
+            photographer_id,
+            datetime.now(timezone.utc).strftime("%Y-%m-%d"),
+            bundle_name,
+        )
+        if os.path.exists(shared_dir):
+            shared_dir = f"{shared_dir}-{int(time.time())}"
+        os.renames(tmp_img_dir, shared_dir)
+        ctx.results["output"] = shared_dir
 
     def c2pa_starling_capture(
-        self, zip_path: str, org_config: dict, collection_id: str
+        self,
+        zip_path: str,
+        org_config: dict,
+        collection_id: str,
+        ingest: Ingest = None,
     ):
         """
         Inject a JPEG from Starling Capture with C2PA information.
@@ -620,6 +900,7 @@ class Actions:
             zip_path: path to asset zip (will be copied, not altered)
             org_config: configuration dictionary for this organization
             collection_id: string with the unique collection identifier this asset is in
+            ingest: the ZIP as already ingested for the collection, if any
 
         Returns:
             the local path to the asset file in the internal directory
@@ -628,12 +909,18 @@ class Actions:
             Exception if errors are encountered during processing
         """
 
-        # Setup context
+        with JobContext(
+            "c2pa-starling-capture", zip_path, org_config["id"], collection_id, ingest
+        ) as ctx:
+            return self._c2pa_starling_capture(ctx)
 
-        action_name = "c2pa-starling-capture"
-        org_id = org_config["id"]
+    def _c2pa_starling_capture(self, ctx: JobContext):
+        action_name = ctx.action_name
+        zip_path = ctx.zip_path
+        org_id = ctx.org_id
+        collection_id = ctx.collection_id
 
-        asset_helper = AssetHelper(org_id)
+        asset_helper = ctx.asset_helper
 
         collection = config.ORGANIZATION_CONFIG.get_collection(org_id, collection_id)
         action = config.ORGANIZATION_CONFIG.get_action(
@@ -641,68 +928,67 @@ class Actions:
         )
         action_params = action.get("params")
 
-        content_filename, content_sha = self._verify_zip(
-            zip_path, collection["asset_extensions"]
+        ingest = ctx.ingest
+        content_filename, content_sha = self._verify_bundle(
+            ingest, collection["asset_extensions"]
         )
-        content_ext=os.path.splitext(content_filename)[1].lower()
-
-        # Extract content file
-        tmp_dir = asset_helper.path_for_action_tmp(collection_id, action_name)
-        zip_dir = os.path.join(tmp_dir, content_sha)
-        extracted_content = os.path.join(zip_dir, content_filename)
-        _file_util.create_dir(zip_dir)
-        zip_util.extract_file(zip_path, content_filename, extracted_content)
+        content_ext = os.path.splitext(content_filename)[1].lower()
+        extracted_content = ingest.path(content_filename)
 
         # Load meta content
         meta_content_filename = f"{content_sha}-meta-content.json"
-        meta_content = zip_util.json_load(zip_path, meta_content_filename)
+        with open(ingest.path(meta_content_filename)) as meta_content_f:
+            meta_content = json.load(meta_content_f)
 
         # Create temporary files to work with.
-        tmp_asset_file = asset_helper.get_tmp_file_fullpath(f".{content_ext}")
-        tmp_claim_file = asset_helper.get_tmp_file_fullpath(".json")
+        tmp_asset_file = ctx.tmp_path(f"asset.{content_ext}")
+        tmp_claim_file = ctx.tmp_path("claim.json")
 
         # Inject create claim and read back from file.
         claim = _claim.generate_c2pa_starling_capture(meta_content["contentMetadata"])
-        shutil.copy2(extracted_content, tmp_asset_file)
-        _c2patool.run_claim_inject(
-            claim,
-            tmp_asset_file,
-            tmp_asset_file,
-            action_params["c2pa_cert"],
-            action_params["c2pa_key"],
-            action_params["c2pa_algo"],
-        )
-        _c2patool.run_claim_dump(tmp_asset_file, tmp_claim_file)
-        
+        with metrics.timed(metrics.STAGE_SECONDS, action=action_name, stage="copy"):
+            shutil.copy2(extracted_content, tmp_asset_file)
+        with metrics.timed(metrics.STAGE_SECONDS, action=action_name, stage="c2patool"):
+            _c2patool.run_claim_inject(
+                claim,
+                tmp_asset_file,
+                tmp_asset_file,
+                action_params["c2pa_cert"],
+                action_params["c2pa_key"],
+                action_params["c2pa_algo"],
+            )
+            _c2patool.run_claim_dump(tmp_asset_file, tmp_claim_file)
+
         # Copy the C2PA-injected asset to both the internal and shared asset directories.
         asset_file_hash = _file_util.digest_sha256(tmp_asset_file)
 
-        os.makedirs(os.path.join(asset_helper.path_for_action(collection_id, action_name),"assets"),exist_ok=True)
+        os.makedirs(
+            os.path.join(
+                asset_helper.path_for_action(collection_id, action_name), "assets"
+            ),
+            exist_ok=True,
+        )
         internal_asset_file = os.path.join(
             asset_helper.path_for_action(collection_id, action_name),
             "assets",
             asset_file_hash + f".{content_ext}",
         )
         shutil.move(tmp_asset_file, internal_asset_file)
-        target_path=os.path.join(
-                 asset_helper.path_for_action_output(collection_id, action_name),
-                 meta_content["contentMetadata"]["author"].get("name", "unknown"),
-                 datetime.now(timezone.utc).strftime("%Y-%m-%d")
-        )
-        os.makedirs(target_path,exist_ok=True)
-        shutil.copy2(
-            internal_asset_file,
-            target_path
+        target_path = os.path.join(
+            asset_helper.path_for_action_output(collection_id, action_name),
+            meta_content["contentMetadata"]["author"].get("name", "unknown"),
+            datetime.now(timezone.utc).strftime("%Y-%m-%d"),
         )
+        os.makedirs(target_path, exist_ok=True)
+        shutil.copy2(internal_asset_file, target_path)
         _logger.info("New asset file added: %s", internal_asset_file)
 
         # Treat manifest the same way: both internal and shared dirs
         # https://github.com/starlinglab/integrity-backend/pull/130#discussion_r1195401358
         internal_claim_path = os.path.join(
-            asset_helper.path_for_action(collection_id, action_name),
-            "claims"
+            asset_helper.path_for_action(collection_id, action_name), "claims"
         )
-        os.makedirs(internal_claim_path,exist_ok=True)
+        os.makedirs(internal_claim_path, exist_ok=True)
         internal_claim_file = os.path.join(
             internal_claim_path,
             asset_file_hash + ".json",
@@ -721,27 +1007,106 @@ class Actions:
             internal_claim_file,
         )
 
+        ctx.results["asset"] = internal_asset_file
+        ctx.results["claim"] = internal_claim_file
         return internal_asset_file
 
-    def _authsign_data(
-        self, proof_zip_path, extracted_content_path, data_hash, server_url, auth_token
-    ):
-        proof_file_path = f"{extracted_content_path}.authsign"
+    def _authsign_sign(self, items, server_url, auth_token, proof_dir):
+        """Signs files with authsign concurrently.
+
+        Args:
+            items: list of (extracted file path, file hash, name for logging)
+            server_url: URL to authsign server
+            auth_token: authorization token to authsign server
+            proof_dir: directory the proof files are written to
+
+        Returns:
+            list of (proof file path, or None if signing failed; name), in the
+            order of `items`
+        """
+        proof_file_paths = [
+            os.path.join(proof_dir, f"{os.path.basename(path)}.authsign")
+            for path, _, _ in items
+        ]
         try:
-            _file_util.authsign_sign(data_hash, server_url, auth_token, proof_file_path)
-            zip_util.append(
-                proof_zip_path,
-                proof_file_path,
-                "proofs/" + os.path.basename(proof_file_path),
+            proofs = _file_util.authsign_sign_many(
+                [data_hash for _, data_hash, _ in items],
+                server_url,
+                auth_token,
+                proof_file_paths,
             )
         except Exception as e:
             _logger.error(str(e))
-        return proof_file_path
+            proofs = [None] * len(items)
+        return [
+            (None if proof is None else proof_file_path, name)
+            for (_, _, name), proof, proof_file_path in zip(
+                items, proofs, proof_file_paths
+            )
+        ]
 
-    def _opentimestamps_data(self, proof_zip_path, extracted_content_path):
-        proof_file_path = f"{extracted_content_path}.ots"
+    def _opentimestamp(self, extracted_content_path, proof_dir):
+        """Registers a file on OpenTimestamps.
+
+        Returns:
+            the path of the .ots proof file, or None if registration failed
+        """
+        proof_file_path = os.path.join(
+            proof_dir, f"{os.path.basename(extracted_content_path)}.ots"
+        )
         try:
             _file_util.register_timestamp(extracted_content_path, proof_file_path)
+        except Exception as e:
+            _logger.error(str(e))
+            return None
+        return proof_file_path
+
+    async def _opentimestamp_async(self, extracted_content_path, proof_dir):
+        """Registers a file on OpenTimestamps, on the running event loop.
+
+        Returns:
+            the path of the .ots proof file, or None if registration failed
+        """
+        proof_file_path = os.path.join(
+            proof_dir, f"{os.path.basename(extracted_content_path)}.ots"
+        )
+        try:
+            await _file_util.register_timestamp_async(
+                extracted_content_path, proof_file_path
+            )
+        except Exception as e:
+            _logger.error(str(e))
+            return None
+        return proof_file_path
+
+    def _append_proofs(self, proof_zip_path, proofs: dict):
+        """Appends proofs to a ZIP: authsign proofs first, then timestamps.
+
+        Args:
+            proof_zip_path: path to the ZIP the proof files are appended to
+            proofs: the outputs of the authsign and timestamp stages that ran
+        """
+        for proof_file_path, name in proofs.get("authsign_proofs", []):
+            if proof_file_path is None:
+                _logger.error(f"{name} signage failed")
+                continue
+            if self._append_proof(proof_zip_path, proof_file_path):
+                _logger.info(f"{name} signed by authsign server {proof_file_path}")
+
+        for key, _, name in TIMESTAMPED:
+            if f"ots_{key}" not in proofs:
+                continue
+            proof_file_path = proofs[f"ots_{key}"]
+            if proof_file_path is None:
+                _logger.error(f"{name} timestamp registration failed")
+            elif self._append_proof(proof_zip_path, proof_file_path):
+                _logger.info(
+                    f"{name} securely timestamped with OpenTimestamps: {proof_file_path}"
+                )
+
+    @staticmethod
+    def _append_proof(proof_zip_path, proof_file_path) -> bool:
+        try:
             zip_util.append(
                 proof_zip_path,
                 proof_file_path,
@@ -749,15 +1114,5 @@ class Actions:
             )
         except Exception as e:
             _logger.error(str(e))
-        return proof_file_path
-
-    def _purge_from_tmp(self, purge_target, tmp_root):
-        purge_target = purge_target.strip()
-        if purge_target and purge_target != "/" and purge_target.startswith(tmp_root):
-            # Clean up temporary files
-            if os.path.isfile(purge_target):
-                os.remove(purge_target)
-                _logger.info(f"Purged temporary file at: {purge_target}")
-            elif os.path.isdir(purge_target):
-                shutil.rmtree(purge_target)
-                _logger.info(f"Purged temporary directory at: {purge_target}")
+            return False
+        return True
@@ -1,6 +1,7 @@
 from . import config
 from .file_util import FileUtil
 from .log_helper import LogHelper
+from .scratch import scratch_root
 
 import os
 
@@ -27,6 +28,12 @@ class AssetHelper:
       - includes assets for permanent storage, and also temporary directories
         for intermediate working files
 
+    * config.SCRATCH_DIR (optional)
+        `-- organization_id
+            `-- tmp
+
+      - if set, temporary directories are here instead of in the internal tree
+
     * config.SHARED_FILE_SYSTEM
         `-- organization_id
             `-- collection_id
@@ -57,7 +64,7 @@ class AssetHelper:
             config.INTERNAL_ASSET_STORE, organization_id
         )
         self.shared_prefix = os.path.join(config.SHARED_FILE_SYSTEM, organization_id)
-        self.dir_internal_tmp = os.path.join(self.internal_prefix, "tmp")
+        self.dir_internal_tmp = os.path.join(scratch_root(), organization_id, "tmp")
 
     @staticmethod
     def from_jwt(jwt_payload: dict):
@@ -129,6 +136,33 @@ class AssetHelper:
             self.dir_internal_tmp, collection_id, f"action-{action_name}"
         )
 
+    def path_for_ingest(self, collection_id: str) -> str:
+        """Returns a full directory path for input ZIPs extracted for all actions of this collection."""
+        return os.path.join(self.dir_internal_tmp, collection_id, "ingest")
+
+    def path_for_journal(
+        self, collection_id: str, action_name: str, input_sha: str
+    ) -> str:
+        """Returns a full directory path for the stage journal of an action job on an input."""
+        return os.path.join(
+            self._collection_prefix(collection_id),
+            "journal",
+            f"action-{action_name}",
+            input_sha,
+        )
+
+    def path_for_processed_index(self, collection_id: str) -> str:
+        """Returns the full path of the processed-input index database for this collection."""
+        return os.path.join(self._collection_prefix(collection_id), "processed.db")
+
+    def path_for_leases(self) -> str:
+        """Returns the full path of the database of leases held by nodes on this organization's work."""
+        return os.path.join(self.internal_prefix, "leases.db")
+
+    def path_for_registration_outbox(self) -> str:
+        """Returns the full path of the registration outbox database for this organization."""
+        return os.path.join(self.internal_prefix, "registration-outbox.db")
+
     def filename_safe(self, filename):
         return filename.lower().replace(" ", "-").strip()
 
@@ -153,6 +187,7 @@ class AssetHelper:
                     f"Collection {coll_id} for org {self.org_id} is not filename safe"
                 )
             _file_util.create_dir(self.path_for_input(coll_id))
+            _file_util.create_dir(self.path_for_ingest(coll_id))
             for action_name in coll_config.get("actions", {}).keys():
                 _file_util.create_dir(self.path_for_action(coll_id, action_name))
                 _file_util.create_dir(self.path_for_action_output(coll_id, action_name))
@@ -0,0 +1,320 @@
+"""Asyncio service mode: all organizations' inputs on one event loop.
+
+In the default mode, each organization has a file watcher process, and jobs
+hold a worker thread or process from start to end, even while they only wait
+on subprocesses or upstream services. In async mode, set with
+`SERVICE_MODE=async`, a single process watches all organizations' input
+directories and processes their inputs as asyncio tasks, so many inputs can be
+in flight at once without a thread each.
+
+The archive action runs its pipeline on the loop: the OpenTimestamps and IPFS
+clients run as asyncio subprocesses, and the CPU-heavy stages, like hashing,
+signing and encrypting, run in the service's thread pool. The other actions,
+ingest, and the processed-input index and lease databases also run in the
+thread pool.
+
+The service is configured with an optional top-level `async_service` object
+in the config file:
+
+    "async_service": {"max_in_flight": 256, "workers": 8}
+
+`max_in_flight` caps the inputs processed at once, and `workers` is the size
+of the thread pool. The scheduler and scratch space reservations of the
+default mode aren't used; `max_in_flight` bounds the work instead.
+"""
+
+from . import config, metrics, rate_limit, scheduler
+from .actions import Actions
+from .asset_helper import AssetHelper
+from .fs_watcher import (
+    CollectionHandler,
+    FsWatcher,
+    _archived_duplicate_of,
+    _claim_archived_content,
+    _link_duplicate,
+    caught_and_logged_exceptions,
+    make_observer,
+    record_action,
+    run_action,
+)
+from .ingest import Ingest
+from .leases import DEFAULT_TTL, HEARTBEATS_PER_TTL, Lease, open_store
+from .log_helper import LogHelper
+from .processed_index import open_index
+from .upload_hasher import UploadDigest
+
+from concurrent.futures import ThreadPoolExecutor
+
+import asyncio
+import os
+import time
+
+_actions = Actions()
+_logger = LogHelper.getLogger()
+
+DEFAULT_MAX_IN_FLIGHT = 256
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 4) + 4)
+
+
+class AsyncService:
+    """Watches all organizations' input directories and processes inputs on one event loop."""
+
+    def __init__(
+        self,
+        all_org_config: config.OrganizationConfig,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        workers: int = DEFAULT_WORKERS,
+    ):
+        """
+        Args:
+            all_org_config: configuration for all organizations and their actions
+            max_in_flight: number of inputs processed at once
+            workers: number of threads that run blocking and CPU-heavy work
+        """
+        self.all_org_config = all_org_config
+        self.max_in_flight = max_in_flight
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="async_service")
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._loop = None
+        self._stopped = None
+
+    @staticmethod
+    def from_config(
+        all_org_config: config.OrganizationConfig = config.ORGANIZATION_CONFIG,
+    ):
+        """Makes the service with the settings in the config file."""
+        conf = all_org_config.json_config.get("async_service", {})
+        return AsyncService(
+            all_org_config,
+            conf.get("max_in_flight", DEFAULT_MAX_IN_FLIGHT),
+            conf.get("workers", DEFAULT_WORKERS),
+        )
+
+    def run(self):
+        """Runs the service until interrupted."""
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            _logger.warning("Caught keyboard interrupt. Stopping AsyncService.")
+
+    def stop(self):
+        """Stops the service; can be called from any thread."""
+        self._loop.call_soon_threadsafe(self._stopped.set)
+
+    async def serve(self):
+        """Watches and processes inputs until `stop` is called."""
+        self._loop = asyncio.get_running_loop()
+        self._loop.set_default_executor(self.executor)
+        self._stopped = asyncio.Event()
+
+        observer = make_observer()
+        pool = _LoopPool(self._loop)
+        watchers = [
+            _OrganizationWatcher(self, org_config, observer, pool)
+            for org_config in self.all_org_config.config.values()
+        ]
+        for watcher in watchers:
+            watcher.schedule_collections()
+            await asyncio.to_thread(watcher.seed_indexes)
+        # Registrations of all organizations are sent from this process
+        rate_limit.configure(
+            rate_limit.strictest_limits(self.all_org_config.json_config)
+        )
+        for watcher in watchers:
+            watcher.start_dispatcher()
+        observers = [observer]
+        for watcher in watchers:
+            observers += watcher.polling_observers
+        for each in observers:
+            each.start()
+        for watcher in watchers:
+            watcher.start_reconcile()
+            watcher.start_overflow_monitor()
+        _logger.info(
+            f"Async service watching {len(watchers)} organizations, with up to {self.max_in_flight} inputs in flight"
+        )
+
+        try:
+            await self._stopped.wait()
+        finally:
+            for each in observers:
+                each.stop()
+            for each in observers:
+                await asyncio.to_thread(each.join)
+
+    async def process_input(
+        self,
+        zip_path: str,
+        org_config: dict,
+        collection_id: str,
+        action_names: list[str],
+        job_class: str = scheduler.LIVE,
+        upload_digest: UploadDigest = None,
+    ):
+        """Ingests an input file once and runs all the collection's actions on it.
+
+        Same as `fs_watcher.process_input`, as a task on the service's event
+        loop. The job class is only logged, since there is no scheduler.
+        """
+        async with self._in_flight:
+            asset_helper = AssetHelper(org_config["id"])
+            input_sha = os.path.splitext(os.path.basename(zip_path))[0]
+            leases = open_store(asset_helper.path_for_leases())
+            key = f"input/{collection_id}/{input_sha}"
+            lease = await asyncio.to_thread(leases.acquire, key, DEFAULT_TTL, False)
+            if lease is None:
+                holder = await asyncio.to_thread(leases.holder, key)
+                _logger.info(f"{zip_path} is being processed by {holder}, skipping")
+                return
+
+            _logger.debug(f"Processing {job_class} input {zip_path}")
+            heartbeat = asyncio.create_task(_heartbeat(lease))
+            try:
+                with metrics.in_flight(metrics.JOBS_IN_FLIGHT, org=org_config["id"]):
+                    await self._process_leased(
+                        zip_path, org_config, collection_id, action_names, upload_digest
+                    )
+            finally:
+                heartbeat.cancel()
+                await asyncio.to_thread(lease.release)
+
+    async def _process_leased(
+        self,
+        zip_path: str,
+        org_config: dict,
+        collection_id: str,
+        action_names: list[str],
+        upload_digest: UploadDigest,
+    ):
+        asset_helper = AssetHelper(org_config["id"])
+        index = open_index(asset_helper.path_for_processed_index(collection_id))
+        input_sha = os.path.splitext(os.path.basename(zip_path))[0]
+        # Another node may have completed actions before the lease was taken
+        done = await asyncio.to_thread(index.completed_actions, input_sha, False)
+        action_names = [action for action in action_names if action not in done]
+        if not action_names:
+            _logger.info(f"All actions already completed on {zip_path}, skipping")
+            return
+
+        ingest = None
+        with caught_and_logged_exceptions("ingest", zip_path):
+            ingest = await asyncio.to_thread(
+                Ingest.create,
+                zip_path,
+                asset_helper.path_for_ingest(collection_id),
+                upload_digest,
+            )
+        if ingest is None:
+            return
+
+        try:
+            completed = []
+            original_input_sha = await asyncio.to_thread(
+                _archived_duplicate_of, index, ingest, action_names
+            )
+            if original_input_sha is not None:
+                if await asyncio.to_thread(
+                    _link_duplicate,
+                    zip_path,
+                    org_config,
+                    collection_id,
+                    original_input_sha,
+                ):
+                    completed.append("archive")
+                action_names = [
+                    action for action in action_names if action != "archive"
+                ]
+
+            results = await asyncio.gather(
+                *(
+                    self._run_action(
+                        action, zip_path, org_config, collection_id, ingest
+                    )
+                    for action in action_names
+                )
+            )
+            completed += [action for action, ok in zip(action_names, results) if ok]
+            await asyncio.to_thread(_claim_archived_content, index, ingest, completed)
+        finally:
+            await asyncio.to_thread(ingest.cleanup)
+
+        with caught_and_logged_exceptions("processed-input index update", zip_path):
+            await asyncio.to_thread(index.mark_completed, input_sha, completed)
+
+    async def _run_action(
+        self,
+        action: str,
+        zip_path: str,
+        org_config: dict,
+        collection_id: str,
+        ingest: Ingest,
+    ) -> bool:
+        """Runs an action on an input file, catching and logging any exceptions.
+
+        Returns:
+            True if the action completed, False if it errored
+        """
+        if action != "archive":
+            return await asyncio.to_thread(
+                run_action, action, zip_path, org_config, collection_id, ingest
+            )
+        start = time.perf_counter()
+        completed = False
+        with caught_and_logged_exceptions("archive job", zip_path):
+            await _actions.archive_async(
+                zip_path, org_config["id"], collection_id, ingest
+            )
+            completed = True
+        record_action(action, zip_path, completed, time.perf_counter() - start)
+        return completed
+
+
+async def _heartbeat(lease: Lease):
+    """Renews a lease until cancelled, without a thread of its own."""
+    while True:
+        await asyncio.sleep(lease.ttl / HEARTBEATS_PER_TTL)
+        if not await asyncio.to_thread(lease.renew):
+            return
+
+
+class _LoopPool:
+    """Runs the jobs that handlers submit from watcher threads as tasks on an event loop."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+
+    def submit(self, fn, *args):
+        """Schedules a coroutine function on the loop.
+
+        Returns:
+            a concurrent.futures.Future of its result
+        """
+        return asyncio.run_coroutine_threadsafe(fn(*args), self.loop)
+
+    def shutdown(self):
+        pass
+
+
+class _OrganizationWatcher(FsWatcher):
+    """An organization's collection handlers, submitting to the service's loop."""
+
+    def __init__(self, service: AsyncService, org_config: dict, observer, pool):
+        super().__init__(org_config)
+        self.service = service
+        self.observer = observer
+        self.pool = pool
+
+    def _make_pool(self, collection_id: str, conf: dict):
+        return self.pool
+
+    def _make_handler(self, patterns: list[str]):
+        return _AsyncCollectionHandler(self.service, patterns=patterns)
+
+
+class _AsyncCollectionHandler(CollectionHandler):
+    def __init__(self, service: AsyncService, **kwargs):
+        super().__init__(**kwargs)
+        self.service = service
+
+    def _job(self):
+        return self.service.process_input
@@ -0,0 +1,48 @@
+from hashlib import sha256
+import math
+
+
+class BloomFilter:
+    """A Bloom filter of strings.
+
+    Answers whether a string may have been added (with a small chance of a
+    false positive) or definitely hasn't been, in constant time and with about
+    1.2 bytes of memory per string at the default error rate.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        """
+        Args:
+            capacity: number of strings the filter is sized for; the error rate
+                goes up when more are added
+            error_rate: chance of a false positive when the filter is full
+        """
+        self.capacity = max(capacity, 1)
+        self.num_bits = max(
+            8, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        )
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        # Double hashing: k positions from two independent 64-bit hashes
+        digest = sha256(key.encode()).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:16], "big") | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, key: str):
+        """Adds a string; strings the filter already has aren't counted again."""
+        added = False
+        for pos in self._positions(key):
+            if not self.bits[pos >> 3] & (1 << (pos & 7)):
+                self.bits[pos >> 3] |= 1 << (pos & 7)
+                added = True
+        if added:
+            self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key)
+        )
@@ -17,11 +17,17 @@ INTERNAL_ASSET_STORE = os.environ.get("INTERNAL_ASSET_STORE")
 IPFS_CLIENT_PATH = os.environ.get("IPFS_CLIENT_PATH")
 ISCN_SERVER = os.environ.get("ISCN_SERVER")
 KEY_STORE = os.environ.get("KEY_STORE")
+METRICS_DIR = os.environ.get("METRICS_DIR")
+METRICS_PORT = os.environ.get("METRICS_PORT")
+NODE_ID = os.environ.get("NODE_ID")
 NUMBERS_API_KEY = os.environ.get("NUMBERS_API_KEY")
 NUMBERS_NUMBERS_SERVER = os.environ.get("NUMBERS_NUMBERS_SERVER")
 NUMBERS_AVALANCHE_SERVER = os.environ.get("NUMBERS_AVALANCHE_SERVER")
 NUMBERS_NEAR_SERVER = os.environ.get("NUMBERS_NEAR_SERVER")
 OTS_CLIENT_PATH = os.environ.get("OTS_CLIENT_PATH")
+RECONCILE_INTERVAL = os.environ.get("RECONCILE_INTERVAL")
+SCRATCH_DIR = os.environ.get("SCRATCH_DIR")
+SERVICE_MODE = os.environ.get("SERVICE_MODE", "processes")
 SHARED_FILE_SYSTEM = os.environ.get("SHARED_FILE_SYSTEM")
 WEB3_STORAGE_API_TOKEN = os.environ.get("WEB3_STORAGE_API_TOKEN")
 
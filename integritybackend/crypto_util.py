@@ -1,11 +1,16 @@
 import binascii
 import os
+import threading
 from Crypto.Cipher import AES
 from .config import KEY_STORE
 from .log_helper import LogHelper
 
 _logger = LogHelper.getLogger()
 
+# Keys already read, by path
+_keys = {}
+_keys_lock = threading.Lock()
+
 
 def new_aes_key() -> bytes:
     """
@@ -24,7 +29,7 @@ def get_key(name: str) -> bytes:
 
     If the key doesn't exist, it will be generated.
 
-    Keys are hex-encoded for storage.
+    Keys are hex-encoded for storage, and kept in memory once read.
 
     Raises:
         any file I/O errors
@@ -32,15 +37,21 @@ def get_key(name: str) -> bytes:
 
     key_path = os.path.join(KEY_STORE, name)
 
-    if os.path.exists(key_path):
-        with open(key_path, "rb") as f:
-            return binascii.unhexlify(f.read())
-
-    os.makedirs(KEY_STORE, 0o755, exist_ok=True)
-    new_key = new_aes_key()
-    with open(key_path, "wb") as f:
-        f.write(binascii.hexlify(new_key))
-    return new_key
+    with _keys_lock:
+        if key_path in _keys:
+            return _keys[key_path]
+
+        if os.path.exists(key_path):
+            with open(key_path, "rb") as f:
+                _keys[key_path] = binascii.unhexlify(f.read())
+            return _keys[key_path]
+
+        os.makedirs(KEY_STORE, 0o755, exist_ok=True)
+        new_key = new_aes_key()
+        with open(key_path, "wb") as f:
+            f.write(binascii.hexlify(new_key))
+        _keys[key_path] = new_key
+        return new_key
 
 
 class AESCipher:
@@ -3,15 +3,20 @@ from .crypto_util import AESCipher
 from .log_helper import LogHelper
 
 from Crypto.Cipher import AES
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from hashlib import sha256, md5
 from datetime import datetime, timezone
 from pathlib import Path
 
+import asyncio
 import errno
+import fcntl
 import json
 import os
 import requests
 import subprocess
+import threading
 import uuid
 
 _logger = LogHelper.getLogger()
@@ -19,6 +24,37 @@ _logger = LogHelper.getLogger()
 
 BUFFER_SIZE = 32 * 1024  # 32 KiB
 
+# Path of the optional authsign endpoint that signs a list of hashes at once
+AUTHSIGN_BATCH_PATH = "/sign/batch"
+
+# Pooled HTTP sessions and batch endpoint support, by authsign server URL
+_authsign_sessions = {}
+_authsign_sessions_lock = threading.Lock()
+_authsign_batch_support = {}
+
+# Directory under INTERNAL_ASSET_STORE with the lock files of update_json
+UPDATE_JSON_LOCK_DIR = "locks"
+
+# Thread locks of update_json with their number of users, by file path
+_update_json_locks = {}
+_update_json_locks_lock = threading.Lock()
+
+
+@contextmanager
+def _update_json_lock(file_path):
+    """Holds the thread lock of update_json for a file path."""
+    with _update_json_locks_lock:
+        entry = _update_json_locks.setdefault(file_path, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _update_json_locks_lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _update_json_locks[file_path]
+
 
 class FileUtil:
     """Manages file system and file names."""
@@ -44,6 +80,50 @@ class FileUtil:
             else:
                 raise err
 
+    @staticmethod
+    def update_json(file_path, update):
+        """Atomically updates a JSON file in place.
+
+        The file is read, passed to `update`, and the result is written to a
+        temporary file that then replaces the original, so readers never see a
+        partially written file. Updates are serialized across threads and
+        processes, including those of other nodes sharing the file system,
+        with a POSIX lock on a file in the `locks` dir of `INTERNAL_ASSET_STORE`
+        named by a hash of the path. If the path is a symbolic link, the file
+        it points to is updated and the link is kept.
+
+        Args:
+            file_path: the local path to the JSON file
+            update: function that takes the parsed JSON and returns the new JSON
+
+        Returns:
+            the new JSON
+
+        Raises:
+            any file I/O or JSON parsing errors
+        """
+        file_path = os.path.realpath(file_path)
+        lock_dir = os.path.join(config.INTERNAL_ASSET_STORE, UPDATE_JSON_LOCK_DIR)
+        os.makedirs(lock_dir, exist_ok=True)
+        lock_path = os.path.join(
+            lock_dir, f"{sha256(file_path.encode()).hexdigest()}.lock"
+        )
+        # POSIX locks are held per process, so threads take a thread lock too
+        with _update_json_lock(file_path), open(lock_path, "a") as lock_file:
+            fcntl.lockf(lock_file, fcntl.LOCK_EX)
+            with open(file_path, "r") as f:
+                data = update(json.load(f))
+            tmp_path = f"{file_path}.{uuid.uuid4()}.tmp"
+            try:
+                with open(tmp_path, "w") as f:
+                    f.write(json.dumps(data))
+                    f.write("\n")
+                os.replace(tmp_path, file_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        return data
+
     def generate_uuid(self):
         """Generates a randomly generated UUID.
 
@@ -173,6 +253,57 @@ class FileUtil:
                 f"'ots stamp' failed with code {proc.returncode} and output:\n\n{proc.stderr.decode()}"
             )
 
+    async def register_timestamp_async(
+        self, file_path, ts_file_path, timeout=5, min_cals=2
+    ):
+        """Creates a opentimestamps file for the given file, on the running event loop.
+
+        Same as `register_timestamp`, but waits for the OpenTimestamps client
+        without blocking a thread.
+        """
+
+        with open(file_path, "rb") as inp, open(ts_file_path, "wb") as out:
+            proc = await asyncio.create_subprocess_exec(
+                config.OTS_CLIENT_PATH,
+                "stamp",
+                "--timeout",
+                str(timeout),
+                "-m",
+                str(min_cals),
+                stdin=inp,
+                stdout=out,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            _, stderr = await proc.communicate()
+
+        if proc.returncode != 0:
+            raise Exception(
+                f"'ots stamp' failed with code {proc.returncode} and output:\n\n{stderr.decode()}"
+            )
+
+    @staticmethod
+    def _authsign_created():
+        """Returns the current time in the ISO format expected by authsign."""
+        return (
+            datetime.now()
+            .astimezone(timezone.utc)
+            .replace(tzinfo=None)
+            .isoformat(timespec="seconds")
+            + "Z"
+        )
+
+    @staticmethod
+    def _authsign_headers(authsign_auth_token):
+        if authsign_auth_token != "":
+            return {"Authorization": f"bearer {authsign_auth_token}"}
+        return {}
+
+    @staticmethod
+    def _write_authsign_proof(authsign_proof, authsign_file_path):
+        with open(authsign_file_path, "w") as f:
+            f.write(json.dumps(authsign_proof))
+            f.write("\n")
+
     def authsign_sign(
         self,
         data_hash,
@@ -193,36 +324,135 @@ class FileUtil:
             The signature proof as a string
         """
 
-        dt = datetime.now()
-        if isinstance(dt, datetime):
-            # Convert to ISO format string
-            dt = (
-                dt.astimezone(timezone.utc)
-                .replace(tzinfo=None)
-                .isoformat(timespec="seconds")
-                + "Z"
-            )
-
-        headers = {}
-        if authsign_auth_token != "":
-            headers = {"Authorization": f"bearer {authsign_auth_token}"}
-
         r = requests.post(
             authsign_server_url + "/sign",
-            headers=headers,
-            json={"hash": data_hash, "created": dt},
+            headers=self._authsign_headers(authsign_auth_token),
+            json={"hash": data_hash, "created": self._authsign_created()},
         )
         r.raise_for_status()
         authsign_proof = r.json()
 
         # Write proof to file
         if authsign_file_path != None:
-            with open(authsign_file_path, "w") as f:
-                f.write(json.dumps(authsign_proof))
-                f.write("\n")
+            self._write_authsign_proof(authsign_proof, authsign_file_path)
 
         return authsign_proof
 
+    def authsign_sign_many(
+        self,
+        data_hashes,
+        authsign_server_url,
+        authsign_auth_token,
+        authsign_file_paths=None,
+    ):
+        """
+        Sign several hashes with authsign concurrently.
+
+        All requests share one pooled HTTP session. If the server exposes a
+        batch endpoint, all hashes are signed in a single round trip; otherwise
+        the individual sign requests are sent in parallel.
+
+        Args:
+            data_hashes: list of hashes of data as hexadecimal strings
+            authsign_server_url: URL to authsign server
+            authsign_auth_token: authorization token to authsign server
+            authsign_file_paths: optional list of output paths for authsign proof
+                files (.authsign), matching the order of data_hashes
+        Returns:
+            A list of signature proofs in the same order as data_hashes.
+            A failed signature is logged and returned as None.
+        """
+
+        if authsign_file_paths is not None and len(authsign_file_paths) != len(
+            data_hashes
+        ):
+            raise ValueError("authsign_file_paths must match data_hashes in length")
+        if len(data_hashes) == 0:
+            return []
+
+        session = self._authsign_session(authsign_server_url, len(data_hashes))
+        headers = self._authsign_headers(authsign_auth_token)
+        created = self._authsign_created()
+
+        proofs = None
+        if _authsign_batch_support.get(authsign_server_url, True):
+            proofs = self._authsign_sign_batch(
+                session, data_hashes, created, authsign_server_url, headers
+            )
+
+        if proofs is None:
+
+            def sign(data_hash):
+                try:
+                    r = session.post(
+                        authsign_server_url + "/sign",
+                        headers=headers,
+                        json={"hash": data_hash, "created": created},
+                    )
+                    r.raise_for_status()
+                    return r.json()
+                except Exception as e:
+                    _logger.error(f"authsign signing of {data_hash} failed: {e}")
+                    return None
+
+            with ThreadPoolExecutor(max_workers=len(data_hashes)) as executor:
+                proofs = list(executor.map(sign, data_hashes))
+
+        # Write proofs to files
+        if authsign_file_paths is not None:
+            for authsign_proof, authsign_file_path in zip(proofs, authsign_file_paths):
+                if authsign_proof is not None:
+                    self._write_authsign_proof(authsign_proof, authsign_file_path)
+
+        return proofs
+
+    def _authsign_session(self, authsign_server_url, pool_size):
+        """Returns the pooled HTTP session for an authsign server."""
+        with _authsign_sessions_lock:
+            session = _authsign_sessions.get(authsign_server_url)
+            if session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=1, pool_maxsize=max(pool_size, 4)
+                )
+                session.mount(authsign_server_url, adapter)
+                _authsign_sessions[authsign_server_url] = session
+            return session
+
+    @staticmethod
+    def _authsign_sign_batch(
+        session, data_hashes, created, authsign_server_url, headers
+    ):
+        """Signs all hashes with the authsign batch endpoint.
+
+        Returns:
+            list of proofs, or None if the server has no batch endpoint
+        """
+        try:
+            r = session.post(
+                authsign_server_url + AUTHSIGN_BATCH_PATH,
+                headers=headers,
+                json=[{"hash": h, "created": created} for h in data_hashes],
+            )
+        except requests.exceptions.RequestException as e:
+            _logger.warning(f"authsign batch signing failed: {e}")
+            return None
+
+        if r.status_code in (404, 405, 501):
+            # Remember that this server has no batch support, and stop asking
+            _authsign_batch_support[authsign_server_url] = False
+            return None
+        if not r.ok:
+            _logger.warning(f"authsign batch signing failed: {r.status_code} {r.text}")
+            return None
+
+        proofs = r.json()
+        if not isinstance(proofs, list) or len(proofs) != len(data_hashes):
+            _logger.warning("authsign batch response does not match request")
+            return None
+        _authsign_batch_support[authsign_server_url] = True
+        return proofs
+
     def authsign_verify(self, resp, authsign_server_url):
         """
         Verify the provided signed JSON with authsign.
@@ -323,6 +553,48 @@ class FileUtil:
             Exception if errors are encountered during processing
         """
 
+        FileUtil._init_ipfs_repo()
+
+        proc = subprocess.run(
+            FileUtil._ipfs_add_args(file_path),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+
+        if proc.returncode != 0:
+            raise Exception(
+                f"'ipfs add --only-hash --cid-version=1' failed with code {proc.returncode} and output:\n\n{proc.stdout}"
+            )
+
+        return proc.stdout.strip()
+
+    @staticmethod
+    async def digest_cidv1_async(file_path):
+        """Generates the CIDv1 of a file, on the running event loop.
+
+        Same as `digest_cidv1`, but waits for the IPFS client without blocking
+        a thread.
+        """
+
+        await asyncio.to_thread(FileUtil._init_ipfs_repo)
+
+        proc = await asyncio.create_subprocess_exec(
+            *FileUtil._ipfs_add_args(file_path),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+        )
+        stdout, _ = await proc.communicate()
+
+        if proc.returncode != 0:
+            raise Exception(
+                f"'ipfs add --only-hash --cid-version=1' failed with code {proc.returncode} and output:\n\n{stdout.decode()}"
+            )
+
+        return stdout.decode().strip()
+
+    @staticmethod
+    def _init_ipfs_repo():
         if not os.path.exists(os.path.expanduser("~/.ipfs")):
             proc = subprocess.run(
                 ["ipfs", "init"],
@@ -337,23 +609,13 @@ class FileUtil:
 
             _logger.info("Created IPFS repo since it didn't exist")
 
-        proc = subprocess.run(
-            [
-                config.IPFS_CLIENT_PATH,
-                "add",
-                "--only-hash",
-                "--cid-version=1",
-                "-Q",
-                file_path,
-            ],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-        )
-
-        if proc.returncode != 0:
-            raise Exception(
-                f"'ipfs add --only-hash --cid-version=1' failed with code {proc.returncode} and output:\n\n{proc.stdout}"
-            )
-
-        return proc.stdout.strip()
+    @staticmethod
+    def _ipfs_add_args(file_path):
+        return [
+            config.IPFS_CLIENT_PATH,
+            "add",
+            "--only-hash",
+            "--cid-version=1",
+            "-Q",
+            file_path,
+        ]
@@ -1,58 +1,462 @@
 from . import config
+from .log_helper import LogHelper
 
+from concurrent.futures import ThreadPoolExecutor
+import json
 import os
 import requests
+import subprocess
+import threading
+import time
 import urllib.parse
+import uuid
+
+_logger = LogHelper.getLogger()
 
 _WEB3_STORAGE_BASE_URL = "https://api.web3.storage"
-_UPLOAD_URL = f"{_WEB3_STORAGE_BASE_URL}/upload"
-_STATUS_URL = f"{_WEB3_STORAGE_BASE_URL}/status"
+
+BUFFER_SIZE = 256 * 1024  # 256 KiB
+# Files larger than this are uploaded as a CAR split into parts of at most this size
+# web3.storage rejects requests larger than 100 MB
+MAX_PART_SIZE = 50 * 1024 * 1024
+# Number of CAR parts uploaded at once; peak memory is about this times MAX_PART_SIZE
+PARALLEL_PARTS = 4
+# Upload attempts per request, with exponential backoff in between
+UPLOAD_ATTEMPTS = 4
+RETRY_BASE_DELAY = 2
+
+# Number of blocks removed from the local IPFS repo with one command
+BLOCK_RM_BATCH_SIZE = 1000
+
+# Name of the deal status cache file kept next to the hash lists of a collection
+DEAL_STATUS_CACHE = "filecoin-deals.json"
 
 
 class Filecoin:
     """Handles interactions with IPFS and Filecoin"""
 
-    def __init__(self):
+    def __init__(self, base_url: str = _WEB3_STORAGE_BASE_URL):
         self.auth_header = {"Authorization": f"Bearer {config.WEB3_STORAGE_API_TOKEN}"}
+        self.upload_url = f"{base_url}/upload"
+        self.car_url = f"{base_url}/car"
+        self.status_url = f"{base_url}/status"
 
     def upload(self, file_path):
         """Uploads a file.
 
+        The file is streamed from disk, so memory use doesn't grow with its size.
+        Files larger than MAX_PART_SIZE are converted to a CAR with the IPFS
+        client and uploaded in parts, several at a time.
+
         Args:
             file_path: the full path to the file to upload
 
         Returns:
             cid of the uploaded file
+
+        Raises:
+            requests.exceptions.RequestException if an upload fails after retries
         """
-        files = {
-            "file": (
-                os.path.basename(file_path),
-                open(file_path, "rb"),
-                "application/octet-stream",
-            )
-        }
+        if os.path.getsize(file_path) > MAX_PART_SIZE:
+            return self._upload_file_as_car(file_path)
+
         # TODO: figure out what filename we want to give for the upload -- just the last part of the filename?
+        filename = os.path.basename(file_path)
         headers = {
             **self.auth_header,
-            "X-NAME": urllib.parse.quote(os.path.basename(file_path), ""),
+            "X-NAME": urllib.parse.quote(filename, ""),
         }
-        response = requests.post(_UPLOAD_URL, headers=headers, files=files)
-        # TODO: add error handling
-        return response.json()["cid"]
 
-    def get_status(self, cid):
+        def post():
+            body = _MultipartFileBody(file_path, filename, "application/octet-stream")
+            return requests.post(
+                self.upload_url,
+                headers={**headers, "Content-Type": body.content_type},
+                data=body,
+            )
+
+        return _with_retries(post, f"upload of {file_path}").json()["cid"]
+
+    def upload_car(self, car_stream, name=None):
+        """Uploads a CAR file, splitting it into parts of at most MAX_PART_SIZE.
+
+        Parts are cut on block boundaries and each carries the original header,
+        so web3.storage can reassemble the DAG. Up to PARALLEL_PARTS parts are
+        held in memory and uploaded at once.
+
+        Args:
+            car_stream: binary stream of a CARv1 file
+            name: optional name for the upload
+
+        Returns:
+            root cid of the uploaded CAR
+
+        Raises:
+            requests.exceptions.RequestException if a part fails after retries
+        """
+        headers = {**self.auth_header, "Content-Type": "application/car"}
+        if name is not None:
+            headers["X-NAME"] = urllib.parse.quote(name, "")
+
+        slots = threading.BoundedSemaphore(PARALLEL_PARTS)
+        futures = []
+        with ThreadPoolExecutor(max_workers=PARALLEL_PARTS) as executor:
+            for i, part in enumerate(car_parts(car_stream, MAX_PART_SIZE)):
+                slots.acquire()
+
+                def post(part=part):
+                    return requests.post(self.car_url, headers=headers, data=part)
+
+                future = executor.submit(_with_retries, post, f"upload of CAR part {i}")
+                future.add_done_callback(lambda _: slots.release())
+                futures.append(future)
+
+            cids = {future.result().json()["cid"] for future in futures}
+
+        if len(cids) != 1:
+            raise ValueError(f"CAR parts were stored with different root CIDs: {cids}")
+        return cids.pop()
+
+    def _upload_file_as_car(self, file_path):
+        """Converts a file into a CAR with the IPFS client and uploads it."""
+        proc = subprocess.run(
+            [
+                config.IPFS_CLIENT_PATH,
+                "add",
+                "--cid-version=1",
+                "--pin=false",
+                "-Q",
+                file_path,
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+        if proc.returncode != 0:
+            raise Exception(
+                f"'ipfs add' failed with code {proc.returncode} and output:\n\n{proc.stdout}"
+            )
+        cid = proc.stdout.strip()
+        try:
+            return self.upload_ipfs_dag(cid, os.path.basename(file_path))
+        finally:
+            # The file is added again if the upload is retried
+            self.remove_ipfs_dag(cid)
+
+    def upload_ipfs_dag(self, cid, name=None):
+        """Uploads a DAG from the local IPFS repo, streamed as a CAR.
+
+        Args:
+            cid: root CID of the DAG, which must be in the local IPFS repo
+            name: optional name for the upload
+
+        Returns:
+            root cid of the uploaded CAR
+        """
+        with subprocess.Popen(
+            [config.IPFS_CLIENT_PATH, "dag", "export", cid],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        ) as export:
+            uploaded_cid = self.upload_car(export.stdout, name=name)
+            stderr = export.stderr.read()
+        if export.returncode != 0:
+            raise Exception(
+                f"'ipfs dag export' failed with code {export.returncode} and output:\n\n{stderr.decode()}"
+            )
+        return uploaded_cid
+
+    @staticmethod
+    def remove_ipfs_dag(cid):
+        """Removes the blocks of a DAG from the local IPFS repo.
+
+        `ipfs add` copies what it adds into the repo, which would otherwise
+        keep a copy of everything uploaded. Blocks pinned for other content are
+        kept. Failures are only logged, as they leave the upload intact.
+
+        Args:
+            cid: root CID of the DAG
+        """
+        refs = subprocess.run(
+            [config.IPFS_CLIENT_PATH, "refs", "-r", "-u", cid],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        if refs.returncode != 0:
+            _logger.error(
+                f"'ipfs refs' of {cid} failed with code {refs.returncode}, its blocks are left in the IPFS repo:\n\n{refs.stderr}"
+            )
+            return
+        blocks = [cid] + refs.stdout.split()
+        for i in range(0, len(blocks), BLOCK_RM_BATCH_SIZE):
+            proc = subprocess.run(
+                [config.IPFS_CLIENT_PATH, "block", "rm", "--force", "-q"]
+                + blocks[i : i + BLOCK_RM_BATCH_SIZE],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+            )
+            if proc.returncode != 0:
+                _logger.warning(
+                    f"'ipfs block rm' of blocks of {cid} failed with code {proc.returncode}:\n\n{proc.stderr}"
+                )
+
+    def get_status(self, cid, session=None):
         """Gets Filecoin deals status for a CID
 
         Args:
             cid: the cid we want to check status for
+            session: optional requests session to send the request with
 
         Returns:
             Filecoin Piece ID, if there is one; None otherwise
+
+        Raises:
+            requests.exceptions.RequestException if the status request fails
         """
-        response = requests.get(f"{_STATUS_URL}/{cid}", headers=self.auth_header)
+        response = (session or requests).get(
+            f"{self.status_url}/{cid}", headers=self.auth_header
+        )
+        response.raise_for_status()
         status_json = response.json()
-        print(f"Status for CID {cid}: {status_json}")
+        _logger.debug(f"Status for CID {cid}: {status_json}")
         if len(status_json["deals"]) > 0:
             return status_json["deals"][0]["pieceCid"]
         else:
             return None
+
+
+class DealStatusTracker:
+    """Tracks Filecoin deal status for many CIDs, with a persistent cache.
+
+    Found deals are final and cached forever. CIDs without a deal yet are
+    cached for `pending_ttl` seconds before they are checked again. The cache is
+    a JSON file, usually stored next to the hash lists of a collection.
+    """
+
+    def __init__(
+        self,
+        cache_path: str,
+        filecoin: Filecoin = None,
+        pending_ttl: float = 6 * 60 * 60,
+        max_concurrency: int = 16,
+    ):
+        """
+        Args:
+            cache_path: path of the JSON cache file, created if it doesn't exist
+            filecoin: client used for status requests
+            pending_ttl: seconds before a CID without a deal is checked again
+            max_concurrency: maximum number of status requests in flight
+        """
+        self.cache_path = cache_path
+        self.filecoin = filecoin or Filecoin()
+        self.pending_ttl = pending_ttl
+        self.max_concurrency = max_concurrency
+        self.cache = {}
+        if os.path.exists(cache_path):
+            with open(cache_path, "r") as f:
+                self.cache = json.load(f)
+
+    def check(self, cids) -> dict:
+        """Gets the deal status of CIDs, only requesting unresolved ones.
+
+        Args:
+            cids: iterable of CIDs
+
+        Returns:
+            dictionary mapping each CID to its Filecoin Piece ID, or None if it has
+            no deal yet or its status couldn't be retrieved
+        """
+        cids = list(dict.fromkeys(cids))
+        now = time.time()
+        stale = [cid for cid in cids if not self._is_fresh(cid, now)]
+
+        if stale:
+            _logger.info(
+                f"Checking Filecoin deal status of {len(stale)} of {len(cids)} CIDs"
+            )
+            session = requests.Session()
+            session.mount(
+                self.filecoin.status_url,
+                requests.adapters.HTTPAdapter(pool_maxsize=self.max_concurrency),
+            )
+
+            def status(cid):
+                try:
+                    return cid, self.filecoin.get_status(cid, session)
+                except (requests.exceptions.RequestException, ValueError) as e:
+                    _logger.error(f"Filecoin status check of {cid} failed: {e}")
+                    return cid, e
+
+            with session, ThreadPoolExecutor(self.max_concurrency) as executor:
+                for cid, piece_cid in executor.map(status, stale):
+                    if not isinstance(piece_cid, Exception):
+                        self.cache[cid] = {"pieceCid": piece_cid, "checked": now}
+            self._save()
+
+        return {cid: self.cache.get(cid, {}).get("pieceCid") for cid in cids}
+
+    @staticmethod
+    def for_hash_list_dir(hash_list_dir: str, **kwargs):
+        """Makes a tracker whose cache is stored in a dir of hash lists."""
+        return DealStatusTracker(
+            os.path.join(hash_list_dir, DEAL_STATUS_CACHE), **kwargs
+        )
+
+    def check_hash_lists(self, hash_list_dir: str) -> dict:
+        """Gets the deal status of the encrypted archives in a dir of hash lists.
+
+        Returns:
+            dictionary mapping each encrypted archive CID to its Filecoin Piece ID
+        """
+        cids = []
+        with os.scandir(hash_list_dir) as entries:
+            for entry in entries:
+                if not (entry.name.endswith(".json") and len(entry.name) == 69):
+                    continue
+                with open(entry.path, "r") as f:
+                    cid = json.load(f).get("archiveEncrypted", {}).get("cid")
+                if cid:
+                    cids.append(cid)
+        return self.check(cids)
+
+    def _is_fresh(self, cid, now):
+        entry = self.cache.get(cid)
+        if entry is None:
+            return False
+        if entry["pieceCid"] is not None:
+            return True
+        return now - entry["checked"] < self.pending_ttl
+
+    def _save(self):
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.cache, f)
+        os.replace(tmp_path, self.cache_path)
+
+
+class _MultipartFileBody:
+    """A multipart/form-data body with one file, read from disk as it is sent.
+
+    Has a length, so requests sends a Content-Length instead of chunking.
+    """
+
+    def __init__(self, file_path, filename, content_type):
+        self.file_path = file_path
+        boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        self.head = (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode()
+        self.tail = f"\r\n--{boundary}--\r\n".encode()
+        self.length = len(self.head) + os.path.getsize(file_path) + len(self.tail)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        yield self.head
+        with open(self.file_path, "rb") as f:
+            for block in iter(lambda: f.read(BUFFER_SIZE), b""):
+                yield block
+        yield self.tail
+
+
+def _read_varint(stream):
+    """Reads an unsigned LEB128 varint, returning None at end of stream."""
+    value = 0
+    shift = 0
+    while True:
+        byte = stream.read(1)
+        if not byte:
+            if shift == 0:
+                return None
+            raise ValueError("CAR stream ended inside a varint")
+        value |= (byte[0] & 0x7F) << shift
+        if byte[0] & 0x80 == 0:
+            return value
+        shift += 7
+
+
+def _encode_varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _read_exactly(stream, length):
+    data = bytearray()
+    while len(data) < length:
+        chunk = stream.read(length - len(data))
+        if not chunk:
+            raise ValueError("CAR stream ended inside a section")
+        data += chunk
+    return bytes(data)
+
+
+def car_parts(car_stream, max_part_size):
+    """Splits a CARv1 stream into valid CARs of at most max_part_size bytes.
+
+    Every part repeats the header of the original CAR and holds a run of its
+    blocks. Only one part is held in memory at a time.
+
+    Args:
+        car_stream: binary stream of a CARv1 file
+        max_part_size: maximum size of each part in bytes; a single block larger
+            than this gets a part of its own
+
+    Yields:
+        each part as bytes
+    """
+    header_length = _read_varint(car_stream)
+    if header_length is None:
+        raise ValueError("CAR stream is empty")
+    header = _encode_varint(header_length) + _read_exactly(car_stream, header_length)
+
+    part = bytearray(header)
+    while True:
+        section_length = _read_varint(car_stream)
+        if section_length is None:
+            break
+        section = _encode_varint(section_length) + _read_exactly(
+            car_stream, section_length
+        )
+        if len(part) > len(header) and len(part) + len(section) > max_part_size:
+            yield bytes(part)
+            part = bytearray(header)
+        part += section
+    if len(part) > len(header):
+        yield bytes(part)
+
+
+def _with_retries(post, description):
+    """Calls `post` until it returns a successful response.
+
+    Server errors, rate limiting and connection errors are retried with
+    exponential backoff; other client errors are raised immediately.
+    """
+    for attempt in range(1, UPLOAD_ATTEMPTS + 1):
+        try:
+            response = post()
+            response.raise_for_status()
+            return response
+        except requests.exceptions.RequestException as e:
+            retryable = e.response is None or e.response.status_code >= 500
+            retryable = retryable or e.response.status_code == 429
+            if not retryable or attempt == UPLOAD_ATTEMPTS:
+                _logger.error(f"Filecoin {description} failed: {e}")
+                raise
+            delay = RETRY_BASE_DELAY * 2 ** (attempt - 1)
+            _logger.warning(
+                f"Filecoin {description} failed (attempt {attempt}), retrying in {delay}s: {e}"
+            )
+            time.sleep(delay)
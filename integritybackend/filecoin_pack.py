@@ -0,0 +1,223 @@
+from . import config
+from .asset_helper import AssetHelper
+from .file_util import FileUtil
+from .filecoin import Filecoin
+from .log_helper import LogHelper
+
+import json
+import os
+import subprocess
+import time
+
+_logger = LogHelper.getLogger()
+
+# Packs are filled with encrypted archives up to this many bytes
+DEFAULT_PACK_SIZE = 4 * 1024 * 1024 * 1024  # 4 GiB
+
+
+class ArchivePacker:
+    """Packs the encrypted archives of a collection into CARs for Filecoin.
+
+    Encrypted archives in the `action-archive` dir are grouped into packs of
+    about `target_size` bytes. Each pack is added to the local IPFS repo as one
+    directory, streamed out as a CAR and uploaded once, after which its blocks
+    are removed from the repo. The CID of each archive and of its pack are then
+    recorded in the archive's receipt:
+
+        "filecoin": {"cid": "<archive CID>", "packCid": "<pack CID>", "packId": "..."}
+
+    Progress is kept in a manifest per pack under `action-archive/packs`, so an
+    interrupted run resumes where it stopped and never packs an archive twice.
+    """
+
+    def __init__(
+        self,
+        org_id: str,
+        collection_id: str,
+        target_size: int = DEFAULT_PACK_SIZE,
+        filecoin: Filecoin = None,
+    ):
+        """
+        Args:
+            org_id: ID for the organization
+            collection_id: ID for the collection whose archives are packed
+            target_size: maximum total size of the archives in a pack, in bytes;
+                a larger archive gets a pack of its own
+            filecoin: client used for uploads
+        """
+        asset_helper = AssetHelper(org_id)
+        self.archive_dir = asset_helper.path_for_action(collection_id, "archive")
+        self.hash_list_dir = asset_helper.path_for_action_output(
+            collection_id, "archive"
+        )
+        self.pack_dir = os.path.join(self.archive_dir, "packs")
+        self.target_size = target_size
+        self.filecoin = filecoin or Filecoin()
+
+    def run(self) -> list[dict]:
+        """Finishes interrupted packs, then packs and uploads all new archives.
+
+        Returns:
+            the manifests of the packs completed by this run
+        """
+        os.makedirs(self.pack_dir, exist_ok=True)
+        manifests = self._manifests()
+        packed = {name for m in manifests for name in m["archives"]}
+
+        completed = []
+        for manifest in manifests:
+            if not manifest.get("receiptsUpdated"):
+                _logger.info(f"Resuming Filecoin pack {manifest['id']}")
+                completed.append(self._process(manifest))
+
+        for archives in self._group(self._unpacked_archives(packed)):
+            manifest = {
+                "id": f"{int(time.time() * 1000)}-{len(completed)}",
+                "archives": archives,
+            }
+            self._save(manifest)
+            completed.append(self._process(manifest))
+
+        return completed
+
+    def _unpacked_archives(self, packed: set) -> list[tuple[str, int]]:
+        archives = []
+        with os.scandir(self.archive_dir) as entries:
+            for entry in entries:
+                if (
+                    entry.is_file()
+                    and entry.name.endswith(".encrypted")
+                    and entry.name not in packed
+                ):
+                    archives.append((entry.name, entry.stat().st_size))
+        return sorted(archives)
+
+    def _group(self, archives: list[tuple[str, int]]):
+        """Yields lists of archive names whose sizes add up to at most target_size."""
+        pack, pack_size = [], 0
+        for name, size in archives:
+            if pack and pack_size + size > self.target_size:
+                yield pack
+                pack, pack_size = [], 0
+            pack.append(name)
+            pack_size += size
+        if pack:
+            yield pack
+
+    def _process(self, manifest: dict) -> dict:
+        if "packCid" not in manifest:
+            manifest["archiveCids"], manifest["packCid"] = self._ipfs_add(
+                manifest["archives"]
+            )
+            self._save(manifest)
+
+        if not manifest.get("uploaded"):
+            uploaded_cid = self.filecoin.upload_ipfs_dag(
+                manifest["packCid"], name=f"pack-{manifest['id']}"
+            )
+            if uploaded_cid != manifest["packCid"]:
+                raise ValueError(
+                    f"Pack {manifest['id']} was stored as {uploaded_cid}, expected {manifest['packCid']}"
+                )
+            manifest["uploaded"] = True
+            self._save(manifest)
+            _logger.info(
+                f"Filecoin pack {manifest['id']} of {len(manifest['archives'])} archives uploaded: {uploaded_cid}"
+            )
+
+        if not manifest.get("blocksRemoved"):
+            # The pack was copied into the IPFS repo only to be uploaded
+            self.filecoin.remove_ipfs_dag(manifest["packCid"])
+            manifest["blocksRemoved"] = True
+            self._save(manifest)
+
+        self._update_receipts(manifest)
+        manifest["receiptsUpdated"] = True
+        self._save(manifest)
+        return manifest
+
+    def _ipfs_add(self, archives: list[str]) -> tuple[dict, str]:
+        """Adds archives to the local IPFS repo as one directory.
+
+        Returns:
+            dictionary of archive name to CID, and the CID of the directory
+        """
+        proc = subprocess.run(
+            [
+                config.IPFS_CLIENT_PATH,
+                "add",
+                "--cid-version=1",
+                "--pin=false",
+                "--wrap-with-directory",
+            ]
+            + [os.path.join(self.archive_dir, name) for name in archives],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        if proc.returncode != 0:
+            raise Exception(
+                f"'ipfs add' failed with code {proc.returncode} and output:\n\n{proc.stderr}"
+            )
+
+        # Lines look like "added <cid> <name>"; the wrapping directory has no name
+        archive_cids, pack_cid = {}, None
+        for line in proc.stdout.splitlines():
+            parts = line.split(" ", 2)
+            if len(parts) < 2 or parts[0] != "added":
+                continue
+            if len(parts) == 2 or parts[2] == "":
+                pack_cid = parts[1]
+            else:
+                archive_cids[parts[2]] = parts[1]
+        missing = set(archives) - set(archive_cids)
+        if pack_cid is None or missing:
+            raise Exception(f"'ipfs add' output is missing CIDs: {proc.stdout}")
+        return archive_cids, pack_cid
+
+    def _update_receipts(self, manifest: dict):
+        """Records the archive and pack CIDs in the receipt of each archive."""
+        receipts = self._receipts_by_encrypted_sha()
+        for name in manifest["archives"]:
+            enc_zip_sha = os.path.splitext(name)[0]
+            receipt_path = receipts.get(enc_zip_sha)
+            if receipt_path is None:
+                _logger.error(f"No receipt found for packed archive {name}")
+                continue
+            record = {
+                "cid": manifest["archiveCids"][name],
+                "packCid": manifest["packCid"],
+                "packId": manifest["id"],
+            }
+
+            def update(receipt):
+                receipt["filecoin"] = record
+                return receipt
+
+            FileUtil.update_json(receipt_path, update)
+
+    def _receipts_by_encrypted_sha(self) -> dict:
+        receipts = {}
+        with os.scandir(self.hash_list_dir) as entries:
+            for entry in entries:
+                if not (entry.name.endswith(".json") and len(entry.name) == 69):
+                    continue
+                with open(entry.path, "r") as f:
+                    enc_zip_sha = json.load(f).get("archiveEncrypted", {}).get("sha256")
+                if enc_zip_sha:
+                    receipts[enc_zip_sha] = entry.path
+        return receipts
+
+    def _manifests(self) -> list[dict]:
+        manifests = []
+        for name in sorted(os.listdir(self.pack_dir)):
+            if name.endswith(".json"):
+                with open(os.path.join(self.pack_dir, name), "r") as f:
+                    manifests.append(json.load(f))
+        return manifests
+
+    def _save(self, manifest: dict):
+        path = os.path.join(self.pack_dir, f"{manifest['id']}.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(f"{path}.tmp", path)
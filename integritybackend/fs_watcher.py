@@ -1,30 +1,333 @@
-from . import config
+from . import config, metrics, rate_limit, scheduler, scratch, worker_pool
 from .actions import Actions
 from .asset_helper import AssetHelper
+from .ingest import Ingest
+from .leases import open_store
 from .log_helper import LogHelper
+from .polling import AdaptivePollingObserver
+from .processed_index import ProcessedIndex, missing_work, open_index, seed
+from .upload_hasher import UploadDigest, UploadHasher
+from .registration_outbox import RegistrationDispatcher, RegistrationOutbox
+from .worker_pool import WorkerPool
 
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 
 from watchdog.observers import Observer
+from watchdog.events import EVENT_TYPE_MOVED, FileDeletedEvent
 from watchdog.events import PatternMatchingEventHandler
 
+try:
+    from watchdog.observers.inotify import InotifyObserver
+    from watchdog.observers.inotify_c import Inotify, InotifyConstants
+except Exception:
+    # Not on Linux
+    InotifyObserver = None
+
+from fnmatch import fnmatch
+from typing import Optional
+import inspect
 import multiprocessing
+import os
+import threading
 import time
 import traceback
 
 _actions = Actions()
 _logger = LogHelper.getLogger()
 
+# Seconds new files must stay unchanged before they are processed, when the
+# observer can't tell that a file was closed
+DEFAULT_SETTLE_SECONDS = 10
+# Seconds between checks of files that are settling
+SETTLE_POLL_INTERVAL = 1
+# Seconds between checks for inotify queue overflows
+OVERFLOW_CHECK_INTERVAL = 1
+
+_overflows = 0
+_overflows_lock = threading.Lock()
+
+
+def overflow_count() -> int:
+    """Returns the number of times an inotify event queue of this process overflowed."""
+    with _overflows_lock:
+        return _overflows
+
+
+def _counting_overflows(parse_event_buffer):
+    def parse(event_buffer):
+        global _overflows
+        for wd, mask, cookie, name in parse_event_buffer(event_buffer):
+            if mask & InotifyConstants.IN_Q_OVERFLOW:
+                with _overflows_lock:
+                    _overflows += 1
+                _logger.warning("Inotify event queue overflowed, events were lost")
+            yield wd, mask, cookie, name
+
+    return staticmethod(parse)
+
+
+def _count_overflows(inotify_class) -> bool:
+    """Counts the inotify queue overflows seen by an inotify class of watchdog.
+
+    Watchdog skips the overflow event without telling anyone, since it isn't
+    for any watch, so it is counted as events are parsed. That relies on a
+    private method of watchdog, which is checked first.
+
+    Returns:
+        True if overflows are counted, False if the method isn't as expected
+    """
+    parse_event_buffer = inotify_class.__dict__.get("_parse_event_buffer")
+    if not isinstance(parse_event_buffer, staticmethod) or list(
+        inspect.signature(parse_event_buffer.__func__).parameters
+    ) != ["event_buffer"]:
+        _logger.warning(
+            "This version of watchdog doesn't parse inotify events as expected, so lost events aren't detected. Set RECONCILE_INTERVAL to find the files they were for"
+        )
+        return False
+    inotify_class._parse_event_buffer = _counting_overflows(parse_event_buffer.__func__)
+    return True
+
+
+COUNTING_OVERFLOWS = InotifyObserver is not None and _count_overflows(Inotify)
+
+
+def make_observer():
+    """Returns an observer of the platform's native file events.
+
+    On Linux, moves from or to outside the watched tree are reported as moves
+    with no source or destination path, rather than as created or deleted
+    files, so that files moved in can be told apart from files still being
+    written.
+    """
+    if InotifyObserver is not None:
+        return InotifyObserver(generate_full_events=True)
+    return Observer()
+
 
 @contextmanager
-def caught_and_logged_exceptions(event):
-    """Helper for fiile handlers to catch and log any exceptions."""
+def caught_and_logged_exceptions(description, path):
+    """Helper for file handlers to catch and log any exceptions."""
     try:
         yield
     except Exception as err:
         print(traceback.format_exc())
-        _logger.error(f"Processing of event {event} errored with: {err}")
-        _logger.error(f"Filepath was {event.src_path}")
+        _logger.error(f"Processing of {description} errored with: {err}")
+        _logger.error(f"Filepath was {path}")
+
+
+def run_action(
+    action: str,
+    zip_path: str,
+    org_config: dict,
+    collection_id: str,
+    ingest: Ingest = None,
+):
+    """Runs an action on an input file, catching and logging any exceptions.
+
+    Returns:
+        True if the action completed, False if it errored
+    """
+    start = time.perf_counter()
+    completed = False
+    with caught_and_logged_exceptions(f"{action} job", zip_path):
+        if action == "archive":
+            _actions.archive(zip_path, org_config["id"], collection_id, ingest)
+        elif action == "c2pa-proofmode":
+            _actions.c2pa_proofmode(zip_path, org_config, collection_id, ingest)
+        elif action == "copy-proofmode":
+            _actions.copy_proofmode(zip_path, org_config, collection_id, ingest)
+        elif action == "c2pa-starling-capture":
+            _actions.c2pa_starling_capture(zip_path, org_config, collection_id, ingest)
+        else:
+            raise ValueError(f"Unknown action {action}")
+        completed = True
+    record_action(action, zip_path, completed, time.perf_counter() - start)
+    return completed
+
+
+def record_action(action: str, zip_path: str, completed: bool, seconds: float):
+    """Records the outcome and duration of an action, and the bytes it processed."""
+    outcome = "completed" if completed else "errored"
+    metrics.inc(metrics.ACTIONS_TOTAL, action=action, outcome=outcome)
+    metrics.observe(metrics.ACTION_SECONDS, seconds, action=action, outcome=outcome)
+    if completed:
+        try:
+            size = os.path.getsize(zip_path)
+        except OSError:
+            return
+        metrics.inc(metrics.BYTES_PROCESSED_TOTAL, size, action=action)
+
+
+def process_input(
+    zip_path: str,
+    org_config: dict,
+    collection_id: str,
+    action_names: list[str],
+    job_class: str = scheduler.LIVE,
+    upload_digest: UploadDigest = None,
+):
+    """Ingests an input file once and runs all the collection's actions on it.
+
+    This is the job that the collection handler queues in its worker pool. The
+    actions run in parallel and share the ingested files, which are removed
+    once every action is done. Actions that complete are recorded in the
+    collection's processed-input index, and are skipped if the same input is
+    queued again.
+
+    Inputs whose content was already archived from another input aren't
+    archived again: their hash list is linked to the first input's. Their
+    other actions run as usual.
+
+    The job waits for the scratch space it needs and for a slot of the
+    scheduler, if they are in use. It then ingests the file and runs the
+    actions in the shared process pool, if one is in use.
+
+    When several nodes share the asset store, the node that takes the lease on
+    the input processes it, and the others skip it.
+
+    Args:
+        zip_path: path to the input file
+        org_config: the organization's indexed configuration
+        collection_id: the collection the input is in
+        action_names: names of the actions to run
+        job_class: the scheduler job class, LIVE or BACKFILL
+        upload_digest: the SHA-256 of the input computed while it was written,
+            if it was
+    """
+    asset_helper = AssetHelper(org_config["id"])
+    index = open_index(asset_helper.path_for_processed_index(collection_id))
+    input_sha = os.path.splitext(os.path.basename(zip_path))[0]
+    done = index.completed_actions(input_sha)
+    action_names = [action for action in action_names if action not in done]
+    if not action_names:
+        _logger.info(f"All actions already completed on {zip_path}, skipping")
+        return
+
+    need = None
+    with caught_and_logged_exceptions("scratch space estimate", zip_path):
+        need = scratch.estimate(zip_path, action_names)
+    if need is None:
+        return
+
+    # Space is reserved once the job can run, so that jobs waiting for a slot
+    # don't hold space that running jobs need
+    with scheduler.slot(org_config["id"], job_class), scratch.reservation(need):
+        leases = open_store(asset_helper.path_for_leases())
+        key = f"input/{collection_id}/{input_sha}"
+        lease = leases.acquire(key)
+        if lease is None:
+            _logger.info(
+                f"{zip_path} is being processed by {leases.holder(key)}, skipping"
+            )
+            return
+        with lease, metrics.in_flight(metrics.JOBS_IN_FLIGHT, org=org_config["id"]):
+            # Another node may have completed actions before the lease was taken
+            done = index.completed_actions(input_sha, use_filter=False)
+            action_names = [action for action in action_names if action not in done]
+            if not action_names:
+                _logger.info(f"All actions already completed on {zip_path}, skipping")
+                return
+            worker_pool.run_job(
+                _ingest_and_run,
+                zip_path,
+                org_config,
+                collection_id,
+                action_names,
+                upload_digest,
+            )
+
+
+def _ingest_and_run(
+    zip_path: str,
+    org_config: dict,
+    collection_id: str,
+    action_names: list[str],
+    upload_digest: UploadDigest = None,
+):
+    asset_helper = AssetHelper(org_config["id"])
+    index = open_index(asset_helper.path_for_processed_index(collection_id))
+    input_sha = os.path.splitext(os.path.basename(zip_path))[0]
+    ingest = None
+    with caught_and_logged_exceptions("ingest", zip_path):
+        ingest = Ingest.create(
+            zip_path, asset_helper.path_for_ingest(collection_id), upload_digest
+        )
+    if ingest is None:
+        return
+
+    try:
+        completed = []
+        original_input_sha = _archived_duplicate_of(index, ingest, action_names)
+        if original_input_sha is not None:
+            if _link_duplicate(zip_path, org_config, collection_id, original_input_sha):
+                completed.append("archive")
+            action_names = [action for action in action_names if action != "archive"]
+
+        if action_names:
+            with ThreadPoolExecutor(
+                len(action_names), thread_name_prefix=f"{collection_id}_actions"
+            ) as executor:
+                futures = {
+                    action: executor.submit(
+                        run_action, action, zip_path, org_config, collection_id, ingest
+                    )
+                    for action in action_names
+                }
+            completed += [
+                action for action, future in futures.items() if future.result()
+            ]
+        _claim_archived_content(index, ingest, completed)
+    finally:
+        ingest.cleanup()
+
+    with caught_and_logged_exceptions("processed-input index update", zip_path):
+        index.mark_completed(input_sha, completed)
+
+
+def _archived_duplicate_of(
+    index: ProcessedIndex, ingest: Ingest, action_names: list[str]
+) -> Optional[str]:
+    """Returns the input that an input's content was already archived from, if any.
+
+    Only the archive is shared with inputs repeating the same content; the
+    other actions run on every input.
+    """
+    if "archive" not in action_names or ingest.content_sha is None:
+        return None
+    original_input_sha = index.content_owner(ingest.content_sha)
+    if original_input_sha == ingest.input_sha:
+        return None
+    return original_input_sha
+
+
+def _claim_archived_content(
+    index: ProcessedIndex, ingest: Ingest, completed: list[str]
+):
+    """Records an input's content as archived, once its archive succeeded."""
+    if "archive" not in completed or ingest.content_sha is None:
+        return
+    with caught_and_logged_exceptions("content claim", ingest.zip_path):
+        index.claim_content(ingest.content_sha, ingest.input_sha)
+
+
+def _link_duplicate(
+    zip_path: str, org_config: dict, collection_id: str, original_input_sha: str
+) -> bool:
+    """Links the archive of an input whose content was already archived from another input.
+
+    Returns:
+        True if the hash list was linked, False if it errored
+    """
+    _logger.info(
+        f"Content of {zip_path} duplicates input {original_input_sha}, not archiving it again"
+    )
+    with caught_and_logged_exceptions("duplicate archive", zip_path):
+        _actions.link_duplicate_archive(
+            zip_path, org_config["id"], collection_id, original_input_sha
+        )
+        return True
+    return False
 
 
 class FsWatcher:
@@ -35,20 +338,59 @@ class FsWatcher:
         self.collection_id = collection_id
         self.organization_id = org_config.get("id")
         self.asset_helper = AssetHelper(self.organization_id)
-        self.observer = Observer()
+        self.observer = make_observer()
+        # Observers of the collections whose input directories are polled
+        self.polling_observers = []
+        self.pools = {}
+        self.handlers = {}
 
     @staticmethod
-    def start(org_config: dict):
+    def start(
+        org_config: dict,
+        job_scheduler=None,
+        process_pool=None,
+        scratch_space=None,
+        rate_limiter=None,
+    ):
+        """Watches an organization's directories until interrupted.
+
+        Args:
+            org_config: the organization's indexed configuration
+            job_scheduler: the scheduler that jobs take slots from, usually a
+                proxy for the one shared by all organizations; None to run jobs
+                as soon as a worker is free
+            process_pool: the process pool that jobs run in, usually a proxy
+                for the one shared by all organizations; None to run jobs in
+                the collection's worker pool
+            scratch_space: the scratch space that jobs reserve room in, usually
+                a proxy for the one shared by all organizations; None to run
+                jobs without reserving room
+            rate_limiter: the rate limiter of registrations, usually a proxy
+                for the one shared by all organizations; None to limit the
+                organization's registrations on their own
+        """
+        scheduler.use(job_scheduler)
+        scratch.use(scratch_space)
+        rate_limit.use(rate_limiter)
+        worker_pool.use_process_pool(process_pool)
         FsWatcher(org_config).watch()
 
     @staticmethod
     def init_all(
         all_org_config: config.OrganizationConfig = config.ORGANIZATION_CONFIG,
+        job_scheduler=None,
+        process_pool=None,
+        scratch_space=None,
+        rate_limiter=None,
     ) -> list[multiprocessing.Process]:
         """Initialize file watcher processes for the given configuration.
 
         Args:
             org_config: configuration for all organizations and their actions
+            job_scheduler: the scheduler shared by all processes, see `start`
+            process_pool: the process pool shared by all processes, see `start`
+            scratch_space: the scratch space shared by all processes, see `start`
+            rate_limiter: the rate limiter shared by all processes, see `start`
 
         Returns:
             list of un-started processes containing FsWatcher instances
@@ -59,55 +401,232 @@ class FsWatcher:
                 multiprocessing.Process(
                     name=f"fs_watcher_{org_id}",
                     target=FsWatcher.start,
-                    args=(org_config,),
+                    args=(
+                        org_config,
+                        job_scheduler,
+                        process_pool,
+                        scratch_space,
+                        rate_limiter,
+                    ),
                 )
             )
         return procs
 
     def watch(self):
         """Start file watching handlers."""
+        self.schedule_collections()
+        self.seed_indexes()
+        # Unless the rate limiter shared by all organizations is in use
+        rate_limit.configure(self.org_config.get("rate_limits"))
+        self.start_dispatcher()
+        observers = [self.observer, *self.polling_observers]
+        for observer in observers:
+            observer.start()
+        self.start_reconcile()
+        self.start_overflow_monitor()
+
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            for observer in observers:
+                observer.stop()
+            _logger.warning("Caught keyboard interrupt. Stopping FsWatcher.")
+        for observer in observers:
+            observer.join()
+        for pool in self.pools.values():
+            pool.shutdown()
+
+    def schedule_collections(self):
+        """Makes the worker pool and the observer handler of each collection."""
+        for collection_id, collection_config in self.org_config.get(
+            "collections", {}
+        ).items():
+            # One watcher per collection: each input file is ingested once
+            # and dispatched to all the collection's actions
+            self.pools[collection_id] = self._make_pool(
+                collection_id, collection_config.get("conf", {})
+            )
+            self._schedule(
+                collection_id,
+                list(collection_config.get("actions", {}).keys()),
+                ["*.zip"],
+                self.asset_helper.path_for_input(collection_id),
+                collection_config.get("conf", {}).get(
+                    "input_settle_seconds", DEFAULT_SETTLE_SECONDS
+                ),
+                collection_config.get("conf", {}).get("watcher", {}),
+            )
+
+    def seed_indexes(self):
+        """Seeds the processed-input indexes that are new; see `processed_index.seed`.
+
+        Must be called before the observers start.
+        """
         for collection_id, collection_config in self.org_config.get(
             "collections", {}
         ).items():
-            # When all actions are harmonized to watch the input directory and
-            # *.zip patterns, it might make sense to refactor the watchers to
-            # have one watcher per collection. This watcher would watch the input folder
-            # and dispatch the file for processing in parallel by all the
-            # configured actions for the collection.
-            for action_name in collection_config.get("actions", {}).keys():
-                self._schedule(
-                    collection_id,
-                    action_name,
-                    ["*.zip"],
+            action_names = list(collection_config.get("actions", {}).keys())
+            if not action_names:
+                continue
+            hash_list_dir = None
+            if "archive" in action_names:
+                hash_list_dir = self.asset_helper.path_for_action_output(
+                    collection_id, "archive"
+                )
+            with caught_and_logged_exceptions(
+                "processed-input index seeding",
+                self.asset_helper.path_for_input(collection_id),
+            ):
+                seed(
                     self.asset_helper.path_for_input(collection_id),
+                    open_index(
+                        self.asset_helper.path_for_processed_index(collection_id)
+                    ),
+                    hash_list_dir,
                 )
 
-        self.observer.start()
-        try:
+    def start_dispatcher(self) -> RegistrationDispatcher:
+        """Starts sending the blockchain registrations queued by actions in the background."""
+        dispatcher = RegistrationDispatcher(
+            RegistrationOutbox(self.asset_helper.path_for_registration_outbox()),
+            org_id=self.organization_id,
+            leases=open_store(self.asset_helper.path_for_leases()),
+        )
+        dispatcher.start()
+        return dispatcher
+
+    def start_reconcile(self):
+        """Starts reconciling in the background.
+
+        Inputs that arrived while the service was down get no file events.
+        """
+        threading.Thread(
+            target=self._run_reconcile,
+            name=f"{self.organization_id}_reconcile",
+            daemon=True,
+        ).start()
+
+    def start_overflow_monitor(self):
+        """Starts rescanning the input directories whenever events are lost.
+
+        When files arrive faster than they are read, the inotify event queue
+        overflows and the kernel drops events. The files they were for are
+        found by scanning the input directories again.
+        """
+        if not COUNTING_OVERFLOWS:
+            return
+        threading.Thread(
+            target=self._run_overflow_monitor,
+            name=f"{self.organization_id}_overflow_monitor",
+            daemon=True,
+        ).start()
+
+    def _run_overflow_monitor(self):
+        seen = overflow_count()
+        while True:
+            time.sleep(OVERFLOW_CHECK_INTERVAL)
+            count = overflow_count()
+            if count != seen:
+                seen = count
+                _logger.warning(
+                    f"Rescanning input directories of {self.organization_id} after lost events"
+                )
+                self.reconcile(scheduler.LIVE)
+
+    def _make_pool(self, collection_id: str, conf: dict):
+        return WorkerPool.from_config(f"{self.organization_id}_{collection_id}", conf)
+
+    def _make_handler(self, patterns: list[str]):
+        return CollectionHandler(patterns=patterns)
+
+    def _run_reconcile(self):
+        """Reconciles on startup, then every RECONCILE_INTERVAL seconds if set.
+
+        Reconciling periodically picks up inputs left unfinished by other
+        nodes that died.
+        """
+        self.reconcile()
+        if config.RECONCILE_INTERVAL:
             while True:
-                time.sleep(1)
-        except KeyboardInterrupt:
-            self.observer.stop()
-            _logger.warning("Caught keyboard interrupt. Stopping FsWatcher.")
-        self.observer.join()
+                time.sleep(float(config.RECONCILE_INTERVAL))
+                self.reconcile()
+
+    def reconcile(self, job_class: str = scheduler.BACKFILL):
+        """Queues the actions that haven't completed on inputs already in the input dirs.
+
+        Args:
+            job_class: the scheduler job class of the queued inputs
+        """
+        for collection_id, collection_config in self.org_config.get(
+            "collections", {}
+        ).items():
+            action_names = list(collection_config.get("actions", {}).keys())
+            if not action_names:
+                continue
+            with caught_and_logged_exceptions(
+                "startup reconciliation",
+                self.asset_helper.path_for_input(collection_id),
+            ):
+                index = open_index(
+                    self.asset_helper.path_for_processed_index(collection_id)
+                )
+                missing = missing_work(
+                    self.asset_helper.path_for_input(collection_id), index, action_names
+                )
+                _logger.info(
+                    f"Reconciliation found {len(missing)} inputs with missing work in collection {collection_id}"
+                )
+                for zip_path, todo in missing:
+                    self.handlers[collection_id].queue_input(zip_path, todo, job_class)
 
     def _schedule(
-        self, collection_id: str, action: str, patterns: list[str], path: str
+        self,
+        collection_id: str,
+        action_names: list[str],
+        patterns: list[str],
+        path: str,
+        settle_seconds: float,
+        watcher_conf: dict = None,
     ):
-        handler_class = ACTION_HANDLER.get(action)
-        if handler_class is None:
-            raise ValueError(f"Could not find handler class for action {action}")
+        for action in action_names:
+            if action not in ACTIONS:
+                raise ValueError(f"Unknown action {action}")
+        if not action_names:
+            _logger.info(f"No actions configured for collection {collection_id}")
+            return
+
+        watcher_conf = watcher_conf or {}
+        mode = watcher_conf.get("mode", "native")
+        if mode == "polling":
+            # Network mounts get no events for changes made by other clients
+            observer = AdaptivePollingObserver.from_config(watcher_conf)
+            self.polling_observers.append(observer)
+        elif mode == "native":
+            observer = self.observer
+        else:
+            raise ValueError(f"Unknown watcher mode {mode}")
+
+        if _emits_close_events(observer):
+            # Inputs are processed once their writer closes them
+            settle_seconds = None
 
         _logger.info(
-            f"Scheduling handler {handler_class.__name__} for path {path} and patterns {patterns}"
+            f"Scheduling {mode} handler for actions {action_names} on path {path} and patterns {patterns}"
         )
-        self.observer.schedule(
-            handler_class(patterns=patterns).with_config(
-                self.org_config, collection_id
-            ),
-            recursive=True,
-            path=path,
+        upload_hasher = None
+        if watcher_conf.get("hash_while_writing"):
+            upload_hasher = UploadHasher(f"{collection_id}_upload_hasher")
+        handler = self._make_handler(patterns).with_config(
+            self.org_config,
+            collection_id,
+            action_names,
+            self.pools[collection_id],
+            settle_seconds,
+            upload_hasher,
         )
+        self.handlers[collection_id] = handler
+        observer.schedule(handler, recursive=True, path=path)
 
 
 class OrganizationHandler(PatternMatchingEventHandler):
@@ -129,44 +648,310 @@ class OrganizationHandler(PatternMatchingEventHandler):
         return self
 
 
-class ArchiveHandler(OrganizationHandler):
-    """Handles file changes for Archive action."""
-
-    def on_created(self, event):
-        with caught_and_logged_exceptions(event):
-            _actions.archive(event.src_path, self.organization_id, self.collection_id)
-
-
-class C2paProofmodeHandler(OrganizationHandler):
-    """Handles file changes for C2PA Proofmode action."""
+class CollectionHandler(OrganizationHandler):
+    """Handles new input files for all the actions of a collection.
+
+    A file is processed once it is complete: when the writer closes it
+    (IN_CLOSE_WRITE) or when it is moved into the input directory
+    (IN_MOVED_TO). Observers that don't report closed files, like those for
+    network mounts, are handled by waiting for new files to stop changing in
+    size and modification time for `settle_seconds`.
+
+    Events are coalesced per path, so a file is queued only once while it is
+    being processed, however many events it gets. Files waiting to be queued
+    in the worker pool are kept in a pending set, in arrival order, and a
+    feeder thread queues them in batches. Events are thus handled quickly
+    even while the pool is full, so bursts of files don't make the observer
+    fall behind and lose events.
+    """
+
+    def with_config(
+        self,
+        org_config: dict,
+        collection_id: str,
+        action_names: list[str],
+        pool: WorkerPool = None,
+        settle_seconds: float = None,
+        upload_hasher: UploadHasher = None,
+    ):
+        """Sets the configuration for this handler.
 
-    def on_created(self, event):
-        with caught_and_logged_exceptions(event):
-            _actions.c2pa_proofmode(event.src_path, self.org_config, self.collection_id)
+        Args:
+            org_config: a dictionary containing the indexed configuration for this organization
+            collection_id: id for the collection this handler is watching for
+            action_names: names of the actions run on each new file
+            pool: the worker pool that runs this handler's jobs; jobs run in
+                the watcher thread if None
+            settle_seconds: how long new files must stay unchanged before they
+                are processed; None to wait for files to be closed instead
+            upload_hasher: hasher of new files as they are written, so they
+                don't have to be read again to verify their SHA-256; None to
+                hash files once complete
 
+        Returns:
+            the handler itself
+        """
+        super().with_config(org_config, collection_id)
+        self.action_names = action_names
+        self.pool = pool
+        self.settle_seconds = settle_seconds
+        self.upload_hasher = upload_hasher
+        self.index_path = AssetHelper(self.organization_id).path_for_processed_index(
+            collection_id
+        )
+        self._lock = threading.Lock()
+        # Paths queued or being processed
+        self._in_flight = set()
+        # Paths waiting to be queued in the pool, with their action names and job class
+        self._pending = {}
+        self._feeder = None
+        # Paths waiting to settle, with their last (size, mtime) and when it changed
+        self._settling = {}
+        self._settler = None
+        return self
 
-class CopyProofmodeHandler(OrganizationHandler):
-    """Handles file changes for Copy Proofmode action."""
+    def dispatch(self, event):
+        if event.event_type == EVENT_TYPE_MOVED and event.dest_path is None:
+            # Moved out of the watched tree
+            if not event.is_directory:
+                super().dispatch(FileDeletedEvent(event.src_path))
+            return
+        if event.event_type == EVENT_TYPE_MOVED and event.is_directory:
+            # The files of a directory moved in only get created events
+            if event.src_path is None:
+                self._queue_tree(event.dest_path)
+            return
+        super().dispatch(event)
+
+    def _queue_tree(self, path: str):
+        for root, _, names in os.walk(path):
+            for name in names:
+                zip_path = os.path.join(root, name)
+                if any(fnmatch(zip_path, pattern) for pattern in self.patterns):
+                    self.queue_input(zip_path)
 
     def on_created(self, event):
-        with caught_and_logged_exceptions(event):
-            _actions.copy_proofmode(event.src_path, self.org_config, self.collection_id)
-
-
-class C2paStarlingCaptureHandler(OrganizationHandler):
-    """Handles file changes for C2PA Starling Capture action."""
+        if self.upload_hasher is not None:
+            self.upload_hasher.update(event.src_path)
+        if self.settle_seconds is not None:
+            self._settle(event.src_path)
+
+    def on_modified(self, event):
+        if self.upload_hasher is not None:
+            self.upload_hasher.update(event.src_path)
+        if self.settle_seconds is not None:
+            self._settle(event.src_path)
+
+    def on_deleted(self, event):
+        if self.upload_hasher is not None:
+            self.upload_hasher.discard(event.src_path)
+
+    def on_closed(self, event):
+        self.queue_input(event.src_path)
+
+    def on_moved(self, event):
+        # Moves out of the input dir or to a non-matching name are ignored
+        if any(fnmatch(event.dest_path, pattern) for pattern in self.patterns):
+            self.queue_input(event.dest_path)
+
+    def queue_input(
+        self,
+        zip_path: str,
+        action_names: list[str] = None,
+        job_class: str = scheduler.LIVE,
+    ):
+        """Queues a complete input file for processing, unless it already is.
 
-    def on_created(self, event):
-        with caught_and_logged_exceptions(event):
-            _actions.c2pa_starling_capture(
-                event.src_path, self.org_config, self.collection_id
+        Args:
+            zip_path: path to the input file
+            action_names: names of the actions to run; all of the collection's
+                actions if None
+            job_class: the scheduler job class, LIVE for new files or BACKFILL
+                for files found by reconciliation
+        """
+        if self.pool is not None:
+            self._add_pending(zip_path, action_names, job_class)
+            return
+
+        # Re-dropped inputs are skipped without running a job
+        input_sha = os.path.splitext(os.path.basename(zip_path))[0]
+        done = open_index(self.index_path).completed_actions(input_sha)
+        action_names = [
+            action for action in action_names or self.action_names if action not in done
+        ]
+        with self._lock:
+            self._settling.pop(zip_path, None)
+            if not action_names:
+                _logger.info(f"All actions already completed on {zip_path}, skipping")
+                return
+            if zip_path in self._in_flight:
+                _logger.debug(f"Already queued, ignoring event for {zip_path}")
+                return
+            self._in_flight.add(zip_path)
+        try:
+            self._job()(
+                zip_path,
+                self.org_config,
+                self.collection_id,
+                action_names,
+                job_class,
+                self._upload_digest(zip_path),
             )
-
-
-# Mapping from action name to handler class
-ACTION_HANDLER = {
-    "archive": ArchiveHandler,
-    "c2pa-proofmode": C2paProofmodeHandler,
-    "copy-proofmode": CopyProofmodeHandler,
-    "c2pa-starling-capture": C2paStarlingCaptureHandler,
-}
+        finally:
+            self._done(zip_path)
+
+    def _add_pending(self, zip_path: str, action_names: list[str], job_class: str):
+        with self._lock:
+            self._settling.pop(zip_path, None)
+            if zip_path in self._in_flight:
+                _logger.debug(f"Already queued, ignoring event for {zip_path}")
+                return
+            if zip_path in self._pending:
+                # Merged with the pending request, which runs as soon as either would
+                pending_actions, pending_class = self._pending[zip_path]
+                if pending_actions is not None and action_names is not None:
+                    action_names = list(dict.fromkeys(pending_actions + action_names))
+                else:
+                    action_names = None
+                if pending_class == scheduler.LIVE:
+                    job_class = scheduler.LIVE
+            self._pending[zip_path] = (action_names, job_class)
+            if self._feeder is None:
+                self._feeder = threading.Thread(
+                    target=self._run_feeder,
+                    name=f"{self.collection_id}_feeder",
+                    daemon=True,
+                )
+                self._feeder.start()
+
+    def _run_feeder(self):
+        """Queues pending files in the worker pool until there are none left."""
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._feeder = None
+                    return
+                batch, self._pending = self._pending, {}
+                self._in_flight.update(batch)
+
+            # Re-dropped inputs are skipped without queueing a job
+            completed = {}
+            with caught_and_logged_exceptions(
+                "processed-input lookup", self.index_path
+            ):
+                completed = open_index(self.index_path).completed_many(
+                    [
+                        os.path.splitext(os.path.basename(zip_path))[0]
+                        for zip_path in batch
+                    ]
+                )
+            for zip_path, (action_names, job_class) in batch.items():
+                input_sha = os.path.splitext(os.path.basename(zip_path))[0]
+                done = completed.get(input_sha, set())
+                action_names = [
+                    action
+                    for action in action_names or self.action_names
+                    if action not in done
+                ]
+                if not action_names:
+                    self._done(zip_path)
+                    _logger.info(
+                        f"All actions already completed on {zip_path}, skipping"
+                    )
+                    continue
+                self._submit(zip_path, action_names, job_class)
+
+    def _submit(self, zip_path: str, action_names: list[str], job_class: str):
+        future = None
+        with caught_and_logged_exceptions("queueing of input", zip_path):
+            # Waits while the pool's queue is full
+            future = self.pool.submit(
+                self._job(),
+                zip_path,
+                self.org_config,
+                self.collection_id,
+                action_names,
+                job_class,
+                self._upload_digest(zip_path),
+            )
+        if future is None:
+            self._done(zip_path)
+        else:
+            future.add_done_callback(lambda _: self._done(zip_path))
+
+    def _upload_digest(self, zip_path: str) -> UploadDigest:
+        if self.upload_hasher is None:
+            return None
+        return self.upload_hasher.finish(zip_path)
+
+    def _job(self):
+        """Returns the function that processes an input, called with its queued arguments."""
+        return process_input
+
+    def _done(self, zip_path: str):
+        with self._lock:
+            self._in_flight.discard(zip_path)
+
+    def _settle(self, zip_path: str):
+        with self._lock:
+            if (
+                zip_path in self._in_flight
+                or zip_path in self._pending
+                or zip_path in self._settling
+            ):
+                return
+            self._settling[zip_path] = (None, time.monotonic())
+            if self._settler is None:
+                self._settler = threading.Thread(
+                    target=self._run_settler,
+                    name=f"{self.collection_id}_settler",
+                    daemon=True,
+                )
+                self._settler.start()
+
+    def _run_settler(self):
+        """Dispatches files that haven't changed for settle_seconds."""
+        while True:
+            time.sleep(min(self.settle_seconds, SETTLE_POLL_INTERVAL))
+            with self._lock:
+                if not self._settling:
+                    self._settler = None
+                    return
+                settling = dict(self._settling)
+            # Files are checked without the lock, so that slow stats on network
+            # file systems don't hold up event dispatch
+            now = time.monotonic()
+            stats = {}
+            for zip_path in settling:
+                try:
+                    stat = os.stat(zip_path)
+                    stats[zip_path] = (stat.st_size, stat.st_mtime_ns)
+                except FileNotFoundError:
+                    stats[zip_path] = None
+            ready = []
+            with self._lock:
+                for zip_path, (last, since) in settling.items():
+                    # Unless the file was queued or seen again meanwhile
+                    if self._settling.get(zip_path) != (last, since):
+                        continue
+                    current = stats[zip_path]
+                    if current is None:
+                        del self._settling[zip_path]
+                    elif current != last:
+                        self._settling[zip_path] = (current, now)
+                    elif now - since >= self.settle_seconds:
+                        ready.append(zip_path)
+            for zip_path in ready:
+                with caught_and_logged_exceptions(
+                    "queueing of settled input", zip_path
+                ):
+                    self.queue_input(zip_path)
+
+
+def _emits_close_events(observer) -> bool:
+    """Whether the observer reports files being closed after writing."""
+    return InotifyObserver is not None and isinstance(observer, InotifyObserver)
+
+
+# Names of the actions that can be configured for a collection
+ACTIONS = ("archive", "c2pa-proofmode", "copy-proofmode", "c2pa-starling-capture")
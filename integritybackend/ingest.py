@@ -0,0 +1,134 @@
+from . import metrics
+from .file_util import FileUtil
+from .log_helper import LogHelper
+from .upload_hasher import UploadDigest
+
+from hashlib import sha256
+import os
+import shutil
+import stat
+import zipfile
+
+_file_util = FileUtil()
+_logger = LogHelper.getLogger()
+
+BUFFER_SIZE = 1024 * 1024
+
+
+class Ingest:
+    """An input ZIP that has been verified and extracted once.
+
+    The collection watcher ingests each new ZIP a single time and hands the
+    result to every action of the collection. The extracted files are shared by
+    all those actions, so they are made read-only: actions that change a file
+    must copy it into their own job directory first.
+
+    Attributes:
+        zip_path: path to the input ZIP
+        input_sha: SHA-256 of the input ZIP, verified against its file name
+        listing: member paths of the ZIP, in ZIP order
+        dir: directory the members were extracted to
+        hashes: dictionary of member path to the SHA-256 of its contents
+    """
+
+    def __init__(
+        self, zip_path: str, input_sha: str, listing: list[str], dir: str, hashes: dict
+    ):
+        self.zip_path = zip_path
+        self.input_sha = input_sha
+        self.listing = listing
+        self.dir = dir
+        self.hashes = hashes
+
+    @staticmethod
+    def create(
+        zip_path: str, ingest_root: str, upload_digest: UploadDigest = None
+    ) -> "Ingest":
+        """Verifies an input ZIP and extracts all its files.
+
+        Args:
+            zip_path: path to the input ZIP, named after its SHA-256
+            ingest_root: directory under which a directory for this ZIP is made
+            upload_digest: the SHA-256 of the ZIP computed while it was
+                written; used instead of reading the ZIP again if the ZIP is
+                unchanged since and the SHA-256 matches its name
+
+        Returns:
+            the ingested ZIP
+
+        Raises:
+            Exception if the ZIP does not match its name or has unsafe paths
+        """
+        input_sha = os.path.splitext(os.path.basename(zip_path))[0]
+        if (
+            upload_digest is not None
+            and upload_digest.sha256 == input_sha
+            and upload_digest.matches(zip_path)
+        ):
+            _logger.debug(f"SHA-256 of {zip_path} was verified while it was written")
+        else:
+            with metrics.timed(metrics.STAGE_SECONDS, action="ingest", stage="verify"):
+                digest = _file_util.digest_sha256(zip_path)
+            if input_sha != digest:
+                raise Exception(f"SHA-256 of ZIP does not match file name: {zip_path}")
+
+        out_dir = os.path.join(ingest_root, f"{input_sha}-{_file_util.generate_uuid()}")
+        _file_util.create_dir(out_dir)
+        try:
+            with metrics.timed(metrics.STAGE_SECONDS, action="ingest", stage="extract"):
+                listing, hashes = Ingest._extract(zip_path, out_dir)
+        except BaseException:
+            shutil.rmtree(out_dir, ignore_errors=True)
+            raise
+
+        _logger.info(f"Ingested {zip_path} with {len(listing)} files into {out_dir}")
+        return Ingest(zip_path, input_sha, listing, out_dir, hashes)
+
+    @staticmethod
+    def _extract(zip_path: str, out_dir: str) -> tuple[list[str], dict]:
+        """Extracts and hashes all files of a ZIP in a single pass over each."""
+        out_dir = os.path.normpath(out_dir)
+        hashes = {}
+        with zipfile.ZipFile(zip_path, "r") as zipf:
+            listing = zipf.namelist()
+            for info in zipf.infolist():
+                out_path = os.path.normpath(os.path.join(out_dir, info.filename))
+                if not out_path.startswith(out_dir + os.sep):
+                    raise Exception(
+                        f"ZIP at {zip_path} has unsafe path: {info.filename}"
+                    )
+                if info.is_dir():
+                    os.makedirs(out_path, exist_ok=True)
+                    continue
+                os.makedirs(os.path.dirname(out_path), exist_ok=True)
+
+                hasher = sha256()
+                with zipf.open(info) as zippedf, open(out_path, "wb") as f:
+                    for block in iter(lambda: zippedf.read(BUFFER_SIZE), b""):
+                        hasher.update(block)
+                        f.write(block)
+                os.chmod(out_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+                hashes[info.filename] = hasher.hexdigest()
+        return listing, hashes
+
+    @property
+    def content_sha(self) -> str:
+        """SHA-256 of the input's content: the one file that isn't metadata.
+
+        This is the asset of a preprocessor ZIP, or the ZIP of assets of a
+        proofmode ZIP. None if the input doesn't have exactly one such file.
+        """
+        content = [name for name in self.hashes if "-meta-" not in name]
+        if len(content) != 1:
+            return None
+        return self.hashes[content[0]]
+
+    def path(self, name: str) -> str:
+        """Returns the path of an extracted ZIP member."""
+        return os.path.join(self.dir, name)
+
+    def cleanup(self):
+        """Removes the extracted files."""
+        if os.path.isdir(self.dir):
+            shutil.rmtree(self.dir)
+            _logger.info(f"Purged ingest directory at: {self.dir}")
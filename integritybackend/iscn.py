@@ -1,5 +1,5 @@
 from typing import Union
-from . import config
+from . import config, rate_limit
 from .log_helper import LogHelper
 
 import requests
@@ -19,9 +19,12 @@ class Iscn:
             registration: the complete contents of the ISCN registration; must comply with the
                 ISCN schema (https://github.com/likecoin/iscn-specs/tree/master/schema)
 
+        Requests are throttled with the ISCN rate limit.
+
         Returns:
             ISCN registration receipt if the registration succeeded; None otherwise
         """
+        rate_limit.acquire(rate_limit.ISCN)
         resp = requests.post(_REGISTER, json={"metadata": registration})
 
         if not resp.ok:
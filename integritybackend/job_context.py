@@ -0,0 +1,90 @@
+from .asset_helper import AssetHelper
+from .file_util import FileUtil
+from .ingest import Ingest
+from .log_helper import LogHelper
+
+import os
+import shutil
+
+_file_util = FileUtil()
+_logger = LogHelper.getLogger()
+
+
+class JobContext:
+    """State of one action job on one input file.
+
+    The context owns the job's paths, its temporary working directory and its
+    results, so that jobs never share mutable state and any number of them can
+    run at once. Use it as a context manager to have the temporary directory
+    removed when the job ends:
+
+        with JobContext("archive", zip_path, org_id, collection_id) as ctx:
+            ...
+    """
+
+    def __init__(
+        self,
+        action_name: str,
+        zip_path: str,
+        org_id: str,
+        collection_id: str,
+        ingest: Ingest = None,
+    ):
+        """
+        Args:
+            action_name: name of the action the job runs
+            zip_path: path to the input ZIP
+            org_id: ID for the organization
+            collection_id: ID for the collection the input is in
+            ingest: the input ZIP already ingested for the whole collection;
+                if None, the job ingests the ZIP into its temporary directory
+        """
+        self.action_name = action_name
+        self.zip_path = zip_path
+        self.org_id = org_id
+        self.collection_id = collection_id
+        self.asset_helper = AssetHelper(org_id)
+        self.input_sha = os.path.splitext(os.path.basename(zip_path))[0]
+
+        self.action_dir = self.asset_helper.path_for_action(collection_id, action_name)
+        self.output_dir = self.asset_helper.path_for_action_output(
+            collection_id, action_name
+        )
+        self.tmp_root = self.asset_helper.path_for_action_tmp(
+            collection_id, action_name
+        )
+        # Unique per job, so jobs on the same input don't clash either
+        self.tmp_dir = os.path.join(
+            self.tmp_root, f"{self.input_sha}-{_file_util.generate_uuid()}"
+        )
+
+        self.ingest = ingest
+
+        # Outputs of the job, for callers and logging
+        self.results = {}
+
+    def __enter__(self):
+        _file_util.create_dir(self.tmp_dir)
+        if self.ingest is None:
+            try:
+                self.ingest = Ingest.create(self.zip_path, self.tmp_dir)
+            except BaseException:
+                self.cleanup()
+                raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
+        return False
+
+    def tmp_path(self, *names: str) -> str:
+        """Returns a path inside the job's temporary directory."""
+        return os.path.join(self.tmp_dir, *names)
+
+    def cleanup(self):
+        """Removes the job's temporary directory and everything in it."""
+        if self.tmp_dir.startswith(self.tmp_root + os.sep) and os.path.isdir(
+            self.tmp_dir
+        ):
+            shutil.rmtree(self.tmp_dir)
+            _logger.info(f"Purged temporary directory at: {self.tmp_dir}")
@@ -0,0 +1,107 @@
+"""Serves the objects shared by all organizations' file watcher processes.
+
+The job server is a process started by main.py that holds the job scheduler,
+the scratch space reservations, the shared pool of worker processes and the
+rate limiter of registrations. The file watchers get proxies for them from
+the server. Before running each job in the pool, they reserve its scratch
+space and take a scheduler slot.
+"""
+
+from . import crypto_util
+from .log_helper import LogHelper
+from .rate_limit import RateLimiter, strictest_limits
+from .scheduler import FairScheduler
+from .scratch import ScratchSpace
+from .worker_pool import ProcessPool
+
+from multiprocessing.managers import BaseManager
+
+_logger = LogHelper.getLogger()
+
+# The server's shared objects, made when it starts
+_scheduler = None
+_scratch = None
+_pool = None
+_rate_limiter = None
+
+
+class JobServer(BaseManager):
+    """A manager serving the job scheduler, scratch space, shared process pool and rate limiter.
+
+    Once started, `scheduler()`, `scratch()`, `pool()` and `rate_limiter()`
+    return proxies that can be passed to other processes.
+    """
+
+
+def _get_scheduler():
+    return _scheduler
+
+
+def _get_scratch():
+    return _scratch
+
+
+def _get_pool():
+    return _pool
+
+
+def _get_rate_limiter():
+    return _rate_limiter
+
+
+JobServer.register("scheduler", callable=_get_scheduler)
+JobServer.register("scratch", callable=_get_scratch)
+JobServer.register("pool", callable=_get_pool)
+JobServer.register("rate_limiter", callable=_get_rate_limiter)
+
+
+def start(json_config: dict) -> JobServer:
+    """Starts the job server for a configuration.
+
+    The pool has a worker process for each scheduler slot.
+
+    Args:
+        json_config: the JSON of the organization configuration file
+
+    Returns:
+        the started server
+    """
+    server = JobServer()
+    server.start(_init_server, (json_config,))
+    return server
+
+
+def stop(server: JobServer):
+    """Waits for the jobs running in the pool to finish, then stops the server."""
+    try:
+        server.pool().shutdown()
+    finally:
+        server.shutdown()
+
+
+def _init_server(json_config: dict):
+    global _scheduler, _scratch, _pool, _rate_limiter
+    _scheduler = FairScheduler.from_config(json_config)
+    _scratch = ScratchSpace.from_config(json_config)
+    _rate_limiter = RateLimiter(strictest_limits(json_config))
+    # Keys are made before forking, so workers don't each make a different one
+    key_names = configured_keys(json_config)
+    _load_keys(key_names)
+    _pool = ProcessPool(_scheduler.max_running, _load_keys, (key_names,))
+
+
+def _load_keys(key_names: list[str]):
+    for name in key_names:
+        crypto_util.get_key(name)
+
+
+def configured_keys(json_config: dict) -> list[str]:
+    """Returns the names of the encryption keys used by configured actions."""
+    names = set()
+    for org in json_config.get("organizations", []):
+        for collection in org.get("collections", []):
+            for action in collection.get("actions", []):
+                key = action.get("params", {}).get("encryption", {}).get("key")
+                if key is not None:
+                    names.add(key)
+    return sorted(names)
@@ -0,0 +1,190 @@
+"""Leases that let several nodes share the work of one asset store.
+
+Several backend nodes can run against the same `INTERNAL_ASSET_STORE` and
+input directories on shared storage. Each of them sees every input file, so
+before processing an input, or sending a registration, a node takes a lease
+on it. Only one node can hold the lease on a key at a time.
+
+A lease expires `ttl` seconds after it was last renewed. While a node works,
+a heartbeat thread renews the lease, so it only expires when the node dies or
+hangs. Another node can then take over the work.
+
+Leases are kept in a SQLite database on the shared storage. The database uses
+a rollback journal rather than WAL, because WAL needs memory shared between
+all the processes using it, which processes on different hosts don't have.
+Expiry times come from each node's clock, so the nodes' clocks must be kept
+in sync, for example with NTP.
+"""
+
+from . import config
+from .log_helper import LogHelper
+
+from contextlib import closing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+_logger = LogHelper.getLogger()
+
+# Seconds a lease lasts without a heartbeat
+DEFAULT_TTL = 60
+# Heartbeats per lease period
+HEARTBEATS_PER_TTL = 3
+
+
+def node_id() -> str:
+    """Returns the name of this node: NODE_ID, or the host name and process ID."""
+    return config.NODE_ID or f"{socket.gethostname()}-{os.getpid()}"
+
+
+class LeaseStore:
+    """A database of the leases held by nodes on named keys."""
+
+    def __init__(self, db_path: str, owner: str = None):
+        """
+        Args:
+            db_path: path to the SQLite database file, created if it doesn't exist
+            owner: name of the node taking leases; see `node_id` for the default
+        """
+        self.db_path = db_path
+        self.owner = owner or node_id()
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.execute("""CREATE TABLE IF NOT EXISTS leases (
+                    key TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    token TEXT NOT NULL,
+                    expires REAL NOT NULL
+                )""")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def acquire(self, key: str, ttl: float = DEFAULT_TTL, heartbeat: bool = True):
+        """Takes the lease on a key, unless another holder's lease is unexpired.
+
+        Args:
+            key: name of the work the lease is for
+            ttl: seconds the lease lasts without being renewed
+            heartbeat: whether to renew the lease in a background thread until
+                it is released
+
+        Returns:
+            the Lease, or None if the key is leased by someone else
+        """
+        token = uuid.uuid4().hex
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            # A single statement, so two nodes can't both take an expired lease
+            cur = conn.execute(
+                """INSERT INTO leases (key, owner, token, expires) VALUES (?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    owner = excluded.owner, token = excluded.token, expires = excluded.expires
+                WHERE leases.expires <= ?""",
+                (key, self.owner, token, now + ttl, now),
+            )
+            if cur.rowcount != 1:
+                return None
+        lease = Lease(self, key, token, ttl)
+        if heartbeat:
+            lease.start_heartbeat()
+        return lease
+
+    def renew(self, key: str, token: str, ttl: float) -> bool:
+        """Extends a lease.
+
+        Returns:
+            False if the lease was lost: it expired and was taken by someone else
+        """
+        with closing(self._connect()) as conn, conn:
+            cur = conn.execute(
+                "UPDATE leases SET expires = ? WHERE key = ? AND token = ?",
+                (time.time() + ttl, key, token),
+            )
+            return cur.rowcount == 1
+
+    def release(self, key: str, token: str):
+        """Gives up a lease, if it is still held."""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM leases WHERE key = ? AND token = ?", (key, token))
+
+    def holder(self, key: str) -> str:
+        """Returns the owner of the unexpired lease on a key, or None."""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT owner FROM leases WHERE key = ? AND expires > ?",
+                (key, time.time()),
+            ).fetchone()
+        return None if row is None else row[0]
+
+
+class Lease:
+    """A lease held on a key, released when used as a context manager.
+
+    Attributes:
+        lost: whether a heartbeat found the lease expired and taken by someone
+            else, in which case the work may be done twice and must be idempotent
+    """
+
+    def __init__(self, store: LeaseStore, key: str, token: str, ttl: float):
+        self.store = store
+        self.key = key
+        self.token = token
+        self.ttl = ttl
+        self.lost = False
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    def start_heartbeat(self):
+        """Renews the lease in a daemon thread until it is released."""
+        self._heartbeat = threading.Thread(
+            target=self._run_heartbeat, name=f"lease_{self.key}", daemon=True
+        )
+        self._heartbeat.start()
+
+    def renew(self) -> bool:
+        """Extends the lease, for holders that renew it themselves.
+
+        Returns:
+            False if the lease was lost
+        """
+        try:
+            if not self.store.renew(self.key, self.token, self.ttl):
+                self.lost = True
+                _logger.warning(f"Lost lease on {self.key}")
+        except sqlite3.Error as e:
+            # The lease is still good until it expires
+            _logger.warning(f"Couldn't renew lease on {self.key}: {e}")
+        return not self.lost
+
+    def _run_heartbeat(self):
+        while not self._stop.wait(self.ttl / HEARTBEATS_PER_TTL):
+            if not self.renew():
+                return
+
+    def release(self):
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        self.store.release(self.key, self.token)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def open_store(db_path: str) -> LeaseStore:
+    """Returns the lease store at a path, shared by all its users in this process."""
+    with _stores_lock:
+        if db_path not in _stores:
+            _stores[db_path] = LeaseStore(db_path)
+        return _stores[db_path]
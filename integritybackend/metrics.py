@@ -0,0 +1,365 @@
+"""Latency histograms and counters, served in the Prometheus text format.
+
+Jobs run in several processes: the organizations' file watchers, the job
+server's pool of worker processes, or the async service. Each process records
+its metrics in memory and, once `enable` has been called before the processes
+are forked, writes them every `FLUSH_INTERVAL` seconds to a file of its own in
+the metrics directory. The HTTP endpoint started with `serve` adds up the files
+of all processes:
+
+- counters and histograms are summed, including those of processes that have
+  exited, so they only ever go up;
+- gauges are summed over the processes that are still running.
+
+Metrics are always recorded, so that instrumented code doesn't need to check
+whether they are enabled; without `enable` they are only kept in memory.
+"""
+
+from .log_helper import LogHelper
+
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import glob
+import json
+import os
+import threading
+import time
+
+_logger = LogHelper.getLogger()
+
+# Seconds between writes of a process's metrics to its file
+FLUSH_INTERVAL = 5
+# Upper bounds, in seconds, of the buckets of all histograms
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    120,
+    300,
+    600,
+)
+
+# Metric names
+STAGE_SECONDS = "integrity_stage_seconds"
+ACTION_SECONDS = "integrity_action_seconds"
+ACTIONS_TOTAL = "integrity_actions_total"
+BYTES_PROCESSED_TOTAL = "integrity_bytes_processed_total"
+REGISTRATIONS_TOTAL = "integrity_registrations_total"
+QUEUE_DEPTH = "integrity_queue_depth"
+JOBS_IN_FLIGHT = "integrity_jobs_in_flight"
+
+HELP = {
+    STAGE_SECONDS: "Seconds taken by a stage of an action",
+    ACTION_SECONDS: "Seconds taken by an action on an input",
+    ACTIONS_TOTAL: "Actions run on inputs, by outcome",
+    BYTES_PROCESSED_TOTAL: "Bytes of input processed by completed actions",
+    REGISTRATIONS_TOTAL: "Blockchain registration attempts, by outcome",
+    QUEUE_DEPTH: "Jobs queued or running in a collection's worker pool",
+    JOBS_IN_FLIGHT: "Inputs being processed",
+}
+
+
+class Registry:
+    """The metrics recorded by one process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (name, labels) to value, where labels is a sorted tuple of pairs
+        self.counters = {}
+        self.gauges = {}
+        # (name, labels) to [bucket counts, sum, count]
+        self.histograms = {}
+
+    def inc(self, name: str, amount: float, labels: tuple):
+        with self._lock:
+            key = (name, labels)
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set_gauge(self, name: str, value: float, labels: tuple):
+        with self._lock:
+            self.gauges[(name, labels)] = value
+
+    def add_gauge(self, name: str, amount: float, labels: tuple):
+        with self._lock:
+            key = (name, labels)
+            self.gauges[key] = self.gauges.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, labels: tuple):
+        with self._lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                histogram = [[0] * len(DEFAULT_BUCKETS), 0.0, 0]
+                self.histograms[(name, labels)] = histogram
+            for i, bound in enumerate(DEFAULT_BUCKETS):
+                if value <= bound:
+                    histogram[0][i] += 1
+                    break
+            histogram[1] += value
+            histogram[2] += 1
+
+    def snapshot(self) -> dict:
+        """Returns the metrics as JSON-serializable lists."""
+        with self._lock:
+            return {
+                "counters": [
+                    [name, dict(labels), value]
+                    for (name, labels), value in self.counters.items()
+                ],
+                "gauges": [
+                    [name, dict(labels), value]
+                    for (name, labels), value in self.gauges.items()
+                ],
+                "histograms": [
+                    [name, dict(labels), list(buckets), total, count]
+                    for (name, labels), (
+                        buckets,
+                        total,
+                        count,
+                    ) in self.histograms.items()
+                ],
+            }
+
+
+_registry = Registry()
+_dir = None
+# PID of the process whose flush thread is running, if any
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+
+
+def _after_fork():
+    # A forked process starts with no metrics and no flush thread
+    global _registry, _flusher_pid, _flusher_lock
+    _registry = Registry()
+    _flusher_pid = None
+    _flusher_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def enable(metrics_dir: str):
+    """Has this process and the processes it forks write their metrics to a directory.
+
+    Files left in the directory by an earlier run are removed.
+    """
+    global _dir
+    os.makedirs(metrics_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(metrics_dir, "metrics-*.json")):
+        os.remove(path)
+    _dir = metrics_dir
+
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _recorded():
+    if _dir is not None and _flusher_pid != os.getpid():
+        _start_flusher()
+    return _registry
+
+
+def inc(name: str, amount: float = 1, **labels):
+    """Adds to a counter."""
+    _recorded().inc(name, amount, _labels(labels))
+
+
+def set_gauge(name: str, value: float, **labels):
+    """Sets a gauge of this process."""
+    _recorded().set_gauge(name, value, _labels(labels))
+
+
+def add_gauge(name: str, amount: float, **labels):
+    """Adds to a gauge of this process; the amount can be negative."""
+    _recorded().add_gauge(name, amount, _labels(labels))
+
+
+def observe(name: str, value: float, **labels):
+    """Records a value, usually in seconds, in a histogram."""
+    _recorded().observe(name, value, _labels(labels))
+
+
+@contextmanager
+def timed(name: str, **labels):
+    """Records the seconds the enclosed code takes in a histogram, even if it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+@contextmanager
+def in_flight(name: str, **labels):
+    """Counts the enclosed code in a gauge while it runs."""
+    add_gauge(name, 1, **labels)
+    try:
+        yield
+    finally:
+        add_gauge(name, -1, **labels)
+
+
+def _start_flusher():
+    global _flusher_pid
+    with _flusher_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+        threading.Thread(
+            name="metrics_flusher", target=_run_flusher, daemon=True
+        ).start()
+
+
+def _run_flusher():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError as e:
+            _logger.warning(f"Couldn't write metrics to {_dir}: {e}")
+
+
+def flush():
+    """Writes this process's metrics to its file in the metrics directory."""
+    if _dir is None:
+        return
+    pid = os.getpid()
+    path = os.path.join(_dir, f"metrics-{pid}.json")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"pid": pid, **_registry.snapshot()}, f)
+    os.replace(tmp_path, path)
+
+
+def collect(metrics_dir: str) -> dict:
+    """Adds up the metrics of all processes that wrote to a directory.
+
+    Returns:
+        dictionary with "counters", "gauges" and "histograms", each a
+        dictionary of (name, labels) to the summed value, as in `Registry`
+    """
+    merged = Registry()
+    for path in glob.glob(os.path.join(metrics_dir, "metrics-*.json")):
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            _logger.warning(f"Couldn't read metrics from {path}: {e}")
+            continue
+        for name, labels, value in snapshot["counters"]:
+            merged.inc(name, value, _labels(labels))
+        if _is_running(snapshot["pid"]):
+            for name, labels, value in snapshot["gauges"]:
+                merged.add_gauge(name, value, _labels(labels))
+        for name, labels, buckets, total, count in snapshot["histograms"]:
+            key = (name, _labels(labels))
+            histogram = merged.histograms.setdefault(
+                key, [[0] * len(DEFAULT_BUCKETS), 0.0, 0]
+            )
+            histogram[0] = [a + b for a, b in zip(histogram[0], buckets)]
+            histogram[1] += total
+            histogram[2] += count
+    return {
+        "counters": merged.counters,
+        "gauges": merged.gauges,
+        "histograms": merged.histograms,
+    }
+
+
+def _is_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def render(metrics: dict) -> str:
+    """Formats collected metrics in the Prometheus text exposition format."""
+    lines = []
+    for kind, metric_type in (
+        ("counters", "counter"),
+        ("gauges", "gauge"),
+        ("histograms", "histogram"),
+    ):
+        by_name = {}
+        for (name, labels), value in metrics[kind].items():
+            by_name.setdefault(name, []).append((labels, value))
+        for name in sorted(by_name):
+            if name in HELP:
+                lines.append(f"# HELP {name} {HELP[name]}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in sorted(by_name[name]):
+                if metric_type != "histogram":
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+                    continue
+                buckets, total, count = value
+                cumulative = 0
+                for bound, bucket in zip(DEFAULT_BUCKETS, buckets):
+                    cumulative += bucket
+                    le = _format_labels(labels + (("le", str(bound)),))
+                    lines.append(f"{name}_bucket{le} {cumulative}")
+                le = _format_labels(labels + (("le", "+Inf"),))
+                lines.append(f"{name}_bucket{le} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        flush()
+        body = render(collect(_dir)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        _logger.debug(f"Metrics request: {format % args}")
+
+
+def serve(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serves `/metrics` for the processes writing to the metrics directory, in a daemon thread.
+
+    `enable` must be called first.
+
+    Returns:
+        the running server
+    """
+    if _dir is None:
+        raise ValueError("Metrics must be enabled before they are served")
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(
+        name="metrics_server", target=server.serve_forever, daemon=True
+    ).start()
+    _logger.info(f"Serving metrics on http://{host}:{server.server_port}/metrics")
+    return server
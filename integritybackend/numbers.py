@@ -1,11 +1,20 @@
-from . import config
+from . import config, rate_limit
 from .log_helper import LogHelper
 
+from concurrent.futures import ThreadPoolExecutor
 import copy
+import json
 import requests
+import time
 
 _logger = LogHelper.getLogger()
 
+# Seconds a chain registration may take in all, rate limiting included,
+# before giving up on it
+REGISTRATION_TIMEOUT = 120
+# Bytes of a registration response read at a time
+RESPONSE_CHUNK_SIZE = 4096
+
 
 class Numbers:
     """Handles interactions with Numbers Protocol."""
@@ -22,6 +31,7 @@ class Numbers:
         chains,
         nft_contract_address,
         testnet,
+        timeout=REGISTRATION_TIMEOUT,
     ):
         """Registers an asset to the integrity blockchain.
 
@@ -39,11 +49,17 @@ class Numbers:
             chains: List of chain names to register on: numbers, avalanche, near
             nft_contract_address: Avalanche contract address for minting an ERC-721 custody token for the asset; None to skip
             testnet: if testnet is used
+            timeout: seconds each chain may take before giving up on it
+
+        Registrations on all chains are sent concurrently, each throttled with
+        the rate limit of its chain. They share a deadline `timeout` seconds
+        away, which bounds the wait for the rate limit and the whole request,
+        so every chain's outcome is known when this returns.
 
         Returns:
             A dictionary mapping the chain name to the registration information.
-            Failed registrations simply don't appear in the dictionary. So a total
-            failure results in an empty dictionary being returned.
+            Failed or timed out registrations simply don't appear in the dictionary.
+            So a total failure results in an empty dictionary being returned.
         """
 
         if not chains:
@@ -83,41 +99,113 @@ class Numbers:
 
             raise NotImplementedError("Don't know how to handle nft contract address")
 
-        result = {}
-
+        servers = {}
         for chain in chains:
             if chain == "numbers":
-                server = config.NUMBERS_NUMBERS_SERVER
+                servers[chain] = config.NUMBERS_NUMBERS_SERVER
             elif chain == "avalanche":
-                server = config.NUMBERS_AVALANCHE_SERVER
+                servers[chain] = config.NUMBERS_AVALANCHE_SERVER
             elif chain == "near":
-                server = config.NUMBERS_NEAR_SERVER
+                servers[chain] = config.NUMBERS_NEAR_SERVER
             else:
                 raise NotImplementedError(f"Unknown chain {chain}")
 
+        deadline = time.monotonic() + timeout
+        with ThreadPoolExecutor(
+            max_workers=len(servers), thread_name_prefix="numbers_register"
+        ) as executor:
+            futures = {
+                chain: executor.submit(
+                    Numbers._register_on_chain,
+                    chain,
+                    server,
+                    registration_data,
+                    deadline,
+                )
+                for chain, server in servers.items()
+            }
+
+        result = {}
+        for chain, future in futures.items():
+            data = future.result()
+            if data is not None:
+                result[chain] = data
+        return result
+
+    @staticmethod
+    def _register_on_chain(chain, server, registration_data, deadline):
+        """Registers on a single chain, giving up at the deadline.
+
+        Args:
+            deadline: `time.monotonic()` by which the registration must be done
+
+        Returns:
+            the registration information, or None if the registration failed
+            or timed out
+        """
+        start = time.monotonic()
+        if not rate_limit.acquire(chain, max(0, deadline - start)):
+            _logger.error(
+                f"Numbers registration on {chain} rate limited past its deadline"
+            )
+            return None
+        try:
+            # Each read of the response has the time left, and the body is
+            # read in chunks so that the request as a whole ends by the deadline
             resp = requests.post(
                 server,
                 headers={"Authorization": f"token {config.NUMBERS_API_KEY}"},
                 json=registration_data,
+                timeout=Numbers._time_left(deadline),
+                stream=True,
+            )
+            body = b""
+            for chunk in resp.iter_content(RESPONSE_CHUNK_SIZE):
+                body += chunk
+                Numbers._time_left(deadline)
+        except requests.exceptions.RequestException as e:
+            _logger.error(
+                f"Numbers registration on {chain} failed after {time.monotonic() - start:.2f}s: {e}"
             )
+            return None
+        latency = time.monotonic() - start
+        text = body.decode(errors="replace")
 
-            if not resp.ok:
-                _logger.error(
-                    f"Numbers registration on {chain} failed: {resp.status_code} {resp.text}"
-                )
-                continue
+        if not resp.ok:
+            _logger.error(
+                f"Numbers registration on {chain} failed in {latency:.2f}s: {resp.status_code} {text}"
+            )
+            return None
 
-            data = resp.json()
-            if "error" in data:
-                _logger.error(
-                    f"Numbers registration on {chain} failed: {resp.status_code} {resp.text}"
-                )
-                continue
+        try:
+            data = json.loads(body)
+        except ValueError as e:
+            _logger.error(
+                f"Numbers registration on {chain} returned invalid JSON in {latency:.2f}s: {e}: {text}"
+            )
+            return None
+        if not isinstance(data, dict) or "error" in data:
+            _logger.error(
+                f"Numbers registration on {chain} failed in {latency:.2f}s: {resp.status_code} {text}"
+            )
+            return None
 
-            _logger.info(f"Numbers registration on {chain} succeeded: {resp.text}")
-            result[chain] = data
+        _logger.info(
+            f"Numbers registration on {chain} succeeded in {latency:.2f}s: {text}"
+        )
+        return data
 
-        return result
+    @staticmethod
+    def _time_left(deadline) -> float:
+        """Returns the seconds left until a deadline.
+
+        Raises:
+            requests.exceptions.Timeout if the deadline has passed
+        """
+        left = deadline - time.monotonic()
+        if left <= 0:
+            raise requests.exceptions.Timeout("Deadline reached")
+        return left
 
     @staticmethod
     def register_archive(
@@ -0,0 +1,307 @@
+from .log_helper import LogHelper
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import asyncio
+import functools
+import json
+import os
+import shutil
+import time
+
+_logger = LogHelper.getLogger()
+
+# Number of stages of a pipeline that run at once
+DEFAULT_WORKERS = 4
+
+
+class Stage:
+    """A step of a pipeline.
+
+    The stage's function is called with the values named in `inputs` as keyword
+    arguments, and returns a dictionary with a value for each name in
+    `outputs`. It can be a coroutine function if the pipeline is run with
+    `run_async`.
+
+    When a pipeline runs with a journal, the outputs of checkpointed stages
+    are recorded, so they must be JSON-serializable, and running the stage
+    again after a crash part way through it must be safe.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn,
+        inputs: list[str] = (),
+        outputs: list[str] = (),
+        checkpoint: bool = True,
+    ):
+        """
+        Args:
+            name: name of the stage, used in logs and timings
+            fn: the function that runs the stage
+            inputs: names of the values the stage needs
+            outputs: names of the values the stage produces
+            checkpoint: whether the stage's outputs are recorded in the journal;
+                stages that are cheap, or whose outputs don't survive a
+                restart, run again when a pipeline is resumed
+        """
+        self.name = name
+        self.fn = fn
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.checkpoint = checkpoint
+
+
+class Journal:
+    """A durable record of the stages a pipeline has completed.
+
+    The journal is a directory holding `journal.json`, with the outputs of
+    each completed stage, and a `work` directory for the files those stages
+    make. Both survive a crash, so a pipeline run again with the same journal
+    resumes after the last completed stage. The journal is discarded once the
+    whole pipeline has completed.
+    """
+
+    def __init__(self, dir: str):
+        """
+        Args:
+            dir: the journal's directory, created if it doesn't exist
+        """
+        self.dir = dir
+        self.path = os.path.join(dir, "journal.json")
+        os.makedirs(self.work_path(), exist_ok=True)
+        self.completed = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                self.completed = json.load(f)
+
+    def work_path(self, *names: str) -> str:
+        """Returns a path inside the journal's work directory."""
+        return os.path.join(self.dir, "work", *names)
+
+    def record(self, stage_name: str, outputs: dict):
+        """Durably records that a stage completed with some outputs."""
+        self.completed[stage_name] = outputs
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.completed, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def discard(self):
+        """Removes the journal and its work files."""
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+class Pipeline:
+    """Runs stages in dependency order, with independent stages in parallel.
+
+    A stage starts as soon as all its inputs are available, either given to
+    `run` or produced by other stages. Stages that don't depend on each other
+    run at the same time, up to `max_workers` of them.
+
+    After a run, `timings` has the seconds each stage took.
+
+    `run` runs stages in threads. `run_async` runs them on an asyncio event
+    loop: coroutine stages, like those waiting on subprocesses, run on the
+    loop itself, and other stages in an executor.
+    """
+
+    def __init__(
+        self, name: str, stages: list[Stage], max_workers: int = DEFAULT_WORKERS
+    ):
+        """
+        Args:
+            name: name of the pipeline, used in logs and thread names
+            stages: the stages to run
+            max_workers: number of stages run at once
+
+        Raises:
+            ValueError if two stages have the same name or produce the same value
+        """
+        producers = {}
+        for stage in stages:
+            for output in stage.outputs:
+                if output in producers:
+                    raise ValueError(
+                        f"Value {output} is produced by both {producers[output]} and {stage.name}"
+                    )
+                producers[output] = stage.name
+        if len({stage.name for stage in stages}) != len(stages):
+            raise ValueError(f"Pipeline {name} has stages with the same name")
+
+        self.name = name
+        self.stages = stages
+        self.max_workers = max_workers
+        self.timings = {}
+
+    def run(self, values: dict = None, journal: Journal = None) -> dict:
+        """Runs all stages.
+
+        Args:
+            values: initial values available to stages
+            journal: journal that checkpointed stages are recorded in; stages
+                it lists as completed are skipped and their outputs reused
+
+        Returns:
+            the initial values and the outputs of all stages
+
+        Raises:
+            the first exception raised by a stage; stages that haven't started
+            yet are not run
+            ValueError if some stages can never run because of missing inputs
+        """
+        values = dict(values or {})
+        pending = self._start(values, journal)
+        running = {}
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(
+            self.max_workers, thread_name_prefix=self.name
+        ) as executor:
+            while pending or running:
+                for stage, kwargs in self._ready(pending, values):
+                    running[executor.submit(self._run_stage, stage, kwargs)] = stage
+                if not running:
+                    raise self._stuck(pending, values)
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    if future.exception() is not None:
+                        for other in running:
+                            other.cancel()
+                        raise future.exception()
+                    self._completed(stage, future.result(), values, journal)
+
+        self._log_timings(start)
+        return values
+
+    async def run_async(
+        self, values: dict = None, journal: Journal = None, executor=None
+    ) -> dict:
+        """Runs all stages on the running event loop.
+
+        Stages whose function is a coroutine function are awaited on the loop,
+        so that stages waiting on I/O don't hold a thread. Other stages run in
+        the executor. Arguments, results and exceptions are as for `run`.
+
+        Args:
+            values: initial values available to stages
+            journal: journal that checkpointed stages are recorded in
+            executor: executor that runs the stages that aren't coroutines;
+                the loop's default executor if None
+        """
+        values = dict(values or {})
+        pending = self._start(values, journal)
+        running = {}
+        start = time.perf_counter()
+
+        try:
+            while pending or running:
+                for stage, kwargs in self._ready(pending, values):
+                    task = asyncio.ensure_future(
+                        self._run_stage_async(stage, kwargs, executor)
+                    )
+                    running[task] = stage
+                if not running:
+                    raise self._stuck(pending, values)
+
+                done, _ = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    stage = running.pop(task)
+                    if task.exception() is not None:
+                        raise task.exception()
+                    self._completed(stage, task.result(), values, journal)
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.wait(running)
+
+        self._log_timings(start)
+        return values
+
+    def _start(self, values: dict, journal: Journal) -> list[Stage]:
+        """Resets timings and resumes from the journal.
+
+        Returns:
+            the stages left to run
+        """
+        pending = list(self.stages)
+        self.timings = {}
+        if journal is not None:
+            resumed = [
+                stage
+                for stage in pending
+                if stage.checkpoint and stage.name in journal.completed
+            ]
+            for stage in resumed:
+                pending.remove(stage)
+                values.update(journal.completed[stage.name])
+            if resumed:
+                _logger.info(
+                    f"Pipeline {self.name} resumed from journal {journal.dir}, skipping {[s.name for s in resumed]}"
+                )
+        return pending
+
+    @staticmethod
+    def _ready(pending: list[Stage], values: dict):
+        """Removes the stages whose inputs are all available from `pending`.
+
+        Returns:
+            list of (stage, its keyword arguments)
+        """
+        ready = [s for s in pending if all(name in values for name in s.inputs)]
+        for stage in ready:
+            pending.remove(stage)
+        return [
+            (stage, {name: values[name] for name in stage.inputs}) for stage in ready
+        ]
+
+    def _stuck(self, pending: list[Stage], values: dict) -> ValueError:
+        missing = {
+            name for stage in pending for name in stage.inputs if name not in values
+        }
+        return ValueError(
+            f"Pipeline {self.name} can't run {[s.name for s in pending]}, missing {sorted(missing)}"
+        )
+
+    @staticmethod
+    def _completed(stage: Stage, outputs: dict, values: dict, journal: Journal):
+        values.update(outputs)
+        if journal is not None and stage.checkpoint:
+            journal.record(stage.name, outputs)
+
+    def _log_timings(self, start: float):
+        _logger.info(
+            f"Pipeline {self.name} finished in {time.perf_counter() - start:.3f}s, stages: "
+            + ", ".join(f"{name} {secs:.3f}s" for name, secs in self.timings.items())
+        )
+
+    def _run_stage(self, stage: Stage, kwargs: dict) -> dict:
+        start = time.perf_counter()
+        outputs = stage.fn(**kwargs) or {}
+        self.timings[stage.name] = time.perf_counter() - start
+        return self._checked(stage, outputs)
+
+    async def _run_stage_async(self, stage: Stage, kwargs: dict, executor) -> dict:
+        if not asyncio.iscoroutinefunction(stage.fn):
+            return await asyncio.get_running_loop().run_in_executor(
+                executor, functools.partial(self._run_stage, stage, kwargs)
+            )
+        start = time.perf_counter()
+        outputs = await stage.fn(**kwargs) or {}
+        self.timings[stage.name] = time.perf_counter() - start
+        return self._checked(stage, outputs)
+
+    @staticmethod
+    def _checked(stage: Stage, outputs: dict) -> dict:
+        if set(outputs) != set(stage.outputs):
+            raise ValueError(
+                f"Stage {stage.name} returned {sorted(outputs)}, expected {sorted(stage.outputs)}"
+            )
+        return outputs
@@ -0,0 +1,222 @@
+"""A polling watchdog observer for input directories on network mounts.
+
+Clients of an NFS or SMB mount only get inotify events for changes they make
+themselves, so uploads made through other clients must be found by polling.
+Watchdog's own `PollingObserver` lists and stats every file of the tree on
+every poll, at a fixed interval. This observer is gentler on the file server:
+
+- A directory is only listed again when its modification time changed, which
+  it does when files are added, removed or renamed in it. New and removed
+  files are found from the listings alone.
+- Files are stat'ed to find modifications, at most `max_stats` per poll: new
+  files and files that changed recently first, then the others in turn.
+- The interval drops to `min_interval` when something changed, and doubles on
+  every idle poll up to `max_interval`.
+
+A directory changed within `RACY_SECONDS` of its last listing is listed again,
+since its modification time may not have changed on file systems with coarse
+timestamps.
+"""
+
+from .log_helper import LogHelper
+
+from collections import deque
+import functools
+import os
+import time
+
+from watchdog.events import FileCreatedEvent, FileDeletedEvent, FileModifiedEvent
+from watchdog.observers.api import BaseObserver, EventEmitter
+
+_logger = LogHelper.getLogger()
+
+DEFAULT_MIN_INTERVAL = 1
+DEFAULT_MAX_INTERVAL = 30
+DEFAULT_MAX_STATS = 1000
+# Seconds within which a directory's modification time can't be trusted to
+# have changed
+RACY_SECONDS = 2
+
+
+class ScanningEmitter(EventEmitter):
+    """Emits file created, modified and deleted events for a watched directory tree."""
+
+    def __init__(
+        self,
+        event_queue,
+        watch,
+        timeout=DEFAULT_MIN_INTERVAL,
+        min_interval: float = DEFAULT_MIN_INTERVAL,
+        max_interval: float = DEFAULT_MAX_INTERVAL,
+        max_stats: int = DEFAULT_MAX_STATS,
+    ):
+        super().__init__(event_queue, watch, timeout)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_stats = max_stats
+        self.interval = min_interval
+        # Directory path to (mtime_ns, listed at, file names, subdirectory names)
+        self._listings = {}
+        # File path to (size, mtime_ns), or None if not stat'ed yet
+        self._stats = {}
+        # Files to stat first: new ones and ones that changed on the last poll
+        self._urgent = {}
+        # The other files, in the order they are stat'ed
+        self._rotation = deque()
+
+    def on_thread_start(self):
+        # Files already there when watching starts get no events
+        self._scan(emit=False)
+
+    def queue_events(self, timeout):
+        if self.stopped_event.wait(self.interval):
+            return
+        try:
+            changed = self._scan()
+        except OSError as e:
+            _logger.warning(f"Couldn't poll {self.watch.path}: {e}")
+            changed = False
+        if changed:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * 2, self.max_interval)
+
+    def _scan(self, emit: bool = True) -> bool:
+        """Polls the tree once.
+
+        Returns:
+            whether any file was created, modified or deleted
+        """
+        files = set()
+        self._list(self.watch.path, files, recursive=self.watch.is_recursive)
+
+        changed = False
+        for path in self._stats.keys() - files:
+            del self._stats[path]
+            self._urgent.pop(path, None)
+            if emit:
+                self.queue_event(FileDeletedEvent(path))
+            changed = True
+        for path in files - self._stats.keys():
+            self._stats[path] = None
+            if emit:
+                self._urgent[path] = None
+                self.queue_event(FileCreatedEvent(path))
+                changed = True
+            else:
+                self._rotation.append(path)
+
+        return self._stat_some(emit) or changed
+
+    def _list(self, dir_path: str, files: set, recursive: bool):
+        """Adds the files in a directory, listing it only if it changed."""
+        stat = os.stat(dir_path)
+        listing = self._listings.get(dir_path)
+        if (
+            listing is None
+            or listing[0] != stat.st_mtime_ns
+            or stat.st_mtime_ns >= listing[1] - RACY_SECONDS * 1e9
+        ):
+            names, subdirs = [], []
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                    else:
+                        names.append(entry.name)
+            listing = (stat.st_mtime_ns, time.time_ns(), names, subdirs)
+            self._listings[dir_path] = listing
+
+        files.update(os.path.join(dir_path, name) for name in listing[2])
+        if recursive:
+            for name in listing[3]:
+                try:
+                    self._list(os.path.join(dir_path, name), files, recursive)
+                except FileNotFoundError:
+                    self._listings.pop(os.path.join(dir_path, name), None)
+
+    def _stat_some(self, emit: bool) -> bool:
+        """Stats up to `max_stats` files.
+
+        Returns:
+            whether any of them was modified
+        """
+        changed = False
+        budget = self.max_stats
+        urgent, self._urgent = self._urgent, {}
+        for path in urgent:
+            if budget == 0:
+                self._urgent[path] = None
+                continue
+            budget -= 1
+            if self._stat(path, emit):
+                changed = True
+                self._urgent[path] = None
+            else:
+                self._rotation.append(path)
+
+        for _ in range(min(budget, len(self._rotation))):
+            path = self._rotation.popleft()
+            if path not in self._stats or path in self._urgent:
+                continue
+            if self._stat(path, emit):
+                changed = True
+                self._urgent[path] = None
+            else:
+                self._rotation.append(path)
+        return changed
+
+    def _stat(self, path: str, emit: bool) -> bool:
+        """Stats a file and emits an event if it was modified since it was last stat'ed.
+
+        Returns:
+            whether it was modified
+        """
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            # Found deleted by the next listing
+            return False
+        current = (stat.st_size, stat.st_mtime_ns)
+        last = self._stats.get(path)
+        self._stats[path] = current
+        if last is None or last == current:
+            return False
+        if emit:
+            self.queue_event(FileModifiedEvent(path))
+        return True
+
+
+class AdaptivePollingObserver(BaseObserver):
+    """An observer that polls the watched directories with `ScanningEmitter`s."""
+
+    def __init__(
+        self,
+        min_interval: float = DEFAULT_MIN_INTERVAL,
+        max_interval: float = DEFAULT_MAX_INTERVAL,
+        max_stats: int = DEFAULT_MAX_STATS,
+    ):
+        """
+        Args:
+            min_interval: seconds between polls while files are changing
+            max_interval: seconds between polls once the directory is idle
+            max_stats: maximum number of files stat'ed per poll
+        """
+        super().__init__(
+            emitter_class=functools.partial(
+                ScanningEmitter,
+                min_interval=min_interval,
+                max_interval=max_interval,
+                max_stats=max_stats,
+            ),
+            timeout=min_interval,
+        )
+
+    @staticmethod
+    def from_config(conf: dict):
+        """Makes an observer from the `watcher` object of a collection config."""
+        return AdaptivePollingObserver(
+            conf.get("min_interval", DEFAULT_MIN_INTERVAL),
+            conf.get("max_interval", DEFAULT_MAX_INTERVAL),
+            conf.get("max_stats", DEFAULT_MAX_STATS),
+        )
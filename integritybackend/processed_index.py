@@ -0,0 +1,323 @@
+from .bloom import BloomFilter
+from .log_helper import LogHelper
+
+from contextlib import closing
+from typing import Optional
+import os
+import sqlite3
+import threading
+import time
+
+_logger = LogHelper.getLogger()
+
+# Initial number of input SHAs the Bloom filter of an index is sized for; it
+# is rebuilt twice as large when it fills up
+BLOOM_CAPACITY = 100_000
+# Seconds between catch-ups of the Bloom filter of an index with the inputs
+# completed by other processes
+BLOOM_REFRESH_INTERVAL = 5
+# Number of input SHAs looked up in one query
+LOOKUP_BATCH_SIZE = 500
+
+
+class ProcessedIndex:
+    """A persistent record of the actions completed on each input file.
+
+    Inputs are identified by their SHA-256, which is also their file name, and
+    an action is recorded once it has finished successfully. The index is a
+    SQLite database per collection, so it survives restarts and lets the
+    watcher find the inputs it has missed.
+
+    The index also maps the SHA-256 of each input's content to the first input
+    it was archived from, so that inputs repeating the same content are
+    recognized.
+
+    Lookups of input SHAs go through an in-memory Bloom filter first, so that
+    checking a new input doesn't query the database. Inputs completed in this
+    process are added to the filter right away, and it picks up the inputs
+    completed by other processes every BLOOM_REFRESH_INTERVAL seconds, so
+    their most recent inputs may be reported as not completed. Checks that
+    must be exact pass `use_filter=False`. Use `open_index` to share one
+    index, and its filter, within a process.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path: path to the SQLite database file, created if it doesn't exist
+        """
+        self.db_path = db_path
+        # New indexes are seeded from the outputs already there, see seed
+        self.is_new = not os.path.exists(db_path)
+        with closing(self._connect()) as conn, conn:
+            # A rollback journal, like the leases database: nodes on other
+            # hosts sharing the asset store can't use WAL
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.execute("""CREATE TABLE IF NOT EXISTS completed (
+                    input_sha TEXT NOT NULL,
+                    action TEXT NOT NULL,
+                    completed REAL NOT NULL,
+                    PRIMARY KEY (input_sha, action)
+                )""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS contents (
+                    content_sha TEXT PRIMARY KEY,
+                    input_sha TEXT NOT NULL
+                )""")
+        self._bloom = None
+        self._bloom_rowid = 0
+        self._bloom_refreshed = 0
+        self._bloom_lock = threading.Lock()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def mark_completed(self, input_sha: str, actions: list[str]):
+        """Records that actions have completed on an input."""
+        self.mark_many([input_sha], actions)
+
+    def mark_many(self, input_shas: list[str], actions: list[str]):
+        """Records that actions have completed on several inputs, in one transaction."""
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            # Existing rows are updated in place, keeping their rowid, so the
+            # Bloom filter doesn't pick them up again
+            conn.executemany(
+                """INSERT INTO completed (input_sha, action, completed) VALUES (?, ?, ?)
+                ON CONFLICT (input_sha, action) DO UPDATE SET completed = excluded.completed""",
+                (
+                    (input_sha, action, now)
+                    for input_sha in input_shas
+                    for action in actions
+                ),
+            )
+        if actions:
+            with self._bloom_lock:
+                if self._bloom is not None:
+                    for input_sha in input_shas:
+                        self._bloom.add(input_sha)
+
+    def completed_actions(self, input_sha: str, use_filter: bool = True) -> set[str]:
+        """Returns the names of the actions completed on an input.
+
+        Args:
+            input_sha: SHA-256 of the input
+            use_filter: whether to answer from the Bloom filter when it hasn't
+                seen the input, which may miss inputs completed by other
+                processes in the last BLOOM_REFRESH_INTERVAL seconds
+        """
+        if use_filter and not self._may_have_completed(input_sha):
+            return set()
+        with closing(self._connect()) as conn:
+            return {
+                row[0]
+                for row in conn.execute(
+                    "SELECT action FROM completed WHERE input_sha = ?", (input_sha,)
+                )
+            }
+
+    def completed_many(self, input_shas: list[str]) -> dict[str, set[str]]:
+        """Returns the names of the actions completed on each of several inputs.
+
+        Inputs with no completed actions are left out. Inputs that the Bloom
+        filter hasn't seen are left out without querying the database, and the
+        rest are looked up together.
+        """
+        candidates = self._may_have_completed_many(input_shas)
+        completed = {}
+        if not candidates:
+            return completed
+        with closing(self._connect()) as conn:
+            for i in range(0, len(candidates), LOOKUP_BATCH_SIZE):
+                batch = candidates[i : i + LOOKUP_BATCH_SIZE]
+                for input_sha, action in conn.execute(
+                    "SELECT input_sha, action FROM completed WHERE input_sha IN (%s)"
+                    % ",".join("?" * len(batch)),
+                    batch,
+                ):
+                    completed.setdefault(input_sha, set()).add(action)
+        return completed
+
+    def _may_have_completed(self, input_sha: str) -> bool:
+        return bool(self._may_have_completed_many([input_sha]))
+
+    def _may_have_completed_many(self, input_shas: list[str]) -> list[str]:
+        """Returns the input SHAs that the Bloom filter says may have completed actions."""
+        with self._bloom_lock:
+            if (
+                self._bloom is None
+                or self._bloom.count > self._bloom.capacity
+                or time.monotonic() - self._bloom_refreshed >= BLOOM_REFRESH_INTERVAL
+            ):
+                self._refresh_bloom()
+            return [input_sha for input_sha in input_shas if input_sha in self._bloom]
+
+    def _refresh_bloom(self):
+        """Adds the rows added since the last refresh to the Bloom filter.
+
+        The filter is rebuilt from all rows, twice as large, once it is full.
+        Must be called with the filter's lock held.
+        """
+        with closing(self._connect()) as conn:
+            if self._bloom is None or self._bloom.count > self._bloom.capacity:
+                (inputs,) = conn.execute(
+                    "SELECT COUNT(DISTINCT input_sha) FROM completed"
+                ).fetchone()
+                capacity = BLOOM_CAPACITY
+                while capacity < inputs * 2:
+                    capacity *= 2
+                self._bloom = BloomFilter(capacity)
+                self._bloom_rowid = 0
+            for rowid, input_sha in conn.execute(
+                "SELECT rowid, input_sha FROM completed WHERE rowid > ? ORDER BY rowid",
+                (self._bloom_rowid,),
+            ):
+                self._bloom.add(input_sha)
+                self._bloom_rowid = rowid
+        self._bloom_refreshed = time.monotonic()
+
+    def content_owner(self, content_sha: str) -> Optional[str]:
+        """Returns the SHA-256 of the input some content was first archived from.
+
+        Args:
+            content_sha: SHA-256 of the content
+
+        Returns:
+            the input's SHA-256, or None if the content wasn't archived yet
+        """
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT input_sha FROM contents WHERE content_sha = ?", (content_sha,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def claim_content(self, content_sha: str, input_sha: str) -> str:
+        """Records an input as the first one archived with some content, unless another was.
+
+        Called once the input's archive succeeded, so that inputs repeating the
+        content are only linked to a complete hash list.
+
+        Args:
+            content_sha: SHA-256 of the content
+            input_sha: SHA-256 of the input the content was archived from
+
+        Returns:
+            the SHA-256 of the first input archived with the content:
+            `input_sha` if the content is new, or the input that it duplicates
+        """
+        with closing(self._connect()) as conn, conn:
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO contents (content_sha, input_sha) VALUES (?, ?)",
+                (content_sha, input_sha),
+            )
+            if cur.rowcount == 1:
+                return input_sha
+            (first_input_sha,) = conn.execute(
+                "SELECT input_sha FROM contents WHERE content_sha = ?", (content_sha,)
+            ).fetchone()
+            return first_input_sha
+
+    def all_completed(self) -> dict[str, set[str]]:
+        """Returns the completed actions of every input, keyed by input SHA-256.
+
+        The whole index is read at once, which is much faster than a query per
+        input when checking large input directories.
+        """
+        completed = {}
+        with closing(self._connect()) as conn:
+            for input_sha, action in conn.execute(
+                "SELECT input_sha, action FROM completed"
+            ):
+                completed.setdefault(input_sha, set()).add(action)
+        return completed
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def open_index(db_path: str) -> ProcessedIndex:
+    """Returns the index at a path, shared by all its users in this process."""
+    with _indexes_lock:
+        if db_path not in _indexes:
+            _indexes[db_path] = ProcessedIndex(db_path)
+        return _indexes[db_path]
+
+
+def scan_inputs(input_dir: str):
+    """Yields the paths of all input ZIPs in a directory and its subdirectories.
+
+    Uses `os.scandir`, which gets file types from the directory listing itself,
+    so no file is stat'ed and directories with many files are read quickly.
+    """
+    dirs = [input_dir]
+    while dirs:
+        with os.scandir(dirs.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.path)
+                elif entry.name.endswith(".zip") and entry.is_file():
+                    yield entry.path
+
+
+def seed(input_dir: str, index: ProcessedIndex, hash_list_dir: str = None) -> int:
+    """Seeds a new index from the evidence left by inputs processed before it existed.
+
+    An input already in the directory is recorded as archived if its archive
+    hash list exists. Nothing else leaves evidence of which input it was run
+    on, so the other actions are left to run on the input. Does nothing if the
+    index isn't new.
+
+    Must run before the input directory is watched, so that inputs being
+    processed aren't seeded.
+
+    Args:
+        input_dir: the collection's input directory
+        index: the collection's processed-input index
+        hash_list_dir: the directory of the archive hash lists, or None if the
+            collection isn't archived
+
+    Returns:
+        the number of inputs recorded as archived
+    """
+    if not index.is_new:
+        return 0
+    archived = []
+    if hash_list_dir is not None:
+        archived = [
+            input_sha
+            for input_sha in map(_input_sha, scan_inputs(input_dir))
+            if os.path.exists(os.path.join(hash_list_dir, f"{input_sha}.json"))
+        ]
+        index.mark_many(archived, ["archive"])
+    index.is_new = False
+    _logger.info(
+        f"New processed-input index seeded with {len(archived)} archived inputs"
+    )
+    return len(archived)
+
+
+def missing_work(
+    input_dir: str, index: ProcessedIndex, action_names: list[str]
+) -> list[tuple[str, list[str]]]:
+    """Finds the input files on which some actions haven't completed yet.
+
+    Args:
+        input_dir: the collection's input directory
+        index: the collection's processed-input index
+        action_names: names of the collection's actions
+
+    Returns:
+        list of (input path, names of the actions still to run on it)
+    """
+    completed = index.all_completed()
+    missing = []
+    for path in scan_inputs(input_dir):
+        done = completed.get(_input_sha(path), ())
+        todo = [action for action in action_names if action not in done]
+        if todo:
+            missing.append((path, todo))
+    return missing
+
+
+def _input_sha(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
@@ -0,0 +1,181 @@
+"""Token bucket rate limiting for upstream registration APIs.
+
+Each upstream (ISCN, and each Numbers Protocol chain) has its own bucket.
+Limits can be set per organization with a `rate_limits` object in the
+organization config, keyed by upstream name:
+
+    "rate_limits": {
+        "iscn": {"rate": 0.5, "burst": 1},
+        "avalanche": {"rate": 0.2, "burst": 2}
+    }
+
+`rate` is the sustained number of requests per second, and `burst` is how many
+requests can be sent back to back after the upstream has been idle.
+
+The organizations' file watcher processes share one `RateLimiter`, held by the
+job server, so the limits hold for all of them together. Each upstream gets
+the strictest of the organizations' limits.
+"""
+
+from .log_helper import LogHelper
+
+import threading
+import time
+
+_logger = LogHelper.getLogger()
+
+ISCN = "iscn"
+
+# Defaults match what has proven safe in contrib/reregister.py
+DEFAULT_LIMITS = {
+    ISCN: {"rate": 1 / 2, "burst": 1},
+    # Numbers chains have to wait for the previous block to be made
+    "numbers": {"rate": 1 / 5, "burst": 1},
+    "avalanche": {"rate": 1 / 5, "burst": 1},
+    "near": {"rate": 1 / 5, "burst": 1},
+}
+
+
+class TokenBucket:
+    """A thread-safe token bucket."""
+
+    def __init__(self, rate: float, burst: float = 1):
+        """
+        Args:
+            rate: tokens added per second
+            burst: maximum number of tokens the bucket holds
+        """
+        if rate <= 0 or burst < 1:
+            raise ValueError(f"Invalid token bucket rate {rate} or burst {burst}")
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout: float = None) -> bool:
+        """Takes a token, waiting for one to be available if needed.
+
+        Args:
+            timeout: maximum seconds to wait; None to wait as long as needed
+
+        Returns:
+            True if a token was taken, False if the timeout was reached
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None:
+                if now + wait > deadline:
+                    return False
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """The token buckets of all upstreams."""
+
+    def __init__(self, limits: dict = None):
+        """
+        Args:
+            limits: dictionary of upstream name to {"rate": float, "burst": int};
+                upstreams that aren't included keep their default limits
+        """
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, upstream: str) -> TokenBucket:
+        """Returns the token bucket for an upstream."""
+        with self._lock:
+            if upstream not in self._buckets:
+                limit = self.limits.get(upstream)
+                if limit is None:
+                    raise ValueError(f"No rate limit for upstream {upstream}")
+                self._buckets[upstream] = TokenBucket(
+                    limit["rate"], limit.get("burst", 1)
+                )
+            return self._buckets[upstream]
+
+    def acquire(self, upstream: str, timeout: float = None) -> bool:
+        """Waits until a request to the upstream is allowed; see `acquire`."""
+        return self.bucket(upstream).acquire(timeout)
+
+
+# This process's buckets, and the limiter shared with other processes, if any
+_limiter = RateLimiter()
+_shared = None
+
+
+def configure(limits: dict = None):
+    """Sets the rate limits of this process, replacing any existing buckets.
+
+    Args:
+        limits: dictionary of upstream name to {"rate": float, "burst": int};
+            upstreams that aren't included keep their default limits
+    """
+    global _limiter
+    _limiter = RateLimiter(limits)
+    if limits:
+        _logger.info(f"Configured rate limits: {_limiter.limits}")
+
+
+def use(limiter):
+    """Sets the limiter that `acquire` takes tokens from in this process.
+
+    Args:
+        limiter: a RateLimiter shared with other processes, usually a proxy
+            for the job server's; None to use this process's own buckets
+    """
+    global _shared
+    _shared = limiter
+
+
+def bucket(upstream: str) -> TokenBucket:
+    """Returns this process's token bucket for an upstream."""
+    return _limiter.bucket(upstream)
+
+
+def acquire(upstream: str, timeout: float = None) -> bool:
+    """Waits until a request to the upstream is allowed.
+
+    Args:
+        upstream: upstream name, like "iscn" or a Numbers chain name
+        timeout: maximum seconds to wait; None to wait as long as needed
+
+    Returns:
+        True if the request can be sent, False if the timeout was reached
+    """
+    limiter = _shared
+    if limiter is None:
+        limiter = _limiter
+    return limiter.acquire(upstream, timeout)
+
+
+def strictest_limits(json_config: dict) -> dict:
+    """Returns the rate limits for the registrations of all organizations together.
+
+    The buckets are shared, so each upstream gets the strictest of the
+    organizations' limits.
+
+    Args:
+        json_config: the JSON of the organization configuration file
+    """
+    limits = {}
+    for org in json_config.get("organizations", []):
+        for upstream, limit in org.get("rate_limits", {}).items():
+            if upstream not in limits:
+                limits[upstream] = dict(limit)
+                continue
+            for name, value in limit.items():
+                limits[upstream][name] = min(limits[upstream].get(name, value), value)
+    return limits
@@ -0,0 +1,350 @@
+from . import metrics, scheduler
+from .file_util import FileUtil
+from .iscn import Iscn
+from .leases import LeaseStore
+from .log_helper import LogHelper
+from .numbers import Numbers
+
+from contextlib import closing
+import json
+import sqlite3
+import threading
+import time
+
+_logger = LogHelper.getLogger()
+
+# Registration job kinds
+ISCN = "iscn"
+NUMBERS = "numbersProtocol"
+
+# Retry backoff in seconds: doubled after every failed attempt, up to the max
+RETRY_BASE_DELAY = 30
+RETRY_MAX_DELAY = 6 * 60 * 60
+# Jobs are given up on after this many attempts, see contrib/reregister.py
+MAX_ATTEMPTS = 20
+
+
+class RegistrationOutbox:
+    """A persistent queue of blockchain registrations.
+
+    Each job holds everything needed to register an archived asset (the
+    arguments of `Iscn.register_archive` or `Numbers.register_archive`) and the
+    path of the hash list JSON its receipt goes into. Jobs are stored in a
+    SQLite database so they survive restarts.
+
+    Receipts are saved in the job as soon as the registration goes through,
+    so a job retried after its receipt couldn't be written to the hash list
+    only writes the receipt, rather than registering again.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path: path to the SQLite database file, created if it doesn't exist
+        """
+        self.db_path = db_path
+        with closing(self._connect()) as conn, conn:
+            # A rollback journal, like the leases database: nodes on other
+            # hosts sharing the asset store can't use WAL
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    hash_list_path TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt REAL NOT NULL,
+                    last_error TEXT,
+                    created REAL NOT NULL
+                )""")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_due ON jobs (status, next_attempt)"
+            )
+            self._add_column(conn, "dedup_key TEXT")
+            conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS jobs_dedup_key ON jobs (dedup_key)"
+            )
+            self._add_column(conn, "receipt TEXT")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    @staticmethod
+    def _add_column(conn, column: str):
+        """Adds a column to databases made before it existed."""
+        try:
+            conn.execute(f"ALTER TABLE jobs ADD COLUMN {column}")
+        except sqlite3.OperationalError as e:
+            # Already there, possibly added by another process just now
+            if "duplicate column" not in str(e):
+                raise
+
+    def enqueue(
+        self, kind: str, hash_list_path: str, params: dict, dedup_key: str = None
+    ) -> int:
+        """Adds a registration job to the outbox.
+
+        Args:
+            kind: ISCN or NUMBERS
+            hash_list_path: path to the hash list JSON the receipt is written to
+            params: keyword arguments for the register_archive function of `kind`
+            dedup_key: optional key identifying the registration; if a job with
+                the same key was ever queued, no new job is added
+
+        Returns:
+            the job ID, or the ID of the existing job with the same key
+        """
+        if kind not in (ISCN, NUMBERS):
+            raise ValueError(f"Unknown registration kind {kind}")
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO jobs (kind, hash_list_path, params, next_attempt, created, dedup_key) VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, hash_list_path, json.dumps(params), now, now, dedup_key),
+            )
+            if cur.rowcount == 1:
+                return cur.lastrowid
+            (job_id,) = conn.execute(
+                "SELECT id FROM jobs WHERE dedup_key = ?", (dedup_key,)
+            ).fetchone()
+            _logger.info(f"Registration {dedup_key} already queued as job {job_id}")
+            return job_id
+
+    def due(self, limit: int = 50) -> list[dict]:
+        """Returns pending jobs whose next attempt is due, oldest first."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT id, kind, hash_list_path, params, attempts, receipt FROM jobs WHERE status = 'pending' AND next_attempt <= ? ORDER BY next_attempt LIMIT ?",
+                (time.time(), limit),
+            ).fetchall()
+        return [self._job(row) for row in rows]
+
+    def due_job(self, job_id: int) -> dict:
+        """Returns a job if it is pending and its next attempt is due, or None."""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT id, kind, hash_list_path, params, attempts, receipt FROM jobs WHERE id = ? AND status = 'pending' AND next_attempt <= ?",
+                (job_id, time.time()),
+            ).fetchone()
+        return None if row is None else self._job(row)
+
+    @staticmethod
+    def _job(row) -> dict:
+        return {
+            "id": row[0],
+            "kind": row[1],
+            "hash_list_path": row[2],
+            "params": json.loads(row[3]),
+            "attempts": row[4],
+            "receipt": None if row[5] is None else json.loads(row[5]),
+        }
+
+    def save_receipt(self, job_id: int, receipt: dict):
+        """Saves the receipt of the registrations made so far for a job.
+
+        Args:
+            job_id: the job ID
+            receipt: the ISCN record, or the Numbers records keyed by chain
+        """
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "UPDATE jobs SET receipt = ? WHERE id = ?",
+                (json.dumps(receipt), job_id),
+            )
+
+    def complete(self, job_id: int):
+        """Marks a job as done."""
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', last_error = NULL WHERE id = ?",
+                (job_id,),
+            )
+
+    def retry(self, job_id: int, error: str, params: dict = None):
+        """Records a failed attempt and schedules the next one with backoff.
+
+        Args:
+            job_id: the job ID
+            error: description of the failure
+            params: optional replacement params for the next attempt
+        """
+        with closing(self._connect()) as conn, conn:
+            (attempts,) = conn.execute(
+                "SELECT attempts FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            attempts += 1
+            status = "failed" if attempts >= MAX_ATTEMPTS else "pending"
+            delay = min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = ?, next_attempt = ?, last_error = ? WHERE id = ?",
+                (status, attempts, time.time() + delay, error, job_id),
+            )
+            if params is not None:
+                conn.execute(
+                    "UPDATE jobs SET params = ? WHERE id = ?",
+                    (json.dumps(params), job_id),
+                )
+        return status
+
+    def counts(self) -> dict:
+        """Returns the number of jobs by status."""
+        with closing(self._connect()) as conn:
+            return dict(
+                conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+            )
+
+
+class RegistrationDispatcher:
+    """Drains a registration outbox in a background thread."""
+
+    def __init__(
+        self,
+        outbox: RegistrationOutbox,
+        poll_interval: float = 5,
+        org_id: str = None,
+        leases: LeaseStore = None,
+    ):
+        """
+        Args:
+            outbox: the outbox to drain
+            poll_interval: seconds to wait between checks for due jobs
+            org_id: organization the jobs are for; each job takes a maintenance
+                slot of the scheduler in use for it
+            leases: lease store shared with other nodes draining the same
+                outbox; each job is only attempted by the node holding its lease
+        """
+        self.outbox = outbox
+        self.poll_interval = poll_interval
+        self.org_id = org_id
+        self.leases = leases
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Starts draining the outbox in a daemon thread."""
+        self._thread = threading.Thread(
+            name="registration_dispatcher", target=self._run, daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                processed = self.run_once()
+            except Exception as e:
+                _logger.error(f"Registration dispatcher errored: {e}")
+                processed = 0
+            if processed == 0:
+                self._stop.wait(self.poll_interval)
+
+    def run_once(self) -> int:
+        """Attempts all due jobs once.
+
+        Returns:
+            the number of jobs attempted
+        """
+        jobs = self.outbox.due()
+        for job in jobs:
+            with scheduler.slot(self.org_id, scheduler.MAINTENANCE):
+                self._dispatch_leased(job)
+        return len(jobs)
+
+    def _dispatch_leased(self, job: dict):
+        if self.leases is None:
+            self._dispatch(job)
+            return
+        lease = self.leases.acquire(f"registration/{job['id']}")
+        if lease is None:
+            return
+        with lease:
+            # Another node may have attempted the job since it was listed
+            job = self.outbox.due_job(job["id"])
+            if job is not None:
+                self._dispatch(job)
+
+    def _dispatch(self, job: dict):
+        kind = job["kind"]
+        params = job["params"]
+        # Registrations made by earlier attempts aren't made again
+        receipt = job["receipt"]
+        missing = None
+        try:
+            with metrics.timed(metrics.STAGE_SECONDS, action="register", stage=kind):
+                if kind == ISCN:
+                    if receipt is None:
+                        receipt = Iscn.register_archive(**params)
+                        if receipt is not None:
+                            self._save_receipt(job, receipt)
+                    if receipt is None:
+                        missing = "no receipt"
+                elif kind == NUMBERS:
+                    receipt = receipt or {}
+                    chains = [c for c in params["chains"] if c not in receipt]
+                    if chains:
+                        record = Numbers.register_archive(
+                            **{**params, "chains": chains}
+                        )
+                        if record:
+                            receipt = {**receipt, **record}
+                            self._save_receipt(job, receipt)
+                    failed_chains = [c for c in params["chains"] if c not in receipt]
+                    if failed_chains:
+                        missing = f"chains {failed_chains}"
+                else:
+                    raise ValueError(f"Unknown registration kind {kind}")
+        except Exception as e:
+            missing = str(e)
+
+        if receipt:
+            try:
+                FileUtil.update_json(
+                    job["hash_list_path"],
+                    lambda hash_list: _merge_record(hash_list, kind, receipt),
+                )
+            except Exception as e:
+                # The receipt is kept in the job, and only written on retry
+                _logger.error(
+                    f"Registration {kind} receipt {receipt} not recorded: {e}"
+                )
+                missing = str(e)
+            else:
+                _logger.info(f"Registration {kind} recorded in {job['hash_list_path']}")
+
+        metrics.inc(
+            metrics.REGISTRATIONS_TOTAL,
+            kind=kind,
+            outcome="completed" if missing is None else "failed",
+        )
+        if missing is None:
+            self.outbox.complete(job["id"])
+            return
+
+        status = self.outbox.retry(job["id"], missing)
+        _logger.error(
+            f"Registration {kind} for {job['hash_list_path']} failed ({missing}), job is {status}"
+        )
+
+    def _save_receipt(self, job: dict, receipt: dict):
+        try:
+            self.outbox.save_receipt(job["id"], receipt)
+        except Exception:
+            # Logged so the registration isn't lost if the job is registered again
+            _logger.error(
+                f"Registration receipt {receipt} of job {job['id']} not saved"
+            )
+            raise
+
+
+def _merge_record(hash_list: dict, kind: str, record: dict) -> dict:
+    records = hash_list.setdefault("registrationRecords", {})
+    if kind == NUMBERS:
+        records.setdefault(NUMBERS, {}).update(record)
+    else:
+        records[kind] = record
+    return hash_list
@@ -0,0 +1,251 @@
+"""Weighted fair scheduling of jobs across organizations and job classes.
+
+All file watcher processes share one `FairScheduler`, served by the job
+server (see job_server.py), and take a slot from it for each job they run. Jobs have a class:
+
+- `live`: new input files
+- `backfill`: inputs found by the startup reconciliation
+- `maintenance`: background work, like registration retries
+
+Waiting jobs get slots in weighted fair order: first between classes, by
+class weight, then between organizations within a class, by organization
+weight. A busy organization or class therefore can't starve the others, and
+gets more than its share only when the others are idle. The number of jobs
+running at once is capped globally, per class and per organization.
+
+Weights and caps are set in the config file. Global settings go in a top-level
+`scheduler` object, and organization settings in a `scheduling` object of the
+organization:
+
+    "scheduler": {
+        "max_running": 8,
+        "classes": {"backfill": {"weight": 2, "max_running": 4}}
+    },
+    "organizations": [{"id": "...", "scheduling": {"weight": 2, "max_running": 4}}]
+"""
+
+from .log_helper import LogHelper
+
+from collections import deque
+from contextlib import contextmanager
+import itertools
+import os
+import threading
+import time
+
+_logger = LogHelper.getLogger()
+
+# Job classes
+LIVE = "live"
+BACKFILL = "backfill"
+MAINTENANCE = "maintenance"
+
+DEFAULT_MAX_RUNNING = os.cpu_count() or 4
+DEFAULT_CLASSES = {
+    LIVE: {"weight": 8},
+    BACKFILL: {"weight": 2},
+    MAINTENANCE: {"weight": 1},
+}
+DEFAULT_WEIGHT = 1
+
+
+class FairScheduler:
+    """A thread-safe weighted fair scheduler of job slots."""
+
+    def __init__(
+        self,
+        max_running: int = DEFAULT_MAX_RUNNING,
+        classes: dict = None,
+        orgs: dict = None,
+    ):
+        """
+        Args:
+            max_running: number of jobs that can run at once
+            classes: dictionary of job class to {"weight": float, "max_running": int},
+                merged with the defaults
+            orgs: dictionary of organization ID to {"weight": float, "max_running": int};
+                organizations that aren't listed have weight 1 and no cap
+        """
+        if max_running < 1:
+            raise ValueError(f"Invalid scheduler max_running {max_running}")
+        self.max_running = max_running
+        self.classes = {
+            name: {**DEFAULT_CLASSES.get(name, {}), **conf}
+            for name, conf in {**DEFAULT_CLASSES, **(classes or {})}.items()
+        }
+        self.orgs = orgs or {}
+
+        self._cond = threading.Condition()
+        self._tickets = itertools.count()
+        # (org, class) to queue of waiting tickets
+        self._waiting = {}
+        self._granted = set()
+        self._running = 0
+        self._running_by_class = {}
+        self._running_by_org = {}
+        # Virtual times: the service received, divided by weight
+        self._class_vtime = {}
+        self._flow_vtime = {}
+        self._class_clock = 0.0
+        self._flow_clock = {}
+
+    @staticmethod
+    def from_config(json_config: dict):
+        """Makes a scheduler from the settings in the config file JSON."""
+        conf = json_config.get("scheduler", {})
+        return FairScheduler(
+            conf.get("max_running", DEFAULT_MAX_RUNNING),
+            conf.get("classes"),
+            {
+                org["id"]: org["scheduling"]
+                for org in json_config.get("organizations", [])
+                if "scheduling" in org
+            },
+        )
+
+    def acquire(self, org_id: str, job_class: str = LIVE, timeout: float = None):
+        """Waits for a slot to run a job.
+
+        Args:
+            org_id: organization the job is for
+            job_class: LIVE, BACKFILL or MAINTENANCE
+            timeout: maximum seconds to wait; None to wait as long as needed
+
+        Returns:
+            True if a slot was taken, False if the timeout was reached
+        """
+        if job_class not in self.classes:
+            raise ValueError(f"Unknown job class {job_class}")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        flow = (org_id, job_class)
+        with self._cond:
+            ticket = next(self._tickets)
+            if not self._waiting.get(flow):
+                self._activate(flow)
+            self._waiting.setdefault(flow, deque()).append(ticket)
+            self._schedule()
+
+            while ticket not in self._granted:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._waiting[flow].remove(ticket)
+                    return False
+                self._cond.wait(remaining)
+            self._granted.remove(ticket)
+            return True
+
+    def release(self, org_id: str, job_class: str = LIVE):
+        """Gives back the slot of a job that has finished."""
+        with self._cond:
+            self._running -= 1
+            self._running_by_class[job_class] -= 1
+            self._running_by_org[org_id] -= 1
+            self._schedule()
+
+    def stats(self) -> dict:
+        """Returns the number of running and waiting jobs, by class and organization."""
+        with self._cond:
+            waiting = {}
+            for (org_id, job_class), queue in self._waiting.items():
+                if queue:
+                    waiting.setdefault(job_class, {})[org_id] = len(queue)
+            return {
+                "running": self._running,
+                "runningByClass": dict(self._running_by_class),
+                "runningByOrg": dict(self._running_by_org),
+                "waiting": waiting,
+            }
+
+    def _activate(self, flow):
+        """Brings an idle flow's virtual time up to date, so idling earns no credit."""
+        org_id, job_class = flow
+        if not any(q for (_, c), q in self._waiting.items() if c == job_class):
+            self._class_vtime[job_class] = max(
+                self._class_vtime.get(job_class, 0.0), self._class_clock
+            )
+        self._flow_vtime[flow] = max(
+            self._flow_vtime.get(flow, 0.0), self._flow_clock.get(job_class, 0.0)
+        )
+
+    def _has_room(self, conf: dict, running: int) -> bool:
+        cap = conf.get("max_running")
+        return cap is None or running < cap
+
+    def _schedule(self):
+        granted = False
+        while self._running < self.max_running:
+            flow = self._pick()
+            if flow is None:
+                break
+            org_id, job_class = flow
+            self._granted.add(self._waiting[flow].popleft())
+            self._running += 1
+            self._running_by_class[job_class] = (
+                self._running_by_class.get(job_class, 0) + 1
+            )
+            self._running_by_org[org_id] = self._running_by_org.get(org_id, 0) + 1
+
+            class_weight = self.classes[job_class].get("weight", DEFAULT_WEIGHT)
+            org_weight = self.orgs.get(org_id, {}).get("weight", DEFAULT_WEIGHT)
+            self._class_clock = self._class_vtime[job_class]
+            self._flow_clock[job_class] = self._flow_vtime[flow]
+            self._class_vtime[job_class] += 1 / class_weight
+            self._flow_vtime[flow] += 1 / org_weight
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _pick(self):
+        """Returns the waiting flow to serve next, or None if none can run now."""
+        best = None
+        for flow, queue in self._waiting.items():
+            org_id, job_class = flow
+            if not queue:
+                continue
+            if not self._has_room(
+                self.classes[job_class], self._running_by_class.get(job_class, 0)
+            ):
+                continue
+            if not self._has_room(
+                self.orgs.get(org_id, {}), self._running_by_org.get(org_id, 0)
+            ):
+                continue
+            key = (self._class_vtime[job_class], self._flow_vtime[flow], queue[0])
+            if best is None or key < best[0]:
+                best = (key, flow)
+        return None if best is None else best[1]
+
+
+_scheduler = None
+
+
+def use(scheduler):
+    """Sets the scheduler that `slot` takes slots from in this process.
+
+    Args:
+        scheduler: a FairScheduler or a proxy for one; None to run jobs
+            without scheduling
+    """
+    global _scheduler
+    _scheduler = scheduler
+
+
+@contextmanager
+def slot(org_id: str, job_class: str = LIVE):
+    """Runs the enclosed job in a scheduler slot, waiting for one if needed.
+
+    Does nothing if no scheduler is in use.
+    """
+    scheduler = _scheduler
+    if scheduler is None:
+        yield
+        return
+    start = time.monotonic()
+    scheduler.acquire(org_id, job_class)
+    waited = time.monotonic() - start
+    if waited > 1:
+        _logger.info(f"Waited {waited:.1f}s for a {job_class} slot for {org_id}")
+    try:
+        yield
+    finally:
+        scheduler.release(org_id, job_class)
@@ -0,0 +1,237 @@
+"""Admission control of jobs by the scratch disk space they need.
+
+Processing an input takes several times its size in scratch space: the
+extracted files, copies of the ZIP, and the archive and its encrypted copy.
+Before a job starts, it reserves an estimate of that space against the free
+space of the scratch file system. Jobs that don't fit wait for running jobs to
+release their reservations, instead of all failing once the disk is full.
+
+Reservations are made with a `ScratchSpace` shared by all processes through
+the job server (see job_server.py). Free space is read with `statvfs` and
+space reserved by running jobs is subtracted from it in full, even as they
+use it up, so the estimate errs on the side of waiting.
+
+Jobs write to two places: the scratch space, and the internal asset store,
+where the archive action makes its archives in its stage journal. Space is
+reserved on the file system of each, or once if they are the same.
+
+Scratch space is under `SCRATCH_DIR` if set, or `INTERNAL_ASSET_STORE`. It
+should be on the same file system as `INTERNAL_ASSET_STORE`, so files staged
+in it are moved into the store with a rename rather than a copy.
+"""
+
+from . import config
+from .log_helper import LogHelper
+
+from contextlib import contextmanager
+import itertools
+import os
+import threading
+import time
+
+_logger = LogHelper.getLogger()
+
+# Free space, in bytes, that reservations never use
+DEFAULT_MIN_FREE_BYTES = 1024**3
+# Where jobs write their files: the scratch space, and the internal asset store
+SCRATCH = "scratch"
+STORE = "store"
+# Space an action needs in each place, as a multiple of the input size; the
+# shared ingest of each input needs one more in the scratch space
+ACTION_FACTORS = {
+    # The archive and its encrypted copy are made in the journal, in the store
+    "archive": {SCRATCH: 1, STORE: 2},
+    "c2pa-proofmode": {SCRATCH: 2},
+    "copy-proofmode": {SCRATCH: 2},
+    "c2pa-starling-capture": {SCRATCH: 1},
+}
+INGEST_FACTOR = 1
+# Seconds between checks of free space while a job waits
+RECHECK_INTERVAL = 5
+
+
+def scratch_root() -> str:
+    """Returns the directory under which jobs stage their files."""
+    return config.SCRATCH_DIR or config.INTERNAL_ASSET_STORE
+
+
+def estimate(zip_path: str, action_names: list[str]) -> dict:
+    """Estimates the space, in bytes, to run actions on an input.
+
+    Returns:
+        dictionary of SCRATCH or STORE to the space needed there
+    """
+    size = os.path.getsize(zip_path)
+    need = {SCRATCH: size * INGEST_FACTOR}
+    for action in action_names:
+        for where, factor in ACTION_FACTORS.get(action, {SCRATCH: 1}).items():
+            need[where] = need.get(where, 0) + size * factor
+    return need
+
+
+class ScratchSpace:
+    """Reservations of the free space of the scratch and store file systems."""
+
+    def __init__(
+        self,
+        path: str,
+        min_free_bytes: int = DEFAULT_MIN_FREE_BYTES,
+        store_path: str = None,
+    ):
+        """
+        Args:
+            path: a directory on the scratch file system
+            min_free_bytes: free space that is never reserved, on each file system
+            store_path: a directory on the file system of the internal asset
+                store; None if it is the scratch file system
+        """
+        self.paths = {SCRATCH: path, STORE: store_path or path}
+        # Space in the store is reserved as scratch space if they are the same
+        self.same_file_system = (
+            store_path is None or os.stat(path).st_dev == os.stat(store_path).st_dev
+        )
+        self.min_free_bytes = min_free_bytes
+        self._cond = threading.Condition()
+        self._ids = itertools.count(1)
+        self._reserved = {}
+
+    @staticmethod
+    def from_config(json_config: dict):
+        """Makes the scratch space of the settings in the config file JSON.
+
+        Raises:
+            ValueError if SCRATCH_DIR or INTERNAL_ASSET_STORE doesn't exist
+                and can't be created
+        """
+        for name in ("SCRATCH_DIR", "INTERNAL_ASSET_STORE"):
+            path = getattr(config, name)
+            if not path:
+                continue
+            try:
+                os.makedirs(path, exist_ok=True)
+            except OSError as e:
+                raise ValueError(f"{name} {path} can't be created: {e}")
+        space = ScratchSpace(
+            scratch_root(),
+            json_config.get("scratch", {}).get(
+                "min_free_bytes", DEFAULT_MIN_FREE_BYTES
+            ),
+            config.INTERNAL_ASSET_STORE,
+        )
+        if not space.same_file_system:
+            _logger.warning(
+                f"SCRATCH_DIR {config.SCRATCH_DIR} is not on the same file system as INTERNAL_ASSET_STORE, so staged files will be copied into the store"
+            )
+        return space
+
+    def free_bytes(self, where: str = SCRATCH) -> int:
+        """Returns the space available to unprivileged users on a file system.
+
+        Args:
+            where: SCRATCH or STORE
+        """
+        stat = os.statvfs(self.paths[where])
+        return stat.f_bavail * stat.f_frsize
+
+    def available(self, where: str = SCRATCH) -> int:
+        """Returns the space that can be reserved now on a file system."""
+        with self._cond:
+            return self._available(self._file_system(where))
+
+    def _available(self, where: str) -> int:
+        reserved = sum(need.get(where, 0) for need in self._reserved.values())
+        return self.free_bytes(where) - reserved - self.min_free_bytes
+
+    def _file_system(self, where: str) -> str:
+        return SCRATCH if self.same_file_system else where
+
+    def _by_file_system(self, nbytes) -> dict:
+        if isinstance(nbytes, int):
+            nbytes = {SCRATCH: nbytes}
+        need = {}
+        for where, size in nbytes.items():
+            where = self._file_system(where)
+            need[where] = need.get(where, 0) + size
+        return need
+
+    def reserve(self, nbytes, timeout: float = None) -> int:
+        """Waits until there is room for a reservation and makes it.
+
+        A job that needs more than can ever be free is let through once no
+        other job holds a reservation, with a warning.
+
+        Args:
+            nbytes: space to reserve, as returned by `estimate`, or a number
+                of bytes of scratch space
+            timeout: maximum seconds to wait; None to wait as long as needed
+
+        Returns:
+            the reservation ID, to pass to `release`, or None if the timeout
+            was reached
+        """
+        need = self._by_file_system(nbytes)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                available = {where: self._available(where) for where in need}
+                fits = all(need[where] <= available[where] for where in need)
+                if fits or not self._reserved:
+                    if not fits:
+                        _logger.warning(
+                            f"Job needs {need} bytes of space, but only {available} are available"
+                        )
+                    reservation = next(self._ids)
+                    self._reserved[reservation] = need
+                    return reservation
+                wait = RECHECK_INTERVAL
+                if deadline is not None:
+                    wait = min(wait, deadline - time.monotonic())
+                    if wait <= 0:
+                        return None
+                self._cond.wait(wait)
+
+    def release(self, reservation: int):
+        """Ends a reservation once its job is done."""
+        with self._cond:
+            self._reserved.pop(reservation, None)
+            self._cond.notify_all()
+
+    def reserved_bytes(self, where: str = SCRATCH) -> int:
+        with self._cond:
+            where = self._file_system(where)
+            return sum(need.get(where, 0) for need in self._reserved.values())
+
+
+_scratch = None
+
+
+def use(scratch):
+    """Sets the scratch space that `reservation` reserves space in, in this process.
+
+    Args:
+        scratch: a ScratchSpace or a proxy for one; None to run jobs without
+            reserving space
+    """
+    global _scratch
+    _scratch = scratch
+
+
+@contextmanager
+def reservation(nbytes):
+    """Runs the enclosed job with scratch space reserved, waiting for it if needed.
+
+    Does nothing if no scratch space is in use.
+    """
+    scratch = _scratch
+    if scratch is None:
+        yield
+        return
+    start = time.monotonic()
+    reservation_id = scratch.reserve(nbytes)
+    waited = time.monotonic() - start
+    if waited > 1:
+        _logger.info(f"Waited {waited:.1f}s for {nbytes} bytes of space")
+    try:
+        yield
+    finally:
+        scratch.release(reservation_id)
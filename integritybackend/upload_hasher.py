@@ -0,0 +1,184 @@
+"""Hashing of input files while they are being uploaded.
+
+Input ZIPs are named after their SHA-256, which is verified before they are
+processed. For large uploads, reading the whole file again once it is closed
+adds to the time before processing starts. Uploads are written from start to
+end, so instead the bytes appended to a new file can be hashed as they land,
+on each modification event, and the SHA-256 is known by the time the file is
+closed.
+
+This only holds for files that are only appended to. A write that doesn't
+extend the file, seen as a modification without growth, makes the hasher give
+up on the file. Ingest checks the SHA-256 against the file name and the file's
+identity, size and modification time against those seen by the hasher, and
+reads the whole file if any of them differ.
+"""
+
+from .log_helper import LogHelper
+
+from hashlib import sha256
+import os
+import threading
+
+_logger = LogHelper.getLogger()
+
+BUFFER_SIZE = 1024 * 1024
+
+
+class UploadDigest:
+    """The SHA-256 of a file, with the state of the file when it was hashed."""
+
+    def __init__(self, sha256: str, dev: int, ino: int, size: int, mtime_ns: int):
+        self.sha256 = sha256
+        self.dev = dev
+        self.ino = ino
+        self.size = size
+        self.mtime_ns = mtime_ns
+
+    def matches(self, path: str) -> bool:
+        """Whether the file at a path is still the one that was hashed, unchanged."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns) == (
+            self.dev,
+            self.ino,
+            self.size,
+            self.mtime_ns,
+        )
+
+
+class _Progress:
+    """A file being hashed."""
+
+    def __init__(self, stat: os.stat_result):
+        self.dev = stat.st_dev
+        self.ino = stat.st_ino
+        self.hasher = sha256()
+        self.offset = 0
+        # Modification time when the whole file had been read
+        self.mtime_ns = None
+        self.rewritten = False
+        self.lock = threading.Lock()
+
+
+class UploadHasher:
+    """Hashes files as they are appended to, in a background thread."""
+
+    def __init__(self, name: str):
+        """
+        Args:
+            name: name of the hashing thread
+        """
+        self.name = name
+        self._cond = threading.Condition()
+        # Progress of the files tracked, None until a file is first read
+        self._files = {}
+        # Paths with bytes to hash
+        self._dirty = {}
+        self._thread = None
+
+    def update(self, path: str):
+        """Notes that a file was written to; its new bytes are hashed in the background."""
+        with self._cond:
+            self._files.setdefault(path, None)
+            self._dirty[path] = None
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=self.name, daemon=True
+                )
+                self._thread.start()
+            self._cond.notify()
+
+    def finish(self, path: str) -> UploadDigest:
+        """Hashes the rest of a complete file and stops tracking it.
+
+        Returns:
+            the file's digest, or None if the file wasn't hashed as it was
+            written or was rewritten
+        """
+        with self._cond:
+            self._dirty.pop(path, None)
+            progress = self._files.pop(path, None)
+        if progress is None:
+            return None
+        with progress.lock:
+            try:
+                stat = self._read(path, progress)
+            except OSError as e:
+                _logger.warning(f"Couldn't finish hashing {path}: {e}")
+                return None
+            if progress.rewritten or stat.st_size != progress.offset:
+                return None
+            return UploadDigest(
+                progress.hasher.hexdigest(),
+                progress.dev,
+                progress.ino,
+                progress.offset,
+                stat.st_mtime_ns,
+            )
+
+    def discard(self, path: str):
+        """Stops tracking a file, like one that was deleted."""
+        with self._cond:
+            self._dirty.pop(path, None)
+            self._files.pop(path, None)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._dirty:
+                    self._cond.wait()
+                path = next(iter(self._dirty))
+                del self._dirty[path]
+                progress = self._files.get(path)
+            try:
+                if progress is None:
+                    progress = _Progress(os.stat(path))
+                    with self._cond:
+                        # Unless the file was finished or discarded meanwhile
+                        if path not in self._files:
+                            continue
+                        if self._files[path] is None:
+                            self._files[path] = progress
+                        progress = self._files[path]
+                with progress.lock:
+                    self._read(path, progress)
+            except OSError as e:
+                _logger.debug(f"Couldn't hash {path} while it is written: {e}")
+                self.discard(path)
+
+    @staticmethod
+    def _read(path: str, progress: _Progress) -> os.stat_result:
+        """Hashes the bytes appended to a file since it was last read.
+
+        Returns:
+            the file's status once read to the end
+        """
+        if progress.rewritten:
+            return os.stat(path)
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            if (
+                (stat.st_dev, stat.st_ino) != (progress.dev, progress.ino)
+                or stat.st_size < progress.offset
+                or (
+                    stat.st_size == progress.offset
+                    and progress.mtime_ns is not None
+                    and stat.st_mtime_ns != progress.mtime_ns
+                )
+            ):
+                # Written somewhere other than the end: not an append-only upload
+                progress.rewritten = True
+                _logger.info(f"{path} was rewritten, it will be hashed once complete")
+                return stat
+            f.seek(progress.offset)
+            for block in iter(lambda: f.read(BUFFER_SIZE), b""):
+                progress.hasher.update(block)
+                progress.offset += len(block)
+            stat = os.fstat(f.fileno())
+        progress.mtime_ns = (
+            stat.st_mtime_ns if stat.st_size == progress.offset else None
+        )
+        return stat
@@ -0,0 +1,205 @@
+from . import metrics
+from .log_helper import LogHelper
+
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+import os
+import threading
+
+_logger = LogHelper.getLogger()
+
+DEFAULT_WORKERS = 2
+DEFAULT_MODE = "thread"
+DEFAULT_MAX_QUEUE = 100
+# Queue depth, as a fraction of max_queue, above which backpressure is logged
+HIGH_WATER_MARK = 0.8
+# Seconds the shared process pool waits for running jobs when shutting down
+SHUTDOWN_TIMEOUT = 60
+
+
+class WorkerPool:
+    """A bounded pool of workers that runs the jobs of one collection.
+
+    Jobs wait in a queue of at most `max_queue` jobs. When the queue is full,
+    `submit` blocks until a job finishes, which pushes back on the file watcher
+    instead of letting jobs pile up in memory.
+
+    The pool is configured with an optional `workers` object in the collection
+    config:
+
+        "workers": {"count": 4, "mode": "thread", "max_queue": 100}
+
+    `mode` is "thread" or "process". Process workers run jobs in parallel on
+    several cores, but jobs and their arguments must be picklable.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        workers: int = DEFAULT_WORKERS,
+        mode: str = DEFAULT_MODE,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+    ):
+        """
+        Args:
+            name: name of the pool, used in logs and thread names
+            workers: number of jobs run at once
+            mode: "thread" or "process"
+            max_queue: number of jobs that can wait for a worker
+        """
+        if workers < 1 or max_queue < 0:
+            raise ValueError(f"Invalid worker pool size {workers} or queue {max_queue}")
+        if mode == "thread":
+            self.executor = ThreadPoolExecutor(workers, thread_name_prefix=name)
+        elif mode == "process":
+            self.executor = ProcessPoolExecutor(workers)
+        else:
+            raise ValueError(f"Unknown worker pool mode {mode}")
+
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._depth = 0
+        self._depth_lock = threading.Lock()
+        _logger.info(
+            f"Worker pool {name} started with {workers} {mode} workers and a queue of {max_queue}"
+        )
+
+    @staticmethod
+    def from_config(name: str, collection_config: dict):
+        """Makes a worker pool with the settings of a collection config."""
+        conf = collection_config.get("workers", {})
+        return WorkerPool(
+            name,
+            conf.get("count", DEFAULT_WORKERS),
+            conf.get("mode", DEFAULT_MODE),
+            conf.get("max_queue", DEFAULT_MAX_QUEUE),
+        )
+
+    @property
+    def depth(self) -> int:
+        """Number of jobs queued or running."""
+        return self._depth
+
+    def submit(self, fn, *args) -> Future:
+        """Queues a job, waiting for room in the queue if it is full.
+
+        Args:
+            fn: the function to run
+            args: arguments to the function
+
+        Returns:
+            a Future for the job's result
+        """
+        if not self._slots.acquire(blocking=False):
+            _logger.warning(
+                f"Worker pool {self.name} queue is full ({self._depth} jobs), waiting for room"
+            )
+            self._slots.acquire()
+
+        with self._depth_lock:
+            self._depth += 1
+            depth = self._depth
+            metrics.set_gauge(metrics.QUEUE_DEPTH, depth, pool=self.name)
+        queued = depth - self.workers
+        if self.max_queue and queued > self.max_queue * HIGH_WATER_MARK:
+            _logger.warning(
+                f"Worker pool {self.name} is backed up: {queued} of {self.max_queue} queue slots used"
+            )
+
+        try:
+            future = self.executor.submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def _release(self):
+        with self._depth_lock:
+            self._depth -= 1
+            metrics.set_gauge(metrics.QUEUE_DEPTH, self._depth, pool=self.name)
+        self._slots.release()
+
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait)
+
+
+class ProcessPool:
+    """A pool of worker processes shared by all organizations.
+
+    The workers are forked when the pool is made, so they start with the
+    modules, configuration and keys already loaded in the process making the
+    pool, and stay up for its lifetime. The organization file watchers run
+    their jobs in it through `run_job`, so jobs of any organization use all
+    the host's cores.
+    """
+
+    def __init__(self, processes: int = None, initializer=None, initargs=()):
+        """
+        Args:
+            processes: number of worker processes; the number of CPUs if None
+            initializer: function each worker process runs when it starts
+            initargs: arguments to the initializer
+        """
+        self.processes = processes or os.cpu_count() or DEFAULT_WORKERS
+        self._pool = multiprocessing.Pool(self.processes, initializer, initargs)
+        _logger.info(f"Process pool started with {self.processes} processes")
+
+    def run(self, fn, *args):
+        """Runs a job in a worker process and waits for it.
+
+        Args:
+            fn: the function to run, which must be picklable like its arguments
+            args: arguments to the function
+
+        Returns:
+            the function's result
+
+        Raises:
+            the exception raised by the function
+        """
+        return self._pool.apply(fn, args)
+
+    def shutdown(self, timeout: float = SHUTDOWN_TIMEOUT):
+        """Stops taking jobs and waits for the running ones to finish.
+
+        Args:
+            timeout: seconds to wait before killing the worker processes
+        """
+        self._pool.close()
+        joiner = threading.Thread(target=self._pool.join, daemon=True)
+        joiner.start()
+        joiner.join(timeout)
+        if joiner.is_alive():
+            _logger.warning(
+                f"Process pool jobs still running after {timeout}s, terminating them"
+            )
+            self._pool.terminate()
+        _logger.info("Process pool shut down")
+
+
+_process_pool = None
+
+
+def use_process_pool(pool):
+    """Sets the shared process pool that `run_job` runs jobs in.
+
+    Args:
+        pool: a ProcessPool or a proxy for one; None to run jobs in the
+            calling thread
+    """
+    global _process_pool
+    _process_pool = pool
+
+
+def run_job(fn, *args):
+    """Runs a job in the shared process pool, or in this thread if none is in use.
+
+    Returns:
+        the function's result
+    """
+    if _process_pool is None:
+        return fn(*args)
+    return _process_pool.run(fn, *args)
@@ -1,17 +1,19 @@
 import os
 import signal
 import sys
+import tempfile
 import time
 
 
-from integritybackend import config
+from integritybackend import config, job_server, metrics
 from integritybackend.asset_helper import AssetHelper
+from integritybackend.async_service import AsyncService
 from integritybackend.fs_watcher import FsWatcher
 from integritybackend.log_helper import LogHelper
 
-
 _logger = LogHelper.getLogger()
 _procs = list()
+_job_server = None
 
 
 def signal_handler(signum, frame):
@@ -19,11 +21,16 @@ def signal_handler(signum, frame):
     SIGINT handler for the main process.
     """
     _logger.info("Terminating processes...")
-    kill_processes(_procs)
+    kill_processes(_procs, _job_server)
     sys.exit(0)
 
 
-def kill_processes(procs):
+def kill_processes(procs, server=None):
+    """Terminates the file watcher processes, then stops the job server.
+
+    The jobs already running in the shared process pool are given time to
+    finish.
+    """
     for proc in procs:
         if proc.is_alive():
             try:
@@ -42,6 +49,10 @@ def kill_processes(procs):
         else:
             _logger.info("Process %s [%s] is terminated" % (proc.pid, proc.name))
 
+    if server is not None:
+        _logger.info("Stopping job server...")
+        job_server.stop(server)
+
 
 if __name__ == "__main__":
     signal.signal(signal.SIGINT, signal_handler)
@@ -50,8 +61,29 @@ if __name__ == "__main__":
     for org_id in config.ORGANIZATION_CONFIG.all_orgs():
         AssetHelper(org_id).init_dirs()
 
+    if config.METRICS_PORT:
+        # Enabled before forking, so every process writes its metrics
+        metrics.enable(
+            config.METRICS_DIR or tempfile.mkdtemp(prefix="integrity-metrics-")
+        )
+        metrics.serve(int(config.METRICS_PORT))
+
+    if config.SERVICE_MODE == "async":
+        # All organizations' inputs are processed on one event loop.
+        AsyncService.from_config(config.ORGANIZATION_CONFIG).run()
+        sys.exit(0)
+
+    # All organizations share the job slots and one pool of worker processes.
+    _job_server = job_server.start(config.ORGANIZATION_CONFIG.json_config)
+
     # Start up processes for services.
-    _procs = FsWatcher.init_all(config.ORGANIZATION_CONFIG)
+    _procs = FsWatcher.init_all(
+        config.ORGANIZATION_CONFIG,
+        _job_server.scheduler(),
+        _job_server.pool(),
+        _job_server.scratch(),
+        _job_server.rate_limiter(),
+    )
 
     for proc in _procs:
         proc.start()
@@ -0,0 +1,71 @@
+import pytest
+
+from .context import asset_helper
+from .context import config
+from .context import crypto_util
+from .context import file_util
+from .context import rate_limit
+
+
+@pytest.fixture(autouse=True)
+def unthrottled_upstreams():
+    """Lifts upstream rate limits, so tests don't wait on them."""
+    unthrottled = {"rate": 1000, "burst": 1000}
+    rate_limit.configure({name: unthrottled for name in rate_limit.DEFAULT_LIMITS})
+    yield
+    rate_limit.configure()
+
+
+ORG_ID = "test-org"
+COLLECTION_ID = "test-collection"
+
+# Archive action params with every external service turned off
+ARCHIVE_PARAMS = {
+    "encryption": {"algo": "aes-256-cbc", "key": "test-key"},
+    "signers": {"authsign": {"active": False}},
+    "registration_policies": {
+        "opentimestamps": {"active": False},
+        "iscn": {"active": False},
+        "numbersprotocol": {"active": False},
+    },
+}
+
+
+@pytest.fixture
+def org_env(tmp_path, monkeypatch):
+    """Sets up asset directories and configuration for one org and collection.
+
+    The archive action is configured without external services, and CIDs are
+    computed without the IPFS client.
+    """
+    monkeypatch.setattr(config, "INTERNAL_ASSET_STORE", str(tmp_path / "internal"))
+    monkeypatch.setattr(config, "SHARED_FILE_SYSTEM", str(tmp_path / "shared"))
+    monkeypatch.setattr(crypto_util, "KEY_STORE", str(tmp_path / "keys"))
+    monkeypatch.setattr(
+        file_util.FileUtil,
+        "digest_cidv1",
+        staticmethod(lambda path: "bafy" + file_util.FileUtil().digest_sha256(path)),
+    )
+
+    async def digest_cidv1_async(path):
+        return "bafy" + file_util.FileUtil().digest_sha256(path)
+
+    monkeypatch.setattr(
+        file_util.FileUtil, "digest_cidv1_async", staticmethod(digest_cidv1_async)
+    )
+
+    collection = {
+        "id": COLLECTION_ID,
+        "asset_extensions": ["jpg"],
+        "actions": [{"name": "archive", "params": ARCHIVE_PARAMS}],
+    }
+    org_config = config.OrganizationConfig(None)
+    org_config.json_config = {
+        "organizations": [{"id": ORG_ID, "collections": [collection]}]
+    }
+    org_config._index_json_config()
+    monkeypatch.setattr(config, "ORGANIZATION_CONFIG", org_config)
+
+    helper = asset_helper.AssetHelper(ORG_ID)
+    helper.init_dirs()
+    return helper
@@ -5,10 +5,30 @@ import os
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+from integritybackend import actions
 from integritybackend import asset_helper
+from integritybackend import async_service
+from integritybackend import bloom
 from integritybackend import claim
 from integritybackend import config
 from integritybackend import crypto_util
 from integritybackend import file_util
+from integritybackend import filecoin
+from integritybackend import filecoin_pack
+from integritybackend import fs_watcher
+from integritybackend import ingest
 from integritybackend import iscn
+from integritybackend import job_server
+from integritybackend import leases
+from integritybackend import metrics
+from integritybackend import numbers
+from integritybackend import pipeline
+from integritybackend import polling
+from integritybackend import processed_index
+from integritybackend import rate_limit
+from integritybackend import registration_outbox
+from integritybackend import scheduler
+from integritybackend import scratch
+from integritybackend import upload_hasher
+from integritybackend import worker_pool
 from integritybackend import zip_util
@@ -0,0 +1,156 @@
+"""Local stand-ins for external services and binaries used in tests."""
+
+from .context import filecoin
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hashlib
+import io
+import json
+import os
+import stat
+import sys
+import threading
+import zipfile
+
+
+class Web3StorageStandIn:
+    """A local stand-in for web3.storage that records the requests it gets.
+
+    Uploads to /car are answered with the root of the CAR, which the fake IPFS
+    client below stores as the whole CAR header.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.failures = 0  # Number of requests to fail before succeeding
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                stand_in.requests.append((self.path, dict(self.headers), body))
+                if stand_in.failures > 0:
+                    stand_in.failures -= 1
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+                cid = "bafyroot"
+                if self.path == "/car":
+                    stream = io.BytesIO(body)
+                    cid = stream.read(filecoin._read_varint(stream)).decode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(json.dumps({"cid": cid}).encode())
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+FAKE_IPFS = """
+import hashlib, json, os, sys
+
+state_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ipfs-state.json")
+state = json.load(open(state_path)) if os.path.exists(state_path) else {}
+
+def varint(n):
+    out = b""
+    while True:
+        if n < 0x80:
+            return out + bytes([n])
+        out += bytes([(n & 0x7F) | 0x80])
+        n >>= 7
+
+def file_cid(path):
+    with open(path, "rb") as f:
+        return "bafk" + hashlib.sha256(f.read()).hexdigest()[:32]
+
+args = sys.argv[1:]
+if args[0] == "add":
+    files = [a for a in args[1:] if not a.startswith("-")]
+    cids = [file_cid(f) for f in files]
+    if "-Q" in args:
+        state[cids[0]] = files
+        print(cids[0])
+    else:
+        root = "bafydir" + hashlib.sha256("".join(cids).encode()).hexdigest()[:32]
+        state[root] = files
+        for f, cid in zip(files, cids):
+            state[cid] = [f]
+            print(f"added {cid} {os.path.basename(f)}")
+        print(f"added {root} ")
+    json.dump(state, open(state_path, "w"))
+elif args[:2] == ["dag", "export"]:
+    root = args[2].encode()
+    out = sys.stdout.buffer
+    out.write(varint(len(root)) + root)
+    for f in state[args[2]]:
+        data = open(f, "rb").read()
+        out.write(varint(len(data)) + data)
+elif args[:2] == ["refs", "-r"]:
+    if args[-1].startswith("bafydir"):
+        for f in state[args[-1]]:
+            print(file_cid(f))
+elif args[:2] == ["block", "rm"]:
+    for cid in [a for a in args[2:] if not a.startswith("-")]:
+        state.pop(cid, None)
+    json.dump(state, open(state_path, "w"))
+else:
+    sys.exit(1)
+"""
+
+
+def write_fake_ipfs(directory) -> str:
+    """Writes a fake IPFS client that supports `add`, `dag export`, `refs` and `block rm`.
+
+    The blocks in its repo are kept in `ipfs-state.json` next to it.
+
+    Returns:
+        path to the executable
+    """
+    path = os.path.join(directory, "ipfs")
+    with open(path, "w") as f:
+        f.write(f"#!{sys.executable}\n{FAKE_IPFS}")
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return path
+
+
+def fake_ipfs_blocks(ipfs_path) -> list:
+    """Lists the CIDs of the blocks in the repo of a fake IPFS client."""
+    state_path = os.path.join(os.path.dirname(ipfs_path), "ipfs-state.json")
+    if not os.path.exists(state_path):
+        return []
+    with open(state_path) as f:
+        return sorted(json.load(f))
+
+
+def make_input_bundle(
+    directory, content: bytes, ext: str = "jpg", meta_recorder: bytes = b"{}"
+) -> str:
+    """Writes a preprocessor ZIP with content, meta-content and meta-recorder files.
+
+    Returns:
+        path to the ZIP, named with its SHA-256 like real inputs
+    """
+    content_sha = hashlib.sha256(content).hexdigest()
+    with open("tests/assets/meta-content.json", "rb") as f:
+        meta_content = f.read()
+
+    tmp_path = os.path.join(directory, f"{content_sha}.tmp")
+    with zipfile.ZipFile(tmp_path, "w") as zipf:
+        zipf.writestr(f"{content_sha}.{ext}", content)
+        zipf.writestr(f"{content_sha}-meta-content.json", meta_content)
+        zipf.writestr(f"{content_sha}-meta-recorder.json", meta_recorder)
+    with open(tmp_path, "rb") as f:
+        zip_sha = hashlib.sha256(f.read()).hexdigest()
+    zip_path = os.path.join(directory, f"{zip_sha}.zip")
+    os.rename(tmp_path, zip_path)
+    return zip_path
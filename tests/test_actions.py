@@ -0,0 +1,155 @@
+from .conftest import ARCHIVE_PARAMS, COLLECTION_ID, ORG_ID
+from .context import actions
+from .context import config
+from .context import file_util
+from .context import zip_util
+from .stand_ins import make_input_bundle
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import time
+
+import pytest
+
+_actions = actions.Actions()
+
+
+def test_archive(org_env, tmp_path):
+    zip_path = make_input_bundle(str(tmp_path), b"content")
+
+    results = _actions.archive(zip_path, ORG_ID, COLLECTION_ID)
+
+    with open(results["hashList"]) as f:
+        hash_list = json.load(f)
+    assert hash_list["inputBundle"]["sha256"] in zip_path
+    assert hash_list["registrationRecords"] == {}
+    assert (
+        os.path.basename(results["archive"]) == hash_list["archive"]["sha256"] + ".zip"
+    )
+    assert len(zip_util.listing(results["archive"])) == 3
+    assert os.path.exists(results["archiveEncrypted"])
+    # Only the job's own temporary directory existed, and it is gone
+    assert os.listdir(org_env.path_for_action_tmp(COLLECTION_ID, "archive")) == []
+
+
+def test_concurrent_archive_jobs(org_env, tmp_path):
+    zip_paths = [
+        make_input_bundle(str(tmp_path), f"content {i}".encode()) for i in range(8)
+    ]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(
+            executor.map(
+                lambda zip_path: _actions.archive(zip_path, ORG_ID, COLLECTION_ID),
+                zip_paths,
+            )
+        )
+
+    for zip_path, result in zip(zip_paths, results):
+        with open(result["hashList"]) as f:
+            hash_list = json.load(f)
+        assert hash_list["inputBundle"]["sha256"] in zip_path
+        assert os.path.exists(result["archiveEncrypted"])
+    assert len({r["archive"] for r in results}) == 8
+    assert os.listdir(org_env.path_for_action_tmp(COLLECTION_ID, "archive")) == []
+
+
+def test_job_contexts_have_separate_tmp_dirs(org_env, tmp_path):
+    zip_path = make_input_bundle(str(tmp_path), b"content")
+
+    with actions.JobContext("archive", zip_path, ORG_ID, COLLECTION_ID) as first:
+        with actions.JobContext("archive", zip_path, ORG_ID, COLLECTION_ID) as second:
+            assert first.tmp_dir != second.tmp_dir
+            assert os.path.isdir(first.tmp_dir) and os.path.isdir(second.tmp_dir)
+        assert not os.path.exists(second.tmp_dir)
+        assert os.path.isdir(first.tmp_dir)
+
+
+def test_archive_appends_proofs_in_fixed_order(org_env, tmp_path, monkeypatch):
+    params = config.ORGANIZATION_CONFIG.get_action(ORG_ID, COLLECTION_ID, "archive")[
+        "params"
+    ]
+    monkeypatch.setitem(
+        params,
+        "signers",
+        {"authsign": {"active": True, "server_url": "http://x", "auth_token": "t"}},
+    )
+    monkeypatch.setitem(
+        params,
+        "registration_policies",
+        {**ARCHIVE_PARAMS["registration_policies"], "opentimestamps": {"active": True}},
+    )
+
+    def sign_many(hashes, url, token, paths):
+        for path in paths:
+            with open(path, "w") as f:
+                f.write("signed")
+        return [{}] * len(hashes)
+
+    def register_timestamp(self, file_path, ts_file_path):
+        # Timestamps of the first files finish last
+        time.sleep(0.1 if "-meta-" not in file_path else 0)
+        with open(ts_file_path, "w") as f:
+            f.write("stamped")
+
+    monkeypatch.setattr(
+        file_util.FileUtil, "authsign_sign_many", staticmethod(sign_many)
+    )
+    monkeypatch.setattr(file_util.FileUtil, "register_timestamp", register_timestamp)
+    zip_path = make_input_bundle(str(tmp_path), b"content")
+
+    results = _actions.archive(zip_path, ORG_ID, COLLECTION_ID)
+
+    content_sha = hashlib.sha256(b"content").hexdigest()
+    files = [
+        f"{content_sha}.jpg",
+        f"{content_sha}-meta-content.json",
+        f"{content_sha}-meta-recorder.json",
+    ]
+    assert zip_util.listing(results["archive"])[3:] == [
+        f"proofs/{name}.authsign" for name in files
+    ] + [f"proofs/{name}.ots" for name in files]
+    assert {"authsign", "timestamp_content", "encrypt"} <= set(results["timings"])
+
+
+def test_archive_resumes_after_crash(org_env, tmp_path, monkeypatch):
+    params = config.ORGANIZATION_CONFIG.get_action(ORG_ID, COLLECTION_ID, "archive")[
+        "params"
+    ]
+    monkeypatch.setitem(
+        params,
+        "registration_policies",
+        {**ARCHIVE_PARAMS["registration_policies"], "opentimestamps": {"active": True}},
+    )
+    timestamped = []
+
+    def register_timestamp(self, file_path, ts_file_path):
+        timestamped.append(file_path)
+        with open(ts_file_path, "w") as f:
+            f.write("stamped")
+
+    def crash(self, key, file_path, enc_file_path):
+        raise SystemExit("killed")
+
+    monkeypatch.setattr(file_util.FileUtil, "register_timestamp", register_timestamp)
+    encrypt = file_util.FileUtil.encrypt
+    monkeypatch.setattr(file_util.FileUtil, "encrypt", crash)
+    zip_path = make_input_bundle(str(tmp_path), b"content")
+    input_sha = os.path.splitext(os.path.basename(zip_path))[0]
+    journal_dir = org_env.path_for_journal(COLLECTION_ID, "archive", input_sha)
+
+    with pytest.raises(SystemExit):
+        _actions.archive(zip_path, ORG_ID, COLLECTION_ID)
+    assert len(timestamped) == 3
+    assert os.path.exists(os.path.join(journal_dir, "journal.json"))
+
+    monkeypatch.setattr(file_util.FileUtil, "encrypt", encrypt)
+    results = _actions.archive(zip_path, ORG_ID, COLLECTION_ID)
+
+    # Timestamps weren't registered again, and their proofs are in the archive
+    assert len(timestamped) == 3
+    assert len(zip_util.listing(results["archive"])) == 6
+    assert os.path.exists(results["archiveEncrypted"])
+    assert not os.path.exists(journal_dir)
@@ -0,0 +1,62 @@
+from .conftest import COLLECTION_ID, ORG_ID
+from .context import async_service
+from .context import config
+from .context import processed_index
+from .stand_ins import make_input_bundle
+
+import asyncio
+import os
+import shutil
+import threading
+import time
+
+
+def _completed(org_env, zip_path):
+    index = processed_index.open_index(org_env.path_for_processed_index(COLLECTION_ID))
+    return index.completed_actions(os.path.splitext(os.path.basename(zip_path))[0])
+
+
+def test_inputs_are_processed_concurrently(org_env, tmp_path):
+    zip_paths = [
+        make_input_bundle(str(tmp_path), f"content {i}".encode()) for i in range(8)
+    ]
+    service = async_service.AsyncService(config.ORGANIZATION_CONFIG, max_in_flight=4)
+    org_config = config.ORGANIZATION_CONFIG.get(ORG_ID)
+
+    async def process_all():
+        await asyncio.gather(
+            *(
+                service.process_input(zip_path, org_config, COLLECTION_ID, ["archive"])
+                for zip_path in zip_paths
+            )
+        )
+
+    asyncio.run(process_all())
+
+    for zip_path in zip_paths:
+        assert _completed(org_env, zip_path) == {"archive"}
+    hash_lists = os.listdir(org_env.path_for_action_output(COLLECTION_ID, "archive"))
+    assert len([name for name in hash_lists if name.endswith(".json")]) == 8
+
+
+def test_service_processes_new_files(org_env, tmp_path):
+    service = async_service.AsyncService(config.ORGANIZATION_CONFIG)
+    thread = threading.Thread(target=service.run, daemon=True)
+    thread.start()
+    try:
+        zip_path = make_input_bundle(str(tmp_path), b"content")
+        # Wait for the observer to start watching
+        time.sleep(0.5)
+        input_path = os.path.join(
+            org_env.path_for_input(COLLECTION_ID), os.path.basename(zip_path)
+        )
+        shutil.copyfile(zip_path, input_path)
+
+        deadline = time.monotonic() + 10
+        while not _completed(org_env, input_path) and time.monotonic() < deadline:
+            time.sleep(0.1)
+        assert _completed(org_env, input_path) == {"archive"}
+    finally:
+        service.stop()
+        thread.join(5)
+    assert not thread.is_alive()
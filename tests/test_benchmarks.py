@@ -0,0 +1,58 @@
+from benchmarks import pipeline_benchmark
+
+import json
+import subprocess
+import sys
+
+
+def test_summary_has_nearest_rank_percentiles():
+    stats = pipeline_benchmark.summary([float(i) for i in range(100, 0, -1)])
+
+    assert stats["count"] == 100
+    assert stats["p50"] == 50
+    assert stats["p90"] == 90
+    assert stats["p99"] == 99
+    assert stats["max"] == 100
+
+
+def test_parse_size():
+    assert pipeline_benchmark.parse_size("512") == 512
+    assert pipeline_benchmark.parse_size("4k") == 4096
+    assert pipeline_benchmark.parse_size("1.5M") == 1536 * 1024
+
+
+def test_benchmark_runs_all_actions_against_stand_ins(tmp_path):
+    output = tmp_path / "results.json"
+    subprocess.run(
+        [
+            sys.executable,
+            "benchmarks/pipeline_benchmark.py",
+            "--sizes",
+            "16K",
+            "--count",
+            "2",
+            "--images",
+            "2",
+            "--work-dir",
+            str(tmp_path / "work"),
+            "--output",
+            str(output),
+        ],
+        check=True,
+        capture_output=True,
+    )
+
+    results = json.loads(output.read_text())
+    assert set(results["actions"]) == set(pipeline_benchmark.ACTIONS)
+    for action in results["actions"].values():
+        assert action["inputs"] == 2
+        assert action["errors"] == 0
+        assert action["peak_rss_kib"] > 0
+    archive = results["actions"]["archive"]
+    assert {"archive/authsign", "archive/encrypt", "ingest/verify"} <= set(
+        archive["stages"]
+    )
+    assert {"register/iscn", "register/numbersProtocol"} <= set(archive["stages"])
+    assert archive["registrations"] == {"done": 4}
+    proofmode = results["actions"]["c2pa-proofmode"]
+    assert proofmode["stages"]["c2pa-proofmode/c2patool"]["count"] == 8
@@ -1,5 +1,11 @@
+from .context import config
 from .context import file_util
 
+import json
+import multiprocessing
+import os
+import threading
+
 
 def test_get_hash_from_filename():
     for filename in [
@@ -9,3 +15,97 @@ def test_get_hash_from_filename():
         "1a2s3d4f5g-foobar.json",
     ]:
         assert file_util.FileUtil.get_hash_from_filename(filename) == "1a2s3d4f5g"
+
+
+def test_authsign_sign_many_in_order(tmp_path, requests_mock):
+    server = "http://authsign-single.test"
+    requests_mock.post(server + file_util.AUTHSIGN_BATCH_PATH, status_code=404)
+    requests_mock.post(
+        server + "/sign", json=lambda req, ctx: {"signed": req.json()["hash"]}
+    )
+    paths = [str(tmp_path / f"{h}.authsign") for h in ["a", "b", "c"]]
+
+    proofs = file_util.FileUtil().authsign_sign_many(
+        ["a", "b", "c"], server, "token", paths
+    )
+
+    assert proofs == [{"signed": "a"}, {"signed": "b"}, {"signed": "c"}]
+    assert (tmp_path / "b.authsign").read_text() == '{"signed": "b"}\n'
+    assert requests_mock.last_request.headers["Authorization"] == "bearer token"
+
+
+def test_authsign_sign_many_batch(requests_mock):
+    server = "http://authsign-batch.test"
+    requests_mock.post(
+        server + file_util.AUTHSIGN_BATCH_PATH,
+        json=lambda req, ctx: [{"signed": r["hash"]} for r in req.json()],
+    )
+
+    proofs = file_util.FileUtil().authsign_sign_many(["a", "b"], server, "")
+
+    assert proofs == [{"signed": "a"}, {"signed": "b"}]
+    assert len(requests_mock.request_history) == 1
+
+
+def test_authsign_sign_many_partial_failure(requests_mock):
+    server = "http://authsign-failure.test"
+    requests_mock.post(server + file_util.AUTHSIGN_BATCH_PATH, status_code=404)
+    requests_mock.post(
+        server + "/sign",
+        [{"json": {"signed": True}}, {"status_code": 500}],
+    )
+
+    proofs = file_util.FileUtil().authsign_sign_many(["a", "b"], server, "")
+
+    assert sorted(proofs, key=lambda p: p is None) == [{"signed": True}, None]
+
+
+def _increment(path, times):
+    for _ in range(times):
+        file_util.FileUtil.update_json(path, lambda data: {"n": data["n"] + 1})
+
+
+def test_update_json_is_serialized_across_processes(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "INTERNAL_ASSET_STORE", str(tmp_path / "internal"))
+    os.makedirs(tmp_path / "output")
+    path = str(tmp_path / "output" / "receipt.json")
+    with open(path, "w") as f:
+        json.dump({"n": 0}, f)
+
+    procs = [
+        multiprocessing.Process(target=_increment, args=(path, 25)) for _ in range(4)
+    ]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join(30)
+        assert proc.exitcode == 0
+
+    with open(path) as f:
+        assert json.load(f) == {"n": 100}
+    # Lock files are kept out of the output dir
+    assert os.listdir(tmp_path / "output") == ["receipt.json"]
+
+
+def test_update_json_locks_each_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "INTERNAL_ASSET_STORE", str(tmp_path))
+    paths = [str(tmp_path / f"{name}.json") for name in ("a", "b")]
+    for path in paths:
+        with open(path, "w") as f:
+            json.dump({}, f)
+    updating, release = threading.Event(), threading.Event()
+
+    def slow_update(data):
+        updating.set()
+        release.wait(10)
+        return data
+
+    thread = threading.Thread(
+        target=file_util.FileUtil.update_json, args=(paths[0], slow_update)
+    )
+    thread.start()
+    updating.wait(10)
+    # Another file is updated while the first one is locked
+    assert file_util.FileUtil.update_json(paths[1], lambda data: {"x": 1}) == {"x": 1}
+    release.set()
+    thread.join(10)
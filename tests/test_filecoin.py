@@ -0,0 +1,148 @@
+from .context import config
+from .context import filecoin
+
+from .stand_ins import Web3StorageStandIn, fake_ipfs_blocks, write_fake_ipfs
+
+import io
+import json
+
+import pytest
+
+
+@pytest.fixture
+def stand_in(monkeypatch):
+    monkeypatch.setattr(filecoin, "RETRY_BASE_DELAY", 0)
+    server = Web3StorageStandIn()
+    yield server
+    server.close()
+
+
+def car(blocks):
+    """Makes a CAR-shaped stream with a fake header and the given block payloads."""
+    header = b"bafyroot"  # The stand-in reads the root from the header
+    data = filecoin._encode_varint(len(header)) + header
+    for block in blocks:
+        data += filecoin._encode_varint(len(block)) + block
+    return data
+
+
+def test_upload_streams_multipart(tmp_path, stand_in):
+    content = b"x" * 1_000_000
+    path = tmp_path / "archive.encrypted"
+    path.write_bytes(content)
+
+    assert filecoin.Filecoin(stand_in.url).upload(str(path)) == "bafyroot"
+
+    url_path, headers, body = stand_in.requests[0]
+    assert url_path == "/upload"
+    assert "chunked" not in headers.get("Transfer-Encoding", "")
+    assert int(headers["Content-Length"]) == len(body)
+    assert headers["Content-Type"].startswith("multipart/form-data; boundary=")
+    assert b'filename="archive.encrypted"' in body
+    assert content in body
+
+
+def test_upload_retries_server_errors(tmp_path, stand_in):
+    path = tmp_path / "archive.encrypted"
+    path.write_bytes(b"data")
+    stand_in.failures = 2
+
+    assert filecoin.Filecoin(stand_in.url).upload(str(path)) == "bafyroot"
+    assert len(stand_in.requests) == 3
+
+
+def test_car_parts_split_on_block_boundaries():
+    blocks = [bytes([i]) * 100 for i in range(10)]
+    parts = list(filecoin.car_parts(io.BytesIO(car(blocks)), 350))
+
+    assert len(parts) > 1
+    received = []
+    for part in parts:
+        assert len(part) <= 350
+        # Each part is a CAR of its own, with the original header
+        sub_parts = list(filecoin.car_parts(io.BytesIO(part), len(part)))
+        assert sub_parts == [part]
+        assert part.startswith(car([]))
+        received.append(part[len(car([])) :])
+    assert b"".join(received) == car(blocks)[len(car([])) :]
+
+
+def test_upload_car_in_parts(stand_in, monkeypatch):
+    monkeypatch.setattr(filecoin, "MAX_PART_SIZE", 250)
+    blocks = [bytes([i]) * 100 for i in range(10)]
+
+    assert filecoin.Filecoin(stand_in.url).upload_car(io.BytesIO(car(blocks))) == (
+        "bafyroot"
+    )
+
+    assert len(stand_in.requests) == 5
+    assert all(path == "/car" for path, _, _ in stand_in.requests)
+    assert (
+        sorted(len(body) for _, _, body in stand_in.requests)
+        == [len(car(blocks[:2]))] * 5
+    )
+
+
+def test_upload_large_file_leaves_no_ipfs_blocks(tmp_path, stand_in, monkeypatch):
+    ipfs = write_fake_ipfs(str(tmp_path))
+    monkeypatch.setattr(config, "IPFS_CLIENT_PATH", ipfs)
+    monkeypatch.setattr(filecoin, "MAX_PART_SIZE", 250)
+    path = tmp_path / "archive.encrypted"
+    path.write_bytes(b"x" * 1000)
+
+    filecoin.Filecoin(stand_in.url).upload(str(path))
+
+    assert all(url_path == "/car" for url_path, _, _ in stand_in.requests)
+    assert fake_ipfs_blocks(ipfs) == []
+
+    # Blocks are removed when the upload fails too
+    stand_in.failures = filecoin.UPLOAD_ATTEMPTS
+    with pytest.raises(Exception):
+        filecoin.Filecoin(stand_in.url).upload(str(path))
+    assert fake_ipfs_blocks(ipfs) == []
+
+
+STATUS_URL = "http://web3.test/status"
+
+
+def deal(piece_cid):
+    return {"deals": [{"pieceCid": piece_cid}] if piece_cid else []}
+
+
+def test_deal_status_cache(tmp_path, requests_mock):
+    requests_mock.get(f"{STATUS_URL}/found", json=deal("baga"))
+    requests_mock.get(f"{STATUS_URL}/pending", json=deal(None))
+    requests_mock.get(f"{STATUS_URL}/broken", status_code=500)
+    cache_path = str(tmp_path / "deals.json")
+    client = filecoin.Filecoin("http://web3.test")
+
+    tracker = filecoin.DealStatusTracker(cache_path, client, pending_ttl=0)
+    assert tracker.check(["found", "pending", "broken"]) == {
+        "found": "baga",
+        "pending": None,
+        "broken": None,
+    }
+    assert requests_mock.call_count == 3
+
+    # Found deals are final; pending ones expired and errors weren't cached
+    tracker = filecoin.DealStatusTracker(cache_path, client, pending_ttl=0)
+    assert tracker.check(["found", "pending", "broken"])["found"] == "baga"
+    assert requests_mock.call_count == 5
+
+    # Pending results are cached within their TTL
+    tracker = filecoin.DealStatusTracker(cache_path, client, pending_ttl=60)
+    tracker.check(["found", "pending"])
+    assert requests_mock.call_count == 5
+
+
+def test_deal_status_of_hash_lists(tmp_path, requests_mock):
+    requests_mock.get(f"{STATUS_URL}/bafyenc", json=deal("baga"))
+    (tmp_path / f"{'a' * 64}.json").write_text(
+        json.dumps({"archiveEncrypted": {"cid": "bafyenc"}})
+    )
+
+    tracker = filecoin.DealStatusTracker.for_hash_list_dir(
+        str(tmp_path), filecoin=filecoin.Filecoin("http://web3.test")
+    )
+    assert tracker.check_hash_lists(str(tmp_path)) == {"bafyenc": "baga"}
+    assert (tmp_path / filecoin.DEAL_STATUS_CACHE).exists()
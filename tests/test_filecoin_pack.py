@@ -0,0 +1,83 @@
+from .context import config
+from .context import filecoin
+from .context import filecoin_pack
+from .stand_ins import Web3StorageStandIn, fake_ipfs_blocks, write_fake_ipfs
+
+import json
+import os
+
+import pytest
+
+
+@pytest.fixture
+def stand_in(monkeypatch, tmp_path):
+    monkeypatch.setattr(filecoin, "RETRY_BASE_DELAY", 0)
+    monkeypatch.setattr(config, "IPFS_CLIENT_PATH", write_fake_ipfs(str(tmp_path)))
+    monkeypatch.setattr(config, "INTERNAL_ASSET_STORE", str(tmp_path / "internal"))
+    monkeypatch.setattr(config, "SHARED_FILE_SYSTEM", str(tmp_path / "shared"))
+    server = Web3StorageStandIn()
+    yield server
+    server.close()
+
+
+def make_packer(stand_in, target_size):
+    packer = filecoin_pack.ArchivePacker(
+        "org", "coll", target_size, filecoin.Filecoin(stand_in.url)
+    )
+    os.makedirs(packer.archive_dir)
+    os.makedirs(packer.hash_list_dir)
+    return packer
+
+
+def add_archive(packer, enc_sha, size):
+    with open(os.path.join(packer.archive_dir, f"{enc_sha}.encrypted"), "wb") as f:
+        f.write(os.urandom(size))
+    receipt_path = os.path.join(packer.hash_list_dir, f"{enc_sha[::-1]}.json")
+    with open(receipt_path, "w") as f:
+        json.dump({"archiveEncrypted": {"sha256": enc_sha}}, f)
+    return receipt_path
+
+
+def test_pack_archives(stand_in):
+    packer = make_packer(stand_in, target_size=250)
+    receipts = [add_archive(packer, str(i) * 64, 100) for i in range(5)]
+
+    manifests = packer.run()
+
+    # 100 byte archives in packs of at most 250 bytes
+    assert [len(m["archives"]) for m in manifests] == [2, 2, 1]
+    assert len(stand_in.requests) == 3
+    with open(receipts[2]) as f:
+        record = json.load(f)["filecoin"]
+    assert record["packCid"] == manifests[1]["packCid"]
+    assert record["cid"] == manifests[1]["archiveCids"]["2" * 64 + ".encrypted"]
+
+    # Nothing new to pack
+    assert packer.run() == []
+    assert len(stand_in.requests) == 3
+    # Packs are removed from the IPFS repo once uploaded
+    assert fake_ipfs_blocks(config.IPFS_CLIENT_PATH) == []
+
+
+def test_pack_resumes_after_failed_upload(stand_in):
+    packer = make_packer(stand_in, target_size=1000)
+    receipt = add_archive(packer, "a" * 64, 100)
+    stand_in.failures = filecoin.UPLOAD_ATTEMPTS
+
+    with pytest.raises(Exception):
+        packer.run()
+    with open(receipt) as f:
+        assert "filecoin" not in json.load(f)
+    # The pack is kept in the IPFS repo to resume the upload
+    assert fake_ipfs_blocks(config.IPFS_CLIENT_PATH) != []
+
+    # New archives go into a new pack, the interrupted pack is finished as it was
+    add_archive(packer, "b" * 64, 100)
+    manifests = packer.run()
+    assert [m["archives"] for m in manifests] == [
+        ["a" * 64 + ".encrypted"],
+        ["b" * 64 + ".encrypted"],
+    ]
+    with open(receipt) as f:
+        assert json.load(f)["filecoin"]["packId"] == manifests[0]["id"]
+    assert fake_ipfs_blocks(config.IPFS_CLIENT_PATH) == []
@@ -0,0 +1,284 @@
+from .conftest import COLLECTION_ID, ORG_ID
+from .context import fs_watcher
+from .context import processed_index
+from .stand_ins import make_input_bundle
+
+from watchdog.events import (
+    FileClosedEvent,
+    FileCreatedEvent,
+    FileModifiedEvent,
+    FileMovedEvent,
+)
+from contextlib import contextmanager
+from functools import partial
+import os
+import struct
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture
+def processed(org_env, monkeypatch):
+    """Records the inputs passed to process_input instead of processing them."""
+
+    class Processed(list):
+        release = threading.Event()
+
+    calls = Processed()
+    calls.release.set()
+
+    def process_input(
+        zip_path, org_config, collection_id, action_names, job_class, upload_digest
+    ):
+        calls.append((zip_path, action_names))
+        calls.release.wait(5)
+
+    monkeypatch.setattr(fs_watcher, "process_input", process_input)
+    return calls
+
+
+def _handler(settle_seconds=None, pool=None):
+    return fs_watcher.CollectionHandler(patterns=["*.zip"]).with_config(
+        {"id": ORG_ID}, COLLECTION_ID, ["archive"], pool, settle_seconds
+    )
+
+
+def _wait_until_idle(handler):
+    deadline = time.monotonic() + 5
+    while (handler._pending or handler._in_flight) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_files_are_processed_when_closed_or_moved_in(processed):
+    handler = _handler()
+
+    handler.dispatch(FileCreatedEvent("/in/a.zip"))
+    handler.dispatch(FileModifiedEvent("/in/a.zip"))
+    assert processed == []
+
+    handler.dispatch(FileClosedEvent("/in/a.zip"))
+    handler.dispatch(FileMovedEvent("/in/b.tmp", "/in/b.zip"))
+    handler.dispatch(FileMovedEvent("/in/c.zip", "/in/c.zip.bak"))
+    # Moved in from and out to outside the watched tree
+    handler.dispatch(FileMovedEvent(None, "/in/d.zip"))
+    handler.dispatch(FileMovedEvent("/in/e.zip", None))
+
+    assert processed == [
+        ("/in/a.zip", ["archive"]),
+        ("/in/b.zip", ["archive"]),
+        ("/in/d.zip", ["archive"]),
+    ]
+
+
+def test_events_are_coalesced_while_queued(processed):
+    pool = fs_watcher.WorkerPool("test", workers=1)
+    handler = _handler(pool=pool)
+    processed.release.clear()
+
+    for _ in range(3):
+        handler.dispatch(FileClosedEvent("/in/a.zip"))
+    processed.release.set()
+    _wait_until_idle(handler)
+    assert processed == [("/in/a.zip", ["archive"])]
+
+    # Once done, a new event queues the file again; process_input then skips
+    # the actions already completed
+    handler.dispatch(FileClosedEvent("/in/a.zip"))
+    _wait_until_idle(handler)
+    pool.shutdown()
+    assert len(processed) == 2
+
+
+def test_files_settle_without_close_events(processed, tmp_path, monkeypatch):
+    monkeypatch.setattr(fs_watcher, "SETTLE_POLL_INTERVAL", 0.05)
+    handler = _handler(settle_seconds=0.3)
+    zip_path = str(tmp_path / "a.zip")
+
+    with open(zip_path, "wb") as f:
+        handler.dispatch(FileCreatedEvent(zip_path))
+        for _ in range(4):
+            f.write(b"x")
+            f.flush()
+            time.sleep(0.1)
+            handler.dispatch(FileModifiedEvent(zip_path))
+        # Still being written to
+        assert processed == []
+
+    deadline = time.monotonic() + 5
+    while not processed and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert processed == [(zip_path, ["archive"])]
+
+
+def test_slow_stats_of_settling_files_dont_block_events(
+    processed, tmp_path, monkeypatch
+):
+    monkeypatch.setattr(fs_watcher, "SETTLE_POLL_INTERVAL", 0.05)
+    handler = _handler(settle_seconds=0.3)
+    slow_path = str(tmp_path / "slow.zip")
+    open(slow_path, "wb").close()
+    stat, statting, release = os.stat, threading.Event(), threading.Event()
+
+    def slow_stat(path, *args, **kwargs):
+        if path == slow_path:
+            statting.set()
+            release.wait(5)
+        return stat(path, *args, **kwargs)
+
+    monkeypatch.setattr(os, "stat", slow_stat)
+    handler.dispatch(FileCreatedEvent(slow_path))
+    assert statting.wait(5)
+    start = time.monotonic()
+    handler.dispatch(FileClosedEvent("/in/a.zip"))
+    assert time.monotonic() - start < 1
+    release.set()
+    deadline = time.monotonic() + 5
+    while handler._settler is not None and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert processed == [("/in/a.zip", ["archive"]), (slow_path, ["archive"])]
+
+
+def test_observer_processes_each_input_once(processed, tmp_path):
+    observer = fs_watcher.make_observer()
+    handler = _handler(settle_seconds=0.3)
+    if fs_watcher._emits_close_events(observer):
+        handler.settle_seconds = None
+    observer.schedule(handler, str(tmp_path), recursive=True)
+    observer.start()
+    try:
+        zip_path = str(tmp_path / "a.zip")
+        with open(zip_path, "wb") as f:
+            for _ in range(5):
+                f.write(b"x" * 1024)
+                f.flush()
+                time.sleep(0.02)
+        deadline = time.monotonic() + 5
+        while not processed and time.monotonic() < deadline:
+            time.sleep(0.05)
+        time.sleep(0.2)
+    finally:
+        observer.stop()
+        observer.join()
+
+    assert processed == [(zip_path, ["archive"])]
+    assert os.path.getsize(zip_path) == 5 * 1024
+
+
+def test_observer_processes_inputs_moved_in_from_outside(processed, tmp_path):
+    watched = tmp_path / "input"
+    outside = tmp_path / "outside"
+    watched.mkdir()
+    (outside / "dir").mkdir(parents=True)
+    (outside / "a.zip").write_bytes(b"x")
+    (outside / "dir" / "b.zip").write_bytes(b"x")
+    observer = fs_watcher.make_observer()
+    handler = _handler(settle_seconds=0.3)
+    if fs_watcher._emits_close_events(observer):
+        handler.settle_seconds = None
+    observer.schedule(handler, str(watched), recursive=True)
+    observer.start()
+    try:
+        os.rename(outside / "a.zip", watched / "a.zip")
+        os.rename(outside / "dir", watched / "dir")
+        deadline = time.monotonic() + 5
+        while len(processed) < 2 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        time.sleep(0.2)
+    finally:
+        observer.stop()
+        observer.join()
+
+    assert sorted(processed) == [
+        (str(watched / "a.zip"), ["archive"]),
+        (str(watched / "dir" / "b.zip"), ["archive"]),
+    ]
+
+
+def test_process_input_skips_completed_actions(org_env, tmp_path, monkeypatch):
+    zip_path = make_input_bundle(str(tmp_path), b"content")
+    input_sha = os.path.splitext(os.path.basename(zip_path))[0]
+    processed_index.ProcessedIndex(
+        org_env.path_for_processed_index(COLLECTION_ID)
+    ).mark_completed(input_sha, ["archive"])
+    ran = []
+    monkeypatch.setattr(
+        fs_watcher, "run_action", lambda action, *args: ran.append(action) or True
+    )
+
+    fs_watcher.process_input(
+        zip_path, {"id": ORG_ID}, COLLECTION_ID, ["archive", "copy-proofmode"]
+    )
+    fs_watcher.process_input(zip_path, {"id": ORG_ID}, COLLECTION_ID, ["archive"])
+
+    assert ran == ["copy-proofmode"]
+
+
+def test_process_input_takes_slot_before_scratch_space(org_env, tmp_path, monkeypatch):
+    zip_path = make_input_bundle(str(tmp_path), b"content")
+    taken = []
+
+    @contextmanager
+    def take(name, *args):
+        taken.append(name)
+        yield
+
+    monkeypatch.setattr(fs_watcher.scheduler, "slot", partial(take, "slot"))
+    monkeypatch.setattr(fs_watcher.scratch, "reservation", partial(take, "space"))
+    monkeypatch.setattr(fs_watcher, "run_action", lambda *args: True)
+
+    fs_watcher.process_input(zip_path, {"id": ORG_ID}, COLLECTION_ID, ["archive"])
+
+    assert taken == ["slot", "space"]
+
+
+def test_bursts_are_coalesced_while_the_pool_is_full(processed):
+    pool = fs_watcher.WorkerPool("test", workers=1, max_queue=1)
+    handler = _handler(pool=pool)
+    processed.release.clear()
+
+    start = time.monotonic()
+    for _ in range(10):
+        for i in range(20):
+            handler.dispatch(FileClosedEvent(f"/in/{i}.zip"))
+    # Events are handled without waiting for room in the pool
+    assert time.monotonic() - start < 1
+
+    processed.release.set()
+    _wait_until_idle(handler)
+    pool.shutdown()
+    assert sorted(processed) == sorted((f"/in/{i}.zip", ["archive"]) for i in range(20))
+
+
+@pytest.mark.skipif(fs_watcher.InotifyObserver is None, reason="needs inotify")
+def test_overflow_triggers_rescan(org_env, monkeypatch):
+    monkeypatch.setattr(fs_watcher, "OVERFLOW_CHECK_INTERVAL", 0.01)
+    watcher = fs_watcher.FsWatcher({"id": ORG_ID})
+    rescanned = threading.Event()
+    monkeypatch.setattr(
+        watcher, "reconcile", lambda job_class: job_class == "live" and rescanned.set()
+    )
+    watcher.start_overflow_monitor()
+    time.sleep(0.05)
+    assert not rescanned.is_set()
+
+    count = fs_watcher.overflow_count()
+    overflow = struct.pack("iIII", -1, fs_watcher.InotifyConstants.IN_Q_OVERFLOW, 0, 0)
+    assert list(fs_watcher.Inotify._parse_event_buffer(overflow)) == [
+        (-1, fs_watcher.InotifyConstants.IN_Q_OVERFLOW, 0, b"")
+    ]
+    assert fs_watcher.overflow_count() == count + 1
+    assert rescanned.wait(5)
+
+
+def test_overflows_not_counted_with_unexpected_watchdog():
+    class Inotify:
+        @staticmethod
+        def _parse_event_buffer(event_buffer, strict):
+            return []
+
+    parse_event_buffer = Inotify._parse_event_buffer
+    assert not fs_watcher._count_overflows(Inotify)
+    assert Inotify._parse_event_buffer is parse_event_buffer
+    assert not fs_watcher._count_overflows(object)
@@ -0,0 +1,95 @@
+from .conftest import COLLECTION_ID, ORG_ID
+from .context import fs_watcher
+from .context import ingest
+from .stand_ins import make_input_bundle
+
+import hashlib
+import json
+import os
+import threading
+import zipfile
+
+import pytest
+
+
+def test_create_extracts_and_hashes_all_files(tmp_path):
+    zip_path = make_input_bundle(str(tmp_path), b"content")
+
+    result = ingest.Ingest.create(zip_path, str(tmp_path / "ingest"))
+
+    content_sha = hashlib.sha256(b"content").hexdigest()
+    assert result.input_sha in zip_path
+    assert len(result.listing) == 3
+    assert result.hashes[f"{content_sha}.jpg"] == content_sha
+    with open(result.path(f"{content_sha}.jpg"), "rb") as f:
+        assert f.read() == b"content"
+    # Files are shared between actions, so they can't be written to
+    assert os.stat(result.path(f"{content_sha}.jpg")).st_mode & 0o222 == 0
+
+    result.cleanup()
+    assert not os.path.exists(result.dir)
+
+
+def test_create_rejects_zip_not_matching_its_name(tmp_path):
+    zip_path = make_input_bundle(str(tmp_path), b"content")
+    renamed = os.path.join(str(tmp_path), "a" * 64 + ".zip")
+    os.rename(zip_path, renamed)
+
+    with pytest.raises(Exception, match="does not match file name"):
+        ingest.Ingest.create(renamed, str(tmp_path / "ingest"))
+
+
+def test_create_rejects_paths_outside_its_dir(tmp_path):
+    tmp_zip = str(tmp_path / "evil.tmp")
+    with zipfile.ZipFile(tmp_zip, "w") as zipf:
+        zipf.writestr("../evil.txt", b"evil")
+    with open(tmp_zip, "rb") as f:
+        zip_path = str(tmp_path / f"{hashlib.sha256(f.read()).hexdigest()}.zip")
+    os.rename(tmp_zip, zip_path)
+
+    with pytest.raises(Exception, match="unsafe path"):
+        ingest.Ingest.create(zip_path, str(tmp_path / "ingest"))
+    assert not os.path.exists(tmp_path / "evil.txt")
+    assert os.listdir(tmp_path / "ingest") == []
+
+
+def test_process_input_ingests_once_for_all_actions(org_env, tmp_path, monkeypatch):
+    zip_path = make_input_bundle(str(tmp_path), b"content")
+    created = []
+    create = ingest.Ingest.create
+    monkeypatch.setattr(
+        fs_watcher.Ingest,
+        "create",
+        staticmethod(lambda *args: created.append(create(*args)) or created[-1]),
+    )
+    # Only passes if both actions run at the same time
+    barrier = threading.Barrier(2, timeout=5)
+    seen = []
+
+    def run_action(action, path, org_config, collection_id, shared):
+        barrier.wait()
+        seen.append((action, shared))
+
+    monkeypatch.setattr(fs_watcher, "run_action", run_action)
+
+    fs_watcher.process_input(
+        zip_path, {"id": ORG_ID}, COLLECTION_ID, ["archive", "copy-proofmode"]
+    )
+
+    assert len(created) == 1
+    assert sorted(action for action, _ in seen) == ["archive", "copy-proofmode"]
+    assert all(shared is created[0] for _, shared in seen)
+    assert not os.path.exists(created[0].dir)
+
+
+def test_archive_uses_shared_ingest(org_env, tmp_path):
+    zip_path = make_input_bundle(str(tmp_path), b"content")
+    shared = ingest.Ingest.create(zip_path, org_env.path_for_ingest(COLLECTION_ID))
+
+    results = fs_watcher._actions.archive(zip_path, ORG_ID, COLLECTION_ID, shared)
+
+    with open(results["hashList"]) as f:
+        assert json.load(f)["inputBundle"]["sha256"] == shared.input_sha
+    # The shared files are left for the other actions
+    assert sorted(os.listdir(shared.dir)) == sorted(shared.listing)
+    shared.cleanup()
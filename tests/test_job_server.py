@@ -0,0 +1,70 @@
+from .context import crypto_util, job_server, rate_limit, scheduler
+
+import multiprocessing
+import os
+
+JSON_CONFIG = {
+    "scheduler": {"max_running": 2},
+    "organizations": [
+        {
+            "id": "org",
+            "collections": [
+                {
+                    "id": "coll",
+                    "actions": [
+                        {"name": "archive", "params": {"encryption": {"key": "k"}}},
+                        {"name": "c2pa-proofmode", "params": {}},
+                    ],
+                }
+            ],
+        }
+    ],
+}
+
+
+def _key():
+    return crypto_util.get_key("k")
+
+
+def test_configured_keys():
+    assert job_server.configured_keys(JSON_CONFIG) == ["k"]
+
+
+def test_serves_scheduler_and_pool(tmp_path, monkeypatch):
+    monkeypatch.setattr(crypto_util, "KEY_STORE", str(tmp_path / "keys"))
+    server = job_server.start(JSON_CONFIG)
+    try:
+        job_scheduler = server.scheduler()
+        assert job_scheduler.acquire("org", scheduler.LIVE)
+        assert job_scheduler.acquire("org", scheduler.BACKFILL)
+        assert not job_scheduler.acquire("other", scheduler.LIVE, 0.05)
+
+        # The key was made once, before the workers were forked
+        key = server.pool().run(_key)
+        assert os.listdir(tmp_path / "keys") == ["k"]
+        assert key == crypto_util.get_key("k")
+    finally:
+        job_server.stop(server)
+
+
+def _register(limiter):
+    rate_limit.use(limiter)
+    assert rate_limit.acquire(rate_limit.ISCN, 0)
+
+
+def test_rate_limits_are_shared_by_all_processes(tmp_path, monkeypatch):
+    monkeypatch.setattr(crypto_util, "KEY_STORE", str(tmp_path / "keys"))
+    server = job_server.start(JSON_CONFIG)
+    try:
+        limiter = server.rate_limiter()
+        watcher = multiprocessing.Process(target=_register, args=(limiter,))
+        watcher.start()
+        watcher.join(10)
+        assert watcher.exitcode == 0
+
+        # The other process took the only token of the burst
+        rate_limit.use(limiter)
+        assert not rate_limit.acquire(rate_limit.ISCN, 0)
+    finally:
+        rate_limit.use(None)
+        job_server.stop(server)
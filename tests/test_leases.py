@@ -0,0 +1,109 @@
+from .context import leases
+from .conftest import COLLECTION_ID, ORG_ID
+from .context import fs_watcher
+from .stand_ins import make_input_bundle
+
+import multiprocessing
+import os
+import time
+
+KEYS = [f"input/{i}" for i in range(20)]
+
+
+def _claim_all(db_path, node, out_dir, ready):
+    store = leases.LeaseStore(db_path, node)
+    ready.wait()
+    for key in KEYS:
+        lease = store.acquire(key)
+        if lease is not None:
+            with open(os.path.join(out_dir, key.replace("/", "_")), "a") as f:
+                f.write(node + "\n")
+            time.sleep(0.01)
+
+
+def _hold_and_die(db_path, key):
+    leases.LeaseStore(db_path, "dead-node").acquire(key, ttl=0.3)
+    os._exit(1)
+
+
+def test_each_key_is_claimed_by_one_node(tmp_path):
+    db_path = str(tmp_path / "leases.db")
+    leases.LeaseStore(db_path)
+    ready = multiprocessing.Event()
+    nodes = [
+        multiprocessing.Process(
+            target=_claim_all, args=(db_path, f"node{i}", str(tmp_path), ready)
+        )
+        for i in range(4)
+    ]
+    for node in nodes:
+        node.start()
+    ready.set()
+    for node in nodes:
+        node.join(30)
+        assert node.exitcode == 0
+
+    claims = [
+        open(tmp_path / name).read().split()
+        for name in os.listdir(tmp_path)
+        if name.startswith("input_")
+    ]
+    # Leases aren't released, so no key can be claimed twice
+    assert len(claims) == len(KEYS)
+    assert all(len(nodes) == 1 for nodes in claims)
+
+
+def test_lease_of_dead_node_expires(tmp_path):
+    db_path = str(tmp_path / "leases.db")
+    store = leases.LeaseStore(db_path, "live-node")
+    node = multiprocessing.Process(target=_hold_and_die, args=(db_path, "k"))
+    node.start()
+    node.join(10)
+
+    assert store.holder("k") == "dead-node"
+    assert store.acquire("k") is None
+    time.sleep(0.4)
+    lease = store.acquire("k")
+    assert lease is not None
+    assert store.holder("k") == "live-node"
+    lease.release()
+    assert store.holder("k") is None
+
+
+def test_heartbeat_keeps_lease_and_detects_loss(tmp_path):
+    db_path = str(tmp_path / "leases.db")
+    store = leases.LeaseStore(db_path, "a")
+    other = leases.LeaseStore(db_path, "b")
+
+    with store.acquire("k", ttl=0.3) as lease:
+        time.sleep(0.6)
+        assert other.acquire("k") is None
+        assert not lease.lost
+
+    lease = store.acquire("k", ttl=0.3, heartbeat=False)
+    lease._stop.set()
+    time.sleep(0.4)
+    stolen = other.acquire("k")
+    assert stolen is not None
+    assert not store.renew("k", lease.token, 0.3)
+    # Releasing a lost lease leaves the new holder's lease alone
+    lease.release()
+    assert store.holder("k") == "b"
+
+
+def test_process_input_skips_input_leased_by_another_node(
+    org_env, tmp_path, monkeypatch
+):
+    zip_path = make_input_bundle(str(tmp_path), b"content")
+    input_sha = os.path.splitext(os.path.basename(zip_path))[0]
+    ran = []
+    monkeypatch.setattr(
+        fs_watcher, "run_action", lambda action, *args: ran.append(action) or True
+    )
+    other = leases.LeaseStore(org_env.path_for_leases(), "other-node")
+
+    with other.acquire(f"input/{COLLECTION_ID}/{input_sha}"):
+        fs_watcher.process_input(zip_path, {"id": ORG_ID}, COLLECTION_ID, ["archive"])
+        assert ran == []
+    fs_watcher.process_input(zip_path, {"id": ORG_ID}, COLLECTION_ID, ["archive"])
+    assert ran == ["archive"]
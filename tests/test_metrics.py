@@ -0,0 +1,106 @@
+from .conftest import COLLECTION_ID, ORG_ID
+from .context import fs_watcher
+from .context import metrics
+from .stand_ins import make_input_bundle
+
+import multiprocessing
+import os
+import urllib.request
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    """Gives each test metrics of its own, not written to any directory."""
+    monkeypatch.setattr(metrics, "_registry", metrics.Registry())
+    monkeypatch.setattr(metrics, "_dir", None)
+    monkeypatch.setattr(metrics, "_flusher_pid", None)
+
+
+def _record_and_flush():
+    metrics.inc(metrics.ACTIONS_TOTAL, action="archive", outcome="completed")
+    metrics.add_gauge(metrics.JOBS_IN_FLIGHT, 1, org=ORG_ID)
+    metrics.observe(metrics.STAGE_SECONDS, 3, action="archive", stage="encrypt")
+    metrics.flush()
+
+
+def test_histograms_are_rendered_with_cumulative_buckets():
+    metrics.observe(metrics.STAGE_SECONDS, 0.3, action="archive", stage="encrypt")
+    metrics.observe(metrics.STAGE_SECONDS, 7, action="archive", stage="encrypt")
+    metrics.inc(metrics.ACTIONS_TOTAL, action="archive", outcome="completed")
+
+    text = metrics.render(
+        {
+            "counters": metrics._registry.counters,
+            "gauges": metrics._registry.gauges,
+            "histograms": metrics._registry.histograms,
+        }
+    )
+
+    labels = 'action="archive",stage="encrypt"'
+    assert "# TYPE integrity_stage_seconds histogram" in text
+    assert f'integrity_stage_seconds_bucket{{{labels},le="0.25"}} 0' in text
+    assert f'integrity_stage_seconds_bucket{{{labels},le="0.5"}} 1' in text
+    assert f'integrity_stage_seconds_bucket{{{labels},le="10"}} 2' in text
+    assert f'integrity_stage_seconds_bucket{{{labels},le="+Inf"}} 2' in text
+    assert f"integrity_stage_seconds_sum{{{labels}}} 7.3" in text
+    assert f"integrity_stage_seconds_count{{{labels}}} 2" in text
+    assert 'integrity_actions_total{action="archive",outcome="completed"} 1' in text
+
+
+def test_metrics_are_added_up_across_processes(tmp_path):
+    metrics.enable(str(tmp_path))
+    proc = multiprocessing.get_context("fork").Process(target=_record_and_flush)
+    proc.start()
+    proc.join()
+    _record_and_flush()
+
+    collected = metrics.collect(str(tmp_path))
+
+    completed = (("action", "archive"), ("outcome", "completed"))
+    assert collected["counters"][(metrics.ACTIONS_TOTAL, completed)] == 2
+    encrypt = (("action", "archive"), ("stage", "encrypt"))
+    assert collected["histograms"][(metrics.STAGE_SECONDS, encrypt)][2] == 2
+    # The gauge of the process that exited no longer counts
+    assert collected["gauges"][(metrics.JOBS_IN_FLIGHT, (("org", ORG_ID),))] == 1
+
+
+def test_endpoint_serves_metrics(tmp_path):
+    metrics.enable(str(tmp_path))
+    metrics.inc(metrics.REGISTRATIONS_TOTAL, kind="iscn", outcome="failed")
+    server = metrics.serve(0)
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/metrics"
+        with urllib.request.urlopen(url) as response:
+            text = response.read().decode()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert 'integrity_registrations_total{kind="iscn",outcome="failed"} 1' in text
+
+
+def test_run_action_records_outcome_and_bytes(org_env, tmp_path, monkeypatch):
+    zip_path = make_input_bundle(str(tmp_path), b"content")
+    monkeypatch.setattr(fs_watcher._actions, "archive", lambda *args: {})
+
+    def fail(*args):
+        raise Exception("c2patool failed")
+
+    monkeypatch.setattr(fs_watcher._actions, "copy_proofmode", fail)
+
+    assert fs_watcher.run_action("archive", zip_path, {"id": ORG_ID}, COLLECTION_ID)
+    assert not fs_watcher.run_action(
+        "copy-proofmode", zip_path, {"id": ORG_ID}, COLLECTION_ID
+    )
+
+    counters = metrics._registry.counters
+    archive = ("action", "archive")
+    assert counters[(metrics.ACTIONS_TOTAL, (archive, ("outcome", "completed")))] == 1
+    assert counters[(metrics.BYTES_PROCESSED_TOTAL, (archive,))] == os.path.getsize(
+        zip_path
+    )
+    copy = ("action", "copy-proofmode")
+    assert counters[(metrics.ACTIONS_TOTAL, (copy, ("outcome", "errored")))] == 1
+    assert (metrics.BYTES_PROCESSED_TOTAL, (copy,)) not in counters
@@ -0,0 +1,115 @@
+from .context import config
+from .context import numbers
+
+import io
+import threading
+import time
+
+import pytest
+
+NUMBERS_SERVER = "http://numbers.test/register"
+AVALANCHE_SERVER = "http://avalanche.test/register"
+
+
+@pytest.fixture(autouse=True)
+def chain_servers(monkeypatch):
+    monkeypatch.setattr(config, "NUMBERS_NUMBERS_SERVER", NUMBERS_SERVER)
+    monkeypatch.setattr(config, "NUMBERS_AVALANCHE_SERVER", AVALANCHE_SERVER)
+
+
+def register(chains, **kwargs):
+    return numbers.Numbers.register(
+        "name",
+        "description",
+        "cid",
+        "sha256",
+        "application/octet-stream",
+        "2022-01-01T00:00:00Z",
+        {},
+        chains,
+        None,
+        True,
+        **kwargs,
+    )
+
+
+def test_register_all_chains(requests_mock):
+    requests_mock.post(NUMBERS_SERVER, json={"txHash": "0x1"})
+    requests_mock.post(AVALANCHE_SERVER, json={"txHash": "0x2"})
+
+    assert register(["numbers", "avalanche"]) == {
+        "numbers": {"txHash": "0x1"},
+        "avalanche": {"txHash": "0x2"},
+    }
+    assert len(requests_mock.request_history) == 2
+
+
+def test_register_failed_chain_is_omitted(requests_mock):
+    requests_mock.post(NUMBERS_SERVER, json={"txHash": "0x1"})
+    requests_mock.post(AVALANCHE_SERVER, status_code=500)
+
+    assert register(["numbers", "avalanche"]) == {"numbers": {"txHash": "0x1"}}
+
+
+def test_register_invalid_json_chain_is_omitted(requests_mock):
+    requests_mock.post(NUMBERS_SERVER, json={"txHash": "0x1"})
+    requests_mock.post(AVALANCHE_SERVER, text="<html>Bad Gateway</html>")
+
+    assert register(["numbers", "avalanche"]) == {"numbers": {"txHash": "0x1"}}
+
+
+def test_register_timed_out_chain_is_omitted(requests_mock, monkeypatch):
+    monkeypatch.setattr(numbers, "RESPONSE_CHUNK_SIZE", 1)
+
+    class SlowBody(io.BytesIO):
+        def read(self, size=-1):
+            time.sleep(0.1)
+            return super().read(1)
+
+    requests_mock.post(NUMBERS_SERVER, json={"txHash": "0x1"})
+    # The response is slow to read rather than to send, as the mock sends
+    # one request at a time
+    requests_mock.post(AVALANCHE_SERVER, body=SlowBody(b'{"txHash": "0x2"}'))
+
+    assert register(["numbers", "avalanche"], timeout=0.2) == {
+        "numbers": {"txHash": "0x1"}
+    }
+    # No registration is left running once register returns
+    assert not [
+        thread
+        for thread in threading.enumerate()
+        if thread.name.startswith("numbers_register")
+    ]
+
+
+def test_chain_rate_limited_past_deadline_is_omitted(requests_mock, monkeypatch):
+    requests_mock.post(NUMBERS_SERVER, json={"txHash": "0x1"})
+    waits = []
+
+    def acquire(upstream, timeout):
+        waits.append(timeout)
+        return False
+
+    monkeypatch.setattr(numbers.rate_limit, "acquire", acquire)
+
+    assert register(["numbers"], timeout=0.5) == {}
+    assert 0 < waits[0] <= 0.5
+    assert not requests_mock.called
+
+
+def test_rate_limit_wait_counts_toward_timeout(requests_mock, monkeypatch):
+    requests_mock.post(NUMBERS_SERVER, json={"txHash": "0x1"})
+
+    def acquire(upstream, timeout):
+        time.sleep(0.5)
+        return True
+
+    monkeypatch.setattr(numbers.rate_limit, "acquire", acquire)
+
+    assert register(["numbers"], timeout=2) == {"numbers": {"txHash": "0x1"}}
+    assert requests_mock.last_request.timeout <= 1.5
+
+
+def test_register_unknown_chain():
+    with pytest.raises(NotImplementedError):
+        register(["bitcoin"])
@@ -0,0 +1,142 @@
+from .context import pipeline
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+Stage = pipeline.Stage
+
+
+def test_stages_run_in_dependency_order():
+    order = []
+
+    def stage(name, value):
+        def run(**inputs):
+            order.append(name)
+            return {name: value + sum(inputs.values())}
+
+        return run
+
+    p = pipeline.Pipeline(
+        "test",
+        [
+            Stage("c", stage("c", 100), inputs=["a", "b"], outputs=["c"]),
+            Stage("b", stage("b", 10), inputs=["a"], outputs=["b"]),
+            Stage("a", stage("a", 1), inputs=["start"], outputs=["a"]),
+        ],
+    )
+
+    values = p.run({"start": 0})
+
+    assert values == {"start": 0, "a": 1, "b": 11, "c": 112}
+    assert order == ["a", "b", "c"]
+    assert set(p.timings) == {"a", "b", "c"}
+
+
+def test_independent_stages_overlap():
+    # Only passes if both stages are running at the same time
+    barrier = threading.Barrier(2, timeout=5)
+    p = pipeline.Pipeline(
+        "test",
+        [
+            Stage("a", lambda: {"a": barrier.wait()}, outputs=["a"]),
+            Stage("b", lambda: {"b": barrier.wait()}, outputs=["b"]),
+            Stage("c", lambda a, b: {"c": a + b}, inputs=["a", "b"], outputs=["c"]),
+        ],
+    )
+
+    assert p.run()["c"] == 1
+
+
+def test_failed_stage_stops_pipeline():
+    ran = []
+
+    def fail():
+        time.sleep(0.05)
+        raise RuntimeError("boom")
+
+    p = pipeline.Pipeline(
+        "test",
+        [
+            Stage("fail", fail, outputs=["a"]),
+            Stage("after", lambda a: ran.append(a) or {}, inputs=["a"]),
+        ],
+    )
+
+    with pytest.raises(RuntimeError, match="boom"):
+        p.run()
+    assert ran == []
+
+
+def test_missing_inputs_are_reported():
+    p = pipeline.Pipeline("test", [Stage("a", lambda x: {}, inputs=["x"])])
+
+    with pytest.raises(ValueError, match="missing \\['x'\\]"):
+        p.run()
+
+
+def test_stages_must_return_declared_outputs():
+    p = pipeline.Pipeline("test", [Stage("a", lambda: {"b": 1}, outputs=["a"])])
+
+    with pytest.raises(ValueError, match="expected \\['a'\\]"):
+        p.run()
+
+
+def test_outputs_have_a_single_producer():
+    with pytest.raises(ValueError, match="produced by both"):
+        pipeline.Pipeline(
+            "test",
+            [Stage("a", dict, outputs=["x"]), Stage("b", dict, outputs=["x"])],
+        )
+
+
+def test_run_async_awaits_coroutine_stages():
+    loop_threads = set()
+
+    async def fetch(start):
+        await asyncio.sleep(0.01)
+        loop_threads.add(threading.current_thread())
+        return {"fetched": start + 1}
+
+    def compute(fetched):
+        return {"computed": fetched * 10}
+
+    p = pipeline.Pipeline(
+        "test",
+        [
+            Stage("compute", compute, inputs=["fetched"], outputs=["computed"]),
+            Stage("fetch", fetch, inputs=["start"], outputs=["fetched"]),
+        ],
+    )
+
+    async def run():
+        values = await p.run_async({"start": 1})
+        return values, threading.current_thread()
+
+    values, loop_thread = asyncio.run(run())
+
+    assert values == {"start": 1, "fetched": 2, "computed": 20}
+    assert loop_threads == {loop_thread}
+    assert set(p.timings) == {"fetch", "compute"}
+
+
+def test_run_async_failed_stage_cancels_others():
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append("slow")
+            raise
+
+    def fail():
+        raise RuntimeError("boom")
+
+    p = pipeline.Pipeline("test", [Stage("slow", slow), Stage("fail", fail)])
+
+    with pytest.raises(RuntimeError, match="boom"):
+        asyncio.run(p.run_async())
+    assert cancelled == ["slow"]
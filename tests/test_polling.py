@@ -0,0 +1,123 @@
+from .context import fs_watcher
+from .context import polling
+from .test_fs_watcher import _handler, processed
+
+from watchdog.events import FileCreatedEvent, FileDeletedEvent, FileModifiedEvent
+from watchdog.observers.api import ObservedWatch
+import os
+import queue
+import time
+
+
+def _emitter(path, **kwargs):
+    events = queue.Queue()
+    emitter = polling.ScanningEmitter(events, ObservedWatch(str(path), True), **kwargs)
+    emitter.on_thread_start()
+    return emitter, events
+
+
+def _events(events):
+    found = []
+    while not events.empty():
+        event, _ = events.get()
+        found.append((type(event), os.path.basename(event.src_path)))
+    return found
+
+
+def _write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def test_files_created_modified_and_deleted(tmp_path):
+    _write(tmp_path / "old.zip", b"old")
+    (tmp_path / "sub").mkdir()
+    emitter, events = _emitter(tmp_path)
+    assert emitter._scan() is False
+    assert _events(events) == []
+
+    _write(tmp_path / "sub" / "new.zip", b"new")
+    assert emitter._scan() is True
+    assert _events(events) == [(FileCreatedEvent, "new.zip")]
+
+    _write(tmp_path / "old.zip", b"old and more")
+    (tmp_path / "sub" / "new.zip").unlink()
+    assert emitter._scan() is True
+    assert sorted(_events(events), key=str) == sorted(
+        [(FileModifiedEvent, "old.zip"), (FileDeletedEvent, "new.zip")], key=str
+    )
+    assert emitter._scan() is False
+
+
+def test_stats_per_poll_are_capped(tmp_path, monkeypatch):
+    for i in range(5):
+        _write(tmp_path / f"{i}.zip", b"x")
+    emitter, events = _emitter(tmp_path, max_stats=2)
+    for _ in range(3):
+        emitter._scan()
+    for i in range(5):
+        _write(tmp_path / f"{i}.zip", b"xx")
+
+    stats = []
+    stat = emitter._stat
+    monkeypatch.setattr(
+        emitter, "_stat", lambda path, emit: stats.append(path) or stat(path, emit)
+    )
+    modified = []
+    for _ in range(6):
+        stats.clear()
+        emitter._scan()
+        assert len(stats) <= 2
+        modified += _events(events)
+    assert sorted(modified) == [(FileModifiedEvent, f"{i}.zip") for i in range(5)]
+
+
+def test_unchanged_directories_are_not_listed_again(tmp_path, monkeypatch):
+    _write(tmp_path / "a.zip", b"a")
+    past = time.time() - 60
+    os.utime(tmp_path, (past, past))
+    emitter, events = _emitter(tmp_path)
+
+    listed = []
+    scandir = os.scandir
+    monkeypatch.setattr(
+        os, "scandir", lambda path: listed.append(path) or scandir(path)
+    )
+    emitter._scan()
+    assert listed == []
+
+    _write(tmp_path / "b.zip", b"b")
+    emitter._scan()
+    assert listed == [str(tmp_path)]
+    assert _events(events) == [(FileCreatedEvent, "b.zip")]
+
+
+def test_interval_adapts_to_activity(tmp_path):
+    emitter, events = _emitter(tmp_path, min_interval=0.001, max_interval=0.004)
+    for _ in range(4):
+        emitter.queue_events(None)
+    assert emitter.interval == 0.004
+
+    _write(tmp_path / "a.zip", b"a")
+    emitter.queue_events(None)
+    assert emitter.interval == 0.001
+
+
+def test_polling_observer_processes_new_files(processed, tmp_path):
+    observer = polling.AdaptivePollingObserver(min_interval=0.05, max_interval=0.2)
+    handler = _handler(settle_seconds=0.2)
+    assert not fs_watcher._emits_close_events(observer)
+    observer.schedule(handler, str(tmp_path), recursive=True)
+    observer.start()
+    try:
+        time.sleep(0.1)
+        zip_path = str(tmp_path / "a.zip")
+        _write(zip_path, b"x" * 1024)
+        deadline = time.monotonic() + 5
+        while not processed and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        observer.stop()
+        observer.join()
+
+    assert processed == [(zip_path, ["archive"])]
@@ -0,0 +1,276 @@
+from .conftest import COLLECTION_ID, ORG_ID
+from .context import bloom
+from .context import config
+from .context import file_util
+from .context import fs_watcher
+from .context import processed_index
+from .stand_ins import make_input_bundle
+
+from contextlib import closing
+import json
+import os
+import time
+
+import pytest
+
+ACTIONS = ["archive", "copy-proofmode"]
+
+
+def _touch_input(directory, name):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.zip")
+    open(path, "w").close()
+    return path
+
+
+def test_index_uses_rollback_journal(tmp_path):
+    index = processed_index.ProcessedIndex(str(tmp_path / "processed.db"))
+
+    with closing(index._connect()) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone() == ("delete",)
+
+
+def test_index_records_completed_actions(tmp_path):
+    index = processed_index.ProcessedIndex(str(tmp_path / "processed.db"))
+
+    index.mark_completed("a" * 64, ["archive"])
+    index.mark_completed("a" * 64, ["archive", "copy-proofmode"])
+    index.mark_completed("b" * 64, ["archive"])
+
+    assert index.completed_actions("a" * 64) == {"archive", "copy-proofmode"}
+    assert index.all_completed() == {
+        "a" * 64: {"archive", "copy-proofmode"},
+        "b" * 64: {"archive"},
+    }
+
+
+def test_new_index_is_seeded_from_hash_lists(tmp_path):
+    input_dir = str(tmp_path / "input")
+    hash_list_dir = str(tmp_path / "output")
+    _touch_input(input_dir, "a" * 64)
+    _touch_input(input_dir, "b" * 64)
+    os.makedirs(hash_list_dir)
+    open(os.path.join(hash_list_dir, "a" * 64 + ".json"), "w").close()
+    index = processed_index.ProcessedIndex(str(tmp_path / "processed.db"))
+
+    assert processed_index.seed(input_dir, index, hash_list_dir) == 1
+
+    assert index.all_completed() == {"a" * 64: {"archive"}}
+    assert sorted(processed_index.missing_work(input_dir, index, ACTIONS)) == [
+        (os.path.join(input_dir, "a" * 64 + ".zip"), ["copy-proofmode"]),
+        (os.path.join(input_dir, "b" * 64 + ".zip"), ACTIONS),
+    ]
+    # The index isn't new when it is opened again
+    index = processed_index.ProcessedIndex(str(tmp_path / "processed.db"))
+    assert not index.is_new
+    assert processed_index.seed(input_dir, index, hash_list_dir) == 0
+
+
+def test_watcher_seeds_indexes_before_watching(org_env, monkeypatch):
+    input_sha = "a" * 64
+    _touch_input(org_env.path_for_input(COLLECTION_ID), input_sha)
+    hash_list_dir = org_env.path_for_action_output(COLLECTION_ID, "archive")
+    open(os.path.join(hash_list_dir, f"{input_sha}.json"), "w").close()
+    watcher = fs_watcher.FsWatcher(
+        config.ORGANIZATION_CONFIG.get(ORG_ID), COLLECTION_ID
+    )
+    index_path = org_env.path_for_processed_index(COLLECTION_ID)
+
+    def start():
+        index = processed_index.ProcessedIndex(index_path)
+        assert index.completed_actions(input_sha) == {"archive"}
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(watcher, "start_dispatcher", lambda: None)
+    monkeypatch.setattr(watcher.observer, "start", start)
+    with pytest.raises(KeyboardInterrupt):
+        watcher.watch()
+
+
+def test_missing_work_lists_only_actions_not_completed(tmp_path):
+    input_dir = str(tmp_path / "input")
+    os.makedirs(input_dir)
+    index = processed_index.ProcessedIndex(str(tmp_path / "processed.db"))
+
+    _touch_input(input_dir, "a" * 64)
+    partial = _touch_input(input_dir, "b" * 64)
+    nested = _touch_input(os.path.join(input_dir, "sub"), "c" * 64)
+    open(os.path.join(input_dir, "d" * 64 + ".tmp"), "w").close()
+    index.mark_completed("a" * 64, ACTIONS)
+    index.mark_completed("b" * 64, ["archive"])
+
+    missing = processed_index.missing_work(input_dir, index, ACTIONS)
+
+    assert sorted(missing) == [(partial, ["copy-proofmode"]), (nested, ACTIONS)]
+
+
+def test_process_input_records_completed_actions(org_env, tmp_path, monkeypatch):
+    zip_path = make_input_bundle(str(tmp_path), b"content")
+    monkeypatch.setattr(
+        fs_watcher,
+        "run_action",
+        lambda action, *args: action == "archive",
+    )
+
+    fs_watcher.process_input(zip_path, {"id": ORG_ID}, COLLECTION_ID, ACTIONS)
+
+    index = processed_index.ProcessedIndex(
+        org_env.path_for_processed_index(COLLECTION_ID)
+    )
+    input_sha = os.path.splitext(os.path.basename(zip_path))[0]
+    assert index.completed_actions(input_sha) == {"archive"}
+
+
+def test_process_input_records_only_actions_that_complete(
+    org_env, tmp_path, monkeypatch
+):
+    zip_path = make_input_bundle(str(tmp_path), b"content")
+    monkeypatch.setattr(fs_watcher._actions, "archive", lambda *args: {})
+
+    def fail(*args):
+        raise Exception("c2patool failed")
+
+    monkeypatch.setattr(fs_watcher._actions, "copy_proofmode", fail)
+
+    fs_watcher.process_input(zip_path, {"id": ORG_ID}, COLLECTION_ID, ACTIONS)
+
+    index = processed_index.open_index(org_env.path_for_processed_index(COLLECTION_ID))
+    input_sha = os.path.splitext(os.path.basename(zip_path))[0]
+    assert index.completed_actions(input_sha) == {"archive"}
+
+
+def test_bloom_filter_has_no_false_negatives():
+    keys = [f"{i:064x}" for i in range(2000)]
+    bloom_filter = bloom.BloomFilter(1000)
+    for key in keys[:1000]:
+        bloom_filter.add(key)
+
+    assert all(key in bloom_filter for key in keys[:1000])
+    false_positives = sum(key in bloom_filter for key in keys[1000:])
+    assert false_positives < 10
+
+
+def test_lookups_see_inputs_added_by_other_index_instances(tmp_path, monkeypatch):
+    monkeypatch.setattr(processed_index, "BLOOM_REFRESH_INTERVAL", 0.1)
+    db_path = str(tmp_path / "processed.db")
+    index = processed_index.ProcessedIndex(db_path)
+    assert index.completed_actions("a" * 64) == set()
+
+    # Like another process adding to the same database
+    processed_index.ProcessedIndex(db_path).mark_completed("a" * 64, ["archive"])
+
+    assert index.completed_actions("a" * 64, use_filter=False) == {"archive"}
+    time.sleep(0.1)
+    assert index.completed_actions("a" * 64) == {"archive"}
+
+
+def test_negative_lookups_skip_the_database(tmp_path, monkeypatch):
+    index = processed_index.ProcessedIndex(str(tmp_path / "processed.db"))
+    index.mark_many(["a" * 64, "b" * 64], ["archive"])
+    index.mark_completed("a" * 64, ["archive", "copy-proofmode"])
+    assert index.completed_actions("a" * 64) == {"archive", "copy-proofmode"}
+    # Rows updated in place aren't counted again
+    assert index._bloom.count == 2
+
+    def connect():
+        raise AssertionError("database queried")
+
+    monkeypatch.setattr(index, "_connect", connect)
+    assert index.completed_actions("c" * 64) == set()
+    assert index.completed_many(["c" * 64, "d" * 64]) == {}
+
+
+def test_completed_many_looks_up_inputs_together(tmp_path, monkeypatch):
+    monkeypatch.setattr(processed_index, "LOOKUP_BATCH_SIZE", 2)
+    index = processed_index.ProcessedIndex(str(tmp_path / "processed.db"))
+    index.mark_many(["a", "b", "c"], ["archive"])
+    index.mark_completed("b", ["copy-proofmode"])
+
+    assert index.completed_many(["a", "b", "c", "d"]) == {
+        "a": {"archive"},
+        "b": {"archive", "copy-proofmode"},
+        "c": {"archive"},
+    }
+    assert index.completed_many([]) == {}
+
+
+def test_claim_content_returns_first_input(tmp_path):
+    index = processed_index.ProcessedIndex(str(tmp_path / "processed.db"))
+
+    assert index.claim_content("c" * 64, "a" * 64) == "a" * 64
+    assert index.claim_content("c" * 64, "b" * 64) == "a" * 64
+    assert index.claim_content("c" * 64, "a" * 64) == "a" * 64
+
+
+def test_duplicate_content_links_existing_hash_list(org_env, tmp_path, monkeypatch):
+    first = make_input_bundle(str(tmp_path), b"content")
+    duplicate = make_input_bundle(str(tmp_path), b"content", meta_recorder=b"[]")
+    assert first != duplicate
+
+    fs_watcher.process_input(first, {"id": ORG_ID}, COLLECTION_ID, ["archive"])
+    archived = os.listdir(org_env.path_for_action(COLLECTION_ID, "archive"))
+    fs_watcher.process_input(duplicate, {"id": ORG_ID}, COLLECTION_ID, ["archive"])
+
+    # Nothing was archived again
+    assert os.listdir(org_env.path_for_action(COLLECTION_ID, "archive")) == archived
+    output_dir = org_env.path_for_action_output(COLLECTION_ID, "archive")
+    first_sha, duplicate_sha = (
+        os.path.splitext(os.path.basename(path))[0] for path in (first, duplicate)
+    )
+    linked = os.path.join(output_dir, f"{duplicate_sha}.json")
+    with open(linked) as f:
+        assert json.load(f)["inputBundle"]["sha256"] == first_sha
+    index = processed_index.open_index(org_env.path_for_processed_index(COLLECTION_ID))
+    assert index.completed_actions(duplicate_sha) == {"archive"}
+
+    # Receipt updates through the link go to the original hash list
+    file_util.FileUtil.update_json(linked, lambda receipt: {**receipt, "x": 1})
+    assert os.path.islink(linked)
+    with open(os.path.join(output_dir, f"{first_sha}.json")) as f:
+        assert json.load(f)["x"] == 1
+
+
+def test_duplicate_content_runs_other_actions(org_env, tmp_path, monkeypatch):
+    first = make_input_bundle(str(tmp_path), b"content")
+    duplicate = make_input_bundle(str(tmp_path), b"content", meta_recorder=b"[]")
+    fs_watcher.process_input(first, {"id": ORG_ID}, COLLECTION_ID, ["archive"])
+    ran = []
+    monkeypatch.setattr(
+        fs_watcher._actions,
+        "copy_proofmode",
+        lambda zip_path, *args: ran.append(zip_path),
+    )
+
+    fs_watcher.process_input(duplicate, {"id": ORG_ID}, COLLECTION_ID, ACTIONS)
+
+    assert ran == [duplicate]
+    index = processed_index.open_index(org_env.path_for_processed_index(COLLECTION_ID))
+    duplicate_sha = os.path.splitext(os.path.basename(duplicate))[0]
+    assert index.completed_actions(duplicate_sha) == set(ACTIONS)
+
+
+def test_duplicate_content_is_archived_when_original_archive_failed(
+    org_env, tmp_path, monkeypatch
+):
+    first = make_input_bundle(str(tmp_path), b"content")
+    duplicate = make_input_bundle(str(tmp_path), b"content", meta_recorder=b"[]")
+    archive = fs_watcher._actions.archive
+
+    def fail(*args):
+        raise Exception("archive failed")
+
+    monkeypatch.setattr(fs_watcher._actions, "archive", fail)
+    fs_watcher.process_input(first, {"id": ORG_ID}, COLLECTION_ID, ["archive"])
+    monkeypatch.setattr(fs_watcher._actions, "archive", archive)
+    fs_watcher.process_input(duplicate, {"id": ORG_ID}, COLLECTION_ID, ["archive"])
+
+    output_dir = org_env.path_for_action_output(COLLECTION_ID, "archive")
+    duplicate_sha = os.path.splitext(os.path.basename(duplicate))[0]
+    hash_list = os.path.join(output_dir, f"{duplicate_sha}.json")
+    assert not os.path.islink(hash_list)
+    with open(hash_list) as f:
+        assert json.load(f)["inputBundle"]["sha256"] == duplicate_sha
+    index = processed_index.open_index(org_env.path_for_processed_index(COLLECTION_ID))
+    first_sha = os.path.splitext(os.path.basename(first))[0]
+    assert index.completed_actions(first_sha) == set()
+    assert index.completed_actions(duplicate_sha) == {"archive"}
@@ -0,0 +1,65 @@
+from .context import rate_limit
+
+import time
+
+import pytest
+
+
+def test_burst_then_rate():
+    bucket = rate_limit.TokenBucket(rate=20, burst=3)
+
+    start = time.monotonic()
+    for _ in range(3):
+        assert bucket.acquire()
+    assert time.monotonic() - start < 0.05
+
+    assert bucket.acquire()
+    assert time.monotonic() - start >= 0.04
+
+
+def test_acquire_timeout():
+    bucket = rate_limit.TokenBucket(rate=0.1, burst=1)
+    assert bucket.acquire(timeout=0)
+    assert not bucket.acquire(timeout=0.1)
+
+
+def test_configure_overrides_defaults():
+    rate_limit.configure({"iscn": {"rate": 7, "burst": 2}})
+    assert rate_limit.bucket("iscn").rate == 7
+    assert rate_limit.bucket("near").rate == rate_limit.DEFAULT_LIMITS["near"]["rate"]
+
+
+def test_shared_limiter_is_used_instead_of_own_buckets():
+    shared = rate_limit.RateLimiter({"iscn": {"rate": 0.1, "burst": 1}})
+    rate_limit.use(shared)
+    try:
+        assert rate_limit.acquire("iscn", 0)
+        assert not rate_limit.acquire("iscn", 0)
+    finally:
+        rate_limit.use(None)
+    # This process's unthrottled buckets weren't used
+    assert rate_limit.acquire("iscn", 0)
+
+
+def test_unknown_upstream():
+    with pytest.raises(ValueError):
+        rate_limit.acquire("bitcoin")
+
+
+def test_strictest_limits_of_all_organizations():
+    limits = rate_limit.strictest_limits(
+        {
+            "organizations": [
+                {"id": "a", "rate_limits": {"iscn": {"rate": 0.5, "burst": 1}}},
+                {"id": "b"},
+                {
+                    "id": "c",
+                    "rate_limits": {
+                        "iscn": {"rate": 0.2, "burst": 3},
+                        "near": {"rate": 1},
+                    },
+                },
+            ]
+        }
+    )
+    assert limits == {"iscn": {"rate": 0.2, "burst": 1}, "near": {"rate": 1}}
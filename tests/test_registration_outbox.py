@@ -0,0 +1,141 @@
+from .context import leases, registration_outbox
+
+from contextlib import closing
+import json
+
+import pytest
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    return registration_outbox.RegistrationOutbox(str(tmp_path / "outbox.db"))
+
+
+@pytest.fixture
+def hash_list_path(tmp_path):
+    path = tmp_path / "input.json"
+    path.write_text(json.dumps({"inputBundle": {}, "registrationRecords": {}}))
+    return str(path)
+
+
+def test_outbox_uses_rollback_journal(outbox):
+    with closing(outbox._connect()) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone() == ("delete",)
+
+
+def test_iscn_receipt_is_recorded(outbox, hash_list_path, mocker):
+    register = mocker.patch.object(
+        registration_outbox.Iscn, "register_archive", return_value={"txHash": "A"}
+    )
+    outbox.enqueue(registration_outbox.ISCN, hash_list_path, {"name": "n"})
+
+    assert registration_outbox.RegistrationDispatcher(outbox).run_once() == 1
+
+    register.assert_called_once_with(name="n")
+    with open(hash_list_path) as f:
+        assert json.load(f)["registrationRecords"] == {"iscn": {"txHash": "A"}}
+    assert outbox.counts() == {"done": 1}
+
+
+def test_failed_registration_is_retried_later(outbox, hash_list_path, mocker):
+    mocker.patch.object(registration_outbox.Iscn, "register_archive", return_value=None)
+    outbox.enqueue(registration_outbox.ISCN, hash_list_path, {})
+
+    dispatcher = registration_outbox.RegistrationDispatcher(outbox)
+    assert dispatcher.run_once() == 1
+    # Backoff keeps the job from being due immediately
+    assert dispatcher.run_once() == 0
+    assert outbox.counts() == {"pending": 1}
+
+
+def test_numbers_retries_only_failed_chains(
+    outbox, hash_list_path, mocker, monkeypatch
+):
+    monkeypatch.setattr(registration_outbox, "RETRY_BASE_DELAY", 0)
+    register = mocker.patch.object(
+        registration_outbox.Numbers,
+        "register_archive",
+        side_effect=[{"numbers": {"txHash": "N"}}, {"avalanche": {"txHash": "A"}}],
+    )
+    outbox.enqueue(
+        registration_outbox.NUMBERS,
+        hash_list_path,
+        {"chains": ["numbers", "avalanche"]},
+    )
+    dispatcher = registration_outbox.RegistrationDispatcher(outbox)
+
+    dispatcher.run_once()
+    with open(hash_list_path) as f:
+        records = json.load(f)["registrationRecords"]
+    assert records == {"numbersProtocol": {"numbers": {"txHash": "N"}}}
+
+    dispatcher.run_once()
+    assert register.call_args.kwargs == {"chains": ["avalanche"]}
+    with open(hash_list_path) as f:
+        records = json.load(f)["registrationRecords"]
+    assert records == {
+        "numbersProtocol": {
+            "numbers": {"txHash": "N"},
+            "avalanche": {"txHash": "A"},
+        }
+    }
+    assert outbox.counts() == {"done": 1}
+
+
+def test_unrecorded_receipt_is_written_without_registering_again(
+    outbox, hash_list_path, mocker, monkeypatch
+):
+    monkeypatch.setattr(registration_outbox, "RETRY_BASE_DELAY", 0)
+    register = mocker.patch.object(
+        registration_outbox.Iscn, "register_archive", return_value={"txHash": "A"}
+    )
+    update_json = registration_outbox.FileUtil.update_json
+    mocker.patch.object(
+        registration_outbox.FileUtil, "update_json", side_effect=OSError("disk full")
+    )
+    outbox.enqueue(registration_outbox.ISCN, hash_list_path, {"name": "n"})
+    dispatcher = registration_outbox.RegistrationDispatcher(outbox)
+
+    dispatcher.run_once()
+    assert outbox.counts() == {"pending": 1}
+    registration_outbox.FileUtil.update_json.side_effect = update_json
+    dispatcher.run_once()
+
+    register.assert_called_once_with(name="n")
+    with open(hash_list_path) as f:
+        assert json.load(f)["registrationRecords"] == {"iscn": {"txHash": "A"}}
+    assert outbox.counts() == {"done": 1}
+
+
+def test_enqueue_with_dedup_key_adds_job_once(outbox):
+    first = outbox.enqueue(registration_outbox.ISCN, "a.json", {}, dedup_key="iscn:x")
+    again = outbox.enqueue(registration_outbox.ISCN, "a.json", {}, dedup_key="iscn:x")
+    other = outbox.enqueue(registration_outbox.ISCN, "a.json", {})
+
+    assert again == first
+    assert other != first
+    assert outbox.counts() == {"pending": 2}
+
+
+def test_jobs_leased_by_another_node_are_skipped(
+    outbox, hash_list_path, tmp_path, mocker
+):
+    register = mocker.patch.object(
+        registration_outbox.Iscn, "register_archive", return_value={"txHash": "A"}
+    )
+    job_id = outbox.enqueue(registration_outbox.ISCN, hash_list_path, {})
+    db_path = str(tmp_path / "leases.db")
+    dispatcher = registration_outbox.RegistrationDispatcher(
+        outbox, leases=leases.LeaseStore(db_path, "this-node")
+    )
+
+    with leases.LeaseStore(db_path, "other-node").acquire(f"registration/{job_id}"):
+        dispatcher.run_once()
+        register.assert_not_called()
+        # The other node completes the job before releasing its lease
+        outbox.complete(job_id)
+    assert outbox.due_job(job_id) is None
+
+    dispatcher.run_once()
+    register.assert_not_called()
+    assert outbox.counts() == {"done": 1}
@@ -0,0 +1,121 @@
+from .context import scheduler
+
+import threading
+import time
+
+import pytest
+
+
+def _waiting(sched) -> int:
+    return sum(n for orgs in sched.stats()["waiting"].values() for n in orgs.values())
+
+
+def _grant_order(sched, requests):
+    """Queues jobs behind one held slot and returns the order they're granted in.
+
+    Args:
+        sched: a scheduler with max_running 1
+        requests: list of (org, job class), queued in this order
+    """
+    sched.acquire("holder", scheduler.MAINTENANCE)
+    order = []
+    granted = threading.Semaphore(0)
+
+    def job(org_id, job_class):
+        sched.acquire(org_id, job_class)
+        order.append((org_id, job_class))
+        granted.release()
+
+    for i, request in enumerate(requests):
+        threading.Thread(target=job, args=request, daemon=True).start()
+        while _waiting(sched) <= i:
+            time.sleep(0.001)
+
+    sched.release("holder", scheduler.MAINTENANCE)
+    for org_id, job_class in requests:
+        assert granted.acquire(timeout=5)
+        sched.release(*order[-1])
+    return order
+
+
+def test_orgs_share_by_weight():
+    sched = scheduler.FairScheduler(1, orgs={"a": {"weight": 3}})
+    order = _grant_order(
+        sched, [("a", scheduler.LIVE)] * 8 + [("b", scheduler.LIVE)] * 8
+    )
+
+    # b isn't starved by a's backlog, but a gets three times b's share
+    first = [org_id for org_id, _ in order[:8]]
+    assert first.count("a") == 6
+    assert first.count("b") == 2
+
+
+def test_live_jobs_come_before_backfill():
+    sched = scheduler.FairScheduler(1)
+    order = _grant_order(
+        sched, [("a", scheduler.BACKFILL)] * 10 + [("a", scheduler.LIVE)] * 10
+    )
+
+    first = [job_class for _, job_class in order[:10]]
+    assert 7 <= first.count(scheduler.LIVE) <= 9
+    assert scheduler.BACKFILL in first
+
+
+def test_caps():
+    sched = scheduler.FairScheduler(
+        4,
+        classes={scheduler.BACKFILL: {"max_running": 1}},
+        orgs={"a": {"max_running": 2}},
+    )
+    assert sched.acquire("a")
+    assert sched.acquire("a")
+    assert not sched.acquire("a", timeout=0.05)
+
+    assert sched.acquire("b", scheduler.BACKFILL)
+    assert not sched.acquire("b", scheduler.BACKFILL, timeout=0.05)
+    assert sched.acquire("b")
+    assert not sched.acquire("c", timeout=0.05)
+
+    sched.release("a")
+    assert sched.acquire("c")
+    stats = sched.stats()
+    assert stats["running"] == 4
+    assert stats["runningByOrg"] == {"a": 1, "b": 2, "c": 1}
+    assert stats["waiting"] == {}
+
+
+def test_from_config():
+    sched = scheduler.FairScheduler.from_config(
+        {
+            "scheduler": {
+                "max_running": 3,
+                "classes": {scheduler.BACKFILL: {"max_running": 1}},
+            },
+            "organizations": [
+                {"id": "a", "scheduling": {"weight": 2}},
+                {"id": "b"},
+            ],
+        }
+    )
+    assert sched.max_running == 3
+    assert sched.classes[scheduler.BACKFILL] == {"weight": 2, "max_running": 1}
+    assert sched.orgs == {"a": {"weight": 2}}
+
+
+def test_unknown_job_class():
+    with pytest.raises(ValueError):
+        scheduler.FairScheduler(1).acquire("a", "urgent")
+
+
+def test_slot():
+    with scheduler.slot("a"):
+        pass
+
+    sched = scheduler.FairScheduler(1)
+    scheduler.use(sched)
+    try:
+        with scheduler.slot("a", scheduler.BACKFILL):
+            assert sched.stats()["runningByClass"] == {scheduler.BACKFILL: 1}
+        assert sched.stats()["running"] == 0
+    finally:
+        scheduler.use(None)
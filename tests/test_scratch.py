@@ -0,0 +1,126 @@
+from .context import asset_helper, config, scratch
+
+import os
+import threading
+
+import pytest
+
+GB = 1024**3
+
+
+def _space(tmp_path, monkeypatch, free):
+    space = scratch.ScratchSpace(str(tmp_path), min_free_bytes=GB)
+    monkeypatch.setattr(space, "free_bytes", lambda where=scratch.SCRATCH: free)
+    return space
+
+
+def test_estimate(tmp_path):
+    zip_path = tmp_path / "input.zip"
+    zip_path.write_bytes(b"x" * 100)
+    assert scratch.estimate(str(zip_path), ["archive"]) == {
+        scratch.SCRATCH: 200,
+        scratch.STORE: 200,
+    }
+    assert scratch.estimate(str(zip_path), ["archive", "copy-proofmode"]) == {
+        scratch.SCRATCH: 400,
+        scratch.STORE: 200,
+    }
+
+
+def test_jobs_wait_for_room(tmp_path, monkeypatch):
+    space = _space(tmp_path, monkeypatch, 11 * GB)
+    first = space.reserve(6 * GB)
+    assert space.available() == 4 * GB
+    assert space.reserve(5 * GB, timeout=0.05) is None
+
+    reserved = []
+    waiter = threading.Thread(target=lambda: reserved.append(space.reserve(5 * GB)))
+    waiter.start()
+    waiter.join(0.1)
+    assert reserved == []
+
+    space.release(first)
+    waiter.join(5)
+    assert len(reserved) == 1
+    assert space.reserved_bytes() == 5 * GB
+
+
+def test_oversized_job_runs_alone(tmp_path, monkeypatch):
+    space = _space(tmp_path, monkeypatch, 2 * GB)
+    reservation = space.reserve(5 * GB, timeout=0)
+    assert reservation is not None
+    assert space.reserve(1, timeout=0) is None
+    space.release(reservation)
+
+
+def test_store_space_is_reserved_on_its_own_file_system(tmp_path, monkeypatch):
+    space = scratch.ScratchSpace(str(tmp_path), GB, str(tmp_path))
+    assert space.same_file_system
+    space.same_file_system = False
+    free = {scratch.SCRATCH: 11 * GB, scratch.STORE: 4 * GB}
+    monkeypatch.setattr(space, "free_bytes", lambda where: free[where])
+
+    first = space.reserve({scratch.SCRATCH: GB, scratch.STORE: 2 * GB})
+    assert space.available(scratch.SCRATCH) == 9 * GB
+    assert space.available(scratch.STORE) == GB
+    # Plenty of scratch space, but not enough room in the store
+    assert space.reserve({scratch.SCRATCH: GB, scratch.STORE: 2 * GB}, 0) is None
+    assert space.reserve(5 * GB, timeout=0) is not None
+
+    space.release(first)
+    assert space.reserve({scratch.SCRATCH: GB, scratch.STORE: 2 * GB}, 0) is not None
+
+
+def test_store_space_is_scratch_space_on_one_file_system(tmp_path, monkeypatch):
+    space = _space(tmp_path, monkeypatch, 11 * GB)
+    space.reserve({scratch.SCRATCH: GB, scratch.STORE: 2 * GB})
+    assert space.reserved_bytes() == 3 * GB
+    assert space.available(scratch.STORE) == 7 * GB
+
+
+def test_from_config_creates_scratch_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "INTERNAL_ASSET_STORE", str(tmp_path / "internal"))
+    monkeypatch.setattr(config, "SCRATCH_DIR", str(tmp_path / "scratch"))
+
+    space = scratch.ScratchSpace.from_config({})
+
+    assert os.path.isdir(tmp_path / "scratch")
+    assert space.paths == {
+        scratch.SCRATCH: str(tmp_path / "scratch"),
+        scratch.STORE: str(tmp_path / "internal"),
+    }
+    assert space.same_file_system
+
+
+def test_from_config_reports_scratch_dir_that_cant_be_made(tmp_path, monkeypatch):
+    (tmp_path / "file").write_text("")
+    monkeypatch.setattr(config, "INTERNAL_ASSET_STORE", str(tmp_path / "internal"))
+    monkeypatch.setattr(config, "SCRATCH_DIR", str(tmp_path / "file" / "scratch"))
+
+    with pytest.raises(ValueError, match="SCRATCH_DIR"):
+        scratch.ScratchSpace.from_config({})
+
+
+def test_free_bytes_of_real_file_system(tmp_path):
+    stat = os.statvfs(tmp_path)
+    assert scratch.ScratchSpace(str(tmp_path)).free_bytes() > 0
+    assert stat.f_frsize > 0
+
+
+def test_reservation_without_scratch_space():
+    with scratch.reservation(10 * GB):
+        pass
+
+
+def test_scratch_dir_holds_tmp_dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "INTERNAL_ASSET_STORE", str(tmp_path / "internal"))
+    monkeypatch.setattr(config, "SCRATCH_DIR", str(tmp_path / "scratch"))
+    helper = asset_helper.AssetHelper("org")
+
+    assert helper.path_for_ingest("coll").startswith(str(tmp_path / "scratch" / "org"))
+    assert helper.path_for_action_tmp("coll", "archive").startswith(
+        str(tmp_path / "scratch" / "org")
+    )
+    assert helper.path_for_processed_index("coll").startswith(
+        str(tmp_path / "internal")
+    )
@@ -0,0 +1,141 @@
+from .conftest import COLLECTION_ID, ORG_ID
+from .context import fs_watcher
+from .context import ingest
+from .context import upload_hasher
+from .stand_ins import make_input_bundle
+
+from watchdog.events import FileClosedEvent, FileModifiedEvent
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+
+def _wait_for_offset(hasher, path, offset):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        progress = hasher._files.get(path)
+        if progress is not None and progress.offset == offset:
+            return
+        time.sleep(0.01)
+    raise AssertionError(f"{path} wasn't hashed up to {offset}")
+
+
+def test_appended_bytes_are_hashed_as_they_land(tmp_path):
+    hasher = upload_hasher.UploadHasher("test")
+    path = str(tmp_path / "upload.zip")
+    data = os.urandom(3 * upload_hasher.BUFFER_SIZE + 10)
+
+    with open(path, "wb") as f:
+        for i in range(0, len(data), upload_hasher.BUFFER_SIZE):
+            f.write(data[i : i + upload_hasher.BUFFER_SIZE])
+            f.flush()
+            hasher.update(path)
+            _wait_for_offset(
+                hasher, path, min(len(data), i + upload_hasher.BUFFER_SIZE)
+            )
+
+    digest = hasher.finish(path)
+    assert digest.sha256 == hashlib.sha256(data).hexdigest()
+    assert digest.matches(path)
+    assert hasher.finish(path) is None
+
+    with open(path, "ab") as f:
+        f.write(b"more")
+    assert not digest.matches(path)
+
+
+def test_rewritten_files_are_not_trusted(tmp_path):
+    hasher = upload_hasher.UploadHasher("test")
+    path = str(tmp_path / "upload.zip")
+    with open(path, "wb") as f:
+        f.write(b"a" * 100)
+    hasher.update(path)
+    _wait_for_offset(hasher, path, 100)
+
+    # Same size, written in place
+    time.sleep(0.01)
+    with open(path, "r+b") as f:
+        f.write(b"b" * 10)
+    assert hasher.finish(path) is None
+
+    hasher.update(path)
+    _wait_for_offset(hasher, path, 100)
+    with open(path, "wb") as f:
+        f.write(b"c" * 50)
+    assert hasher.finish(path) is None
+
+
+def test_files_finished_while_first_read_are_not_tracked(tmp_path, monkeypatch):
+    hasher = upload_hasher.UploadHasher("test")
+    path = str(tmp_path / "upload.zip")
+    with open(path, "wb") as f:
+        f.write(b"data")
+    progress_class = upload_hasher._Progress
+    made = threading.Event()
+
+    def finished_progress(stat):
+        # The upload is closed between the hasher's stat and its read
+        assert hasher.finish(path) is None
+        made.set()
+        return progress_class(stat)
+
+    monkeypatch.setattr(upload_hasher, "_Progress", finished_progress)
+    hasher.update(path)
+    assert made.wait(5)
+    deadline = time.monotonic() + 5
+    while path in hasher._files and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert path not in hasher._files
+
+
+def test_ingest_uses_upload_digest(tmp_path, monkeypatch):
+    zip_path = make_input_bundle(str(tmp_path), b"content")
+    hasher = upload_hasher.UploadHasher("test")
+    hasher.update(zip_path)
+    _wait_for_offset(hasher, zip_path, os.path.getsize(zip_path))
+    digest = hasher.finish(zip_path)
+    reads = []
+    digest_sha256 = ingest._file_util.digest_sha256
+    monkeypatch.setattr(
+        ingest._file_util,
+        "digest_sha256",
+        lambda path: reads.append(path) or digest_sha256(path),
+    )
+
+    ingested = ingest.Ingest.create(zip_path, str(tmp_path / "ingest"), digest)
+    ingested.cleanup()
+    assert reads == []
+
+    # A file changed since it was hashed is read again
+    os.utime(zip_path, ns=(0, 0))
+    ingested = ingest.Ingest.create(zip_path, str(tmp_path / "ingest"), digest)
+    ingested.cleanup()
+    assert reads == [zip_path]
+
+
+def test_handler_passes_upload_digest_to_job(org_env, tmp_path, monkeypatch):
+    jobs = []
+    monkeypatch.setattr(
+        fs_watcher, "process_input", lambda *args: jobs.append(args[-1])
+    )
+    handler = fs_watcher.CollectionHandler(patterns=["*.zip"]).with_config(
+        {"id": ORG_ID},
+        COLLECTION_ID,
+        ["archive"],
+        upload_hasher=upload_hasher.UploadHasher("test"),
+    )
+    zip_path = make_input_bundle(str(tmp_path), b"content")
+    path = str(tmp_path / "in" / os.path.basename(zip_path))
+    os.makedirs(os.path.dirname(path))
+    with open(zip_path, "rb") as src, open(path, "wb") as f:
+        shutil.copyfileobj(src, f)
+        f.flush()
+        handler.dispatch(FileModifiedEvent(path))
+    _wait_for_offset(handler.upload_hasher, path, os.path.getsize(path))
+    handler.dispatch(FileClosedEvent(path))
+
+    assert len(jobs) == 1
+    assert jobs[0].sha256 == os.path.splitext(os.path.basename(path))[0]
+    assert jobs[0].matches(path)
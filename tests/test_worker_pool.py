@@ -0,0 +1,88 @@
+from .context import worker_pool
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+
+import pytest
+
+
+def test_jobs_run_concurrently():
+    pool = worker_pool.WorkerPool("test", workers=3)
+    barrier = threading.Barrier(3, timeout=5)
+
+    # Only passes if all three jobs are running at the same time
+    futures = [pool.submit(barrier.wait) for _ in range(3)]
+
+    assert sorted(f.result() for f in futures) == [0, 1, 2]
+    pool.shutdown()
+    assert pool.depth == 0
+
+
+def test_submit_blocks_when_queue_is_full():
+    pool = worker_pool.WorkerPool("test", workers=1, max_queue=1)
+    release = threading.Event()
+    pool.submit(release.wait)
+    pool.submit(release.wait)
+
+    submitted = threading.Event()
+    threading.Thread(
+        target=lambda: (pool.submit(lambda: None), submitted.set())
+    ).start()
+    assert not submitted.wait(0.2)
+    assert pool.depth == 2
+
+    release.set()
+    assert submitted.wait(5)
+    pool.shutdown()
+
+
+def test_from_config():
+    pool = worker_pool.WorkerPool.from_config(
+        "test", {"workers": {"count": 5, "max_queue": 7}}
+    )
+    assert (pool.workers, pool.max_queue) == (5, 7)
+    pool.shutdown()
+
+    with pytest.raises(ValueError):
+        worker_pool.WorkerPool.from_config("test", {"workers": {"mode": "fibers"}})
+
+
+def _pid_after(seconds):
+    time.sleep(seconds)
+    return os.getpid()
+
+
+def _fail():
+    raise ValueError("job failed")
+
+
+def test_process_pool_runs_jobs_in_worker_processes():
+    pool = worker_pool.ProcessPool(2)
+    with ThreadPoolExecutor(2) as executor:
+        pids = list(executor.map(lambda _: pool.run(_pid_after, 0.2), range(2)))
+
+    # Both jobs ran at once in the pre-forked workers
+    assert len(set(pids)) == 2
+    assert os.getpid() not in pids
+    with pytest.raises(ValueError, match="job failed"):
+        pool.run(_fail)
+    pool.shutdown()
+
+
+def test_process_pool_shutdown_waits_for_running_jobs():
+    pool = worker_pool.ProcessPool(1)
+    job = threading.Thread(target=pool.run, args=(_pid_after, 0.3))
+    job.start()
+    time.sleep(0.1)
+
+    start = time.monotonic()
+    pool.shutdown()
+    assert time.monotonic() - start >= 0.1
+    job.join(5)
+    assert not job.is_alive()
+
+
+def test_run_job_without_process_pool():
+    assert worker_pool.run_job(os.getpid) == os.getpid()